@@ -17,8 +17,15 @@ from routers.configuration import configuration_router
 from routers.voice import voice_router
 from routers.voice_classifiers import classifier_router
 from routers.misc import misc_router
+from utilities.database import open_connections, close_connections
+from routers.chats.utilities.conversation import drain_scoring
+from utilities.anythingllm import close_anythingllm_session
+from routers.chats.utilities.sentiment import close_sentiment_session
+from routers.chats.utilities.jobs import start_job_workers, stop_job_workers
+from utilities.parsing import shutdown_parsers
 
 nltk.download('punkt')
+nltk.download('punkt_tab')
 
 app = FastAPI()
 
@@ -45,6 +52,20 @@ app.include_router(voice_router, prefix="/voice")
 app.include_router(classifier_router, prefix="/classifier")
 app.include_router(misc_router, prefix="/misc")
 
+@app.on_event("startup")
+async def startup():
+    await open_connections()
+    start_job_workers()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_job_workers()
+    shutdown_parsers()
+    await drain_scoring()
+    await close_sentiment_session()
+    await close_anythingllm_session()
+    await close_connections()
+
 app.mount("/", StaticFiles(directory="static", html = True), name="static")
 
 if __name__ == "__main__":
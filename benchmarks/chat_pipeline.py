@@ -0,0 +1,171 @@
+# Drives client_flow and client_graph end to end against local stand-ins and
+# writes latency, Mongo ops and event-loop blocking figures to JSON.
+#
+#   python -m benchmarks.chat_pipeline --mongo mongodb://localhost:27017 --sessions 20 --turns 5
+#
+# Needs the usual .env (prompts, languages), a throwaway mongod and, for the
+# default in-process Redis, `fakeredis` with `lupa` for the Lua scripts.
+import argparse, asyncio, json, os, statistics, time
+from datetime import datetime
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description = "Chat pipeline benchmark")
+    parser.add_argument('--mongo', default = 'mongodb://localhost:27017')
+    parser.add_argument('--real-redis', action = 'store_true', help = "use the Redis on localhost instead of fakeredis")
+    parser.add_argument('--scenarios', nargs = '+', default = ['plain', 'rag', 'graph'], choices = ['plain', 'rag', 'graph'])
+    parser.add_argument('--sessions', type = int, default = 20)
+    parser.add_argument('--turns', type = int, default = 5)
+    parser.add_argument('--concurrency', type = int, default = 10)
+    parser.add_argument('--llm-latency', type = float, default = 0.5)
+    parser.add_argument('--llm-tokens', type = int, default = 60)
+    parser.add_argument('--sentiment-latency', type = float, default = 0.05)
+    parser.add_argument('--documents', type = int, default = 200)
+    parser.add_argument('--output', default = None)
+    parser.add_argument('--keep', action = 'store_true', help = "keep the benchmark databases")
+
+    return parser.parse_args()
+
+def percentiles(values):
+    if len(values) < 2:
+        value = round(values[0], 2) if values else None
+        return {'p50': value, 'p95': value, 'p99': value, 'mean': value}
+
+    cuts = statistics.quantiles(values, n = 100, method = 'inclusive')
+
+    return {'p50': round(cuts[49], 2), 'p95': round(cuts[94], 2), 'p99': round(cuts[98], 2), 'mean': round(statistics.mean(values), 2)}
+
+def bench_records(scenario, args):
+    company_id, bot_id, workspace_id = 'bench', f"bench-{scenario}", '1'
+
+    bots_record = {'company_id': company_id, 'bot_id': bot_id, 'bot_name': f"bench{scenario}", 'timeout': 30, 'is_active': 1}
+
+    workspace_record = {
+        'company_id': company_id, 'bot_id': bot_id, 'workspace_id': workspace_id, 'workspace_name': scenario,
+        'llm': 'openai', 'model': 'bench', 'llm_api_key': 'bench', 'llm_url': None, 'llm_temperature': '0',
+        'embeddings': 'openai', 'embeddings_model': 'bench', 'embeddings_api_key': None, 'embeddings_url': None,
+        'vectordb': 'faiss', 'vector_db_url': None, 'vector_db_api_key': None, 'k_retreive': 4,
+        'system_prompt': "You are a helpful assistant.", 'chat_limit': 10, 'sessions_limit': args.sessions * 10, 'is_active': 1
+    }
+
+    configuration_record = {
+        'company_id': company_id, 'bot_id': bot_id, 'workspace_id': workspace_id, 'summary': 0, 'suggestion': 0,
+        'auto_assignment': 0, 'client_query': 1, 'bot_response': 1, 'agent': 0, 'conversation': 1, 'is_active': 1
+    }
+
+    embeddings_record = {'bot_id': bot_id, 'workspace_id': workspace_id} if scenario == 'rag' else None
+
+    return bots_record, workspace_record, embeddings_record, configuration_record
+
+async def run_scenario(scenario, args, counter, blocking):
+    from decouple import config
+    from routers.chats.utilities.client import client_flow
+    from routers.chats.utilities.graph import client_graph
+    from routers.chats.utilities.profile import create
+    from routers.chats.utilities.conversation import drain_scoring
+
+    bots_record, workspace_record, embeddings_record, configuration_record = bench_records(scenario, args)
+    flow = client_graph if scenario == 'graph' else client_flow
+
+    questions = [f"Question {index}: what are your opening hours and prices for service {index}?" for index in range(args.turns)]
+    script = [config("LANGUAGE_ENGLISH")] + questions
+
+    latencies = {'language': [], 'message': []}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run_session(index):
+        async with semaphore:
+            session_id = await create(bots_record, workspace_record, None, f"bench{index}", f"bench{index}@bench.local", None)
+
+            for text in script:
+                start = time.perf_counter()
+                await flow(bots_record, workspace_record, embeddings_record, configuration_record, text, session_id)
+                elapsed = (time.perf_counter() - start) * 1000
+
+                latencies['message' if text in questions else 'language'].append(elapsed)
+
+    counter.reset()
+    blocking.reset()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[run_session(index) for index in range(args.sessions)])
+    await drain_scoring()
+    wall = time.perf_counter() - start
+
+    turns = args.sessions * len(script)
+    commands = counter.reset()
+    totals, longest = blocking.reset()
+
+    return {
+        'turns': turns,
+        'wall_seconds': round(wall, 3),
+        'throughput_turns_per_second': round(turns / wall, 2),
+        'latency_ms': {kind: percentiles(values) for kind, values in latencies.items()},
+        'mongo_ops_per_turn': round(sum(commands.values()) / turns, 2),
+        'mongo_commands': commands,
+        'loop_blocking_ms_per_turn': {stage: round(total / turns, 3) for stage, total in sorted(totals.items())},
+        'loop_blocking_longest_ms': dict(sorted(longest.items()))
+    }
+
+async def main(args):
+    from benchmarks.stand_ins import (
+        BenchChatModel, CommandCounter, LoopBlocking, bench_vectorstore, sentiment_server, track_stages, use_fake_redis
+    )
+
+    runner, url = await sentiment_server(args.sentiment_latency)
+    os.environ['SENTIMENT_URL'] = url
+
+    counter = CommandCounter()
+    from pymongo import monitoring
+    monitoring.register(counter)
+
+    import utilities.llm
+    import routers.chats.utilities.client as client
+    from utilities.database import get_client, close_connections
+
+    utilities.llm.build_chat_model = lambda *args_, **kwargs: BenchChatModel(latency = args.llm_latency, output_tokens = args.llm_tokens)
+    utilities.llm.chat_models.clear()
+
+    retrieval = bench_vectorstore(args.documents)
+    client.cached_retrieval = lambda workspace_record: retrieval
+
+    if not args.real_redis:
+        use_fake_redis()
+
+    track_stages()
+    blocking = LoopBlocking()
+    blocking.install()
+
+    results = {}
+    try:
+        for scenario in args.scenarios:
+            results[scenario] = await run_scenario(scenario, args, counter, blocking)
+            print(f"{scenario}: {json.dumps(results[scenario]['latency_ms'])}")
+    finally:
+        blocking.uninstall()
+
+        if not args.keep:
+            from decouple import config
+            for scenario in args.scenarios:
+                await get_client().drop_database(f"bench{scenario}" + config("SLUG_DATABASE"))
+
+        await close_connections()
+        await runner.cleanup()
+
+    return results
+
+if __name__ == "__main__":
+    args = parse_arguments()
+
+    os.environ['DATABASE_HOST'] = args.mongo
+    os.environ['DATABASE_USERNAME'] = ''
+    os.environ['DATABASE_PASSWORD'] = ''
+
+    results = asyncio.run(main(args))
+
+    output = args.output or os.path.join('benchmarks', 'results', f"chat_pipeline_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok = True)
+
+    with open(output, 'w') as file:
+        json.dump({'arguments': vars(args), 'created_date': datetime.now().strftime("%d/%m/%Y %H:%M:%S"), 'scenarios': results}, file, indent = 2)
+
+    print(f"Results written to {output}")
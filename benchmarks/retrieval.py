@@ -0,0 +1,194 @@
+# Compares vector-only, BM25-only and hybrid (RRF) retrieval on a corpus and
+# writes recall@k, MRR and latency to JSON.
+#
+#   python -m benchmarks.retrieval --vectordb faiss --embeddings huggingface:sentence-transformers/all-MiniLM-L6-v2
+#
+# `--embeddings wordllama:l2_supercat` runs a static embedding model whose
+# weights ship inside the `wordllama` wheel, for hosts that cannot reach the
+# Hugging Face hub. Results from past runs are in benchmarks/README.md.
+#
+# Without --corpus a synthetic product catalogue is generated; its queries ask
+# for products by code or by name. A real corpus is a directory of .txt files
+# plus --queries, a JSONL file of {"query": ..., "source": <file name>}.
+import argparse, json, os, random, statistics, tempfile, time
+from datetime import datetime
+
+adjectives = ['Aurora', 'Nimbus', 'Cedar', 'Harbor', 'Summit', 'Lotus', 'Ember', 'Willow', 'Atlas', 'Coral', 'Sierra', 'Juniper']
+products = ['massage chair', 'foot spa', 'neck pillow', 'heating pad', 'yoga mat', 'aroma diffuser', 'back roller', 'eye mask']
+benefits = ['relieves back pain', 'improves sleep', 'eases muscle tension', 'reduces stress', 'warms tired feet', 'supports posture']
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description = "Retrieval benchmark")
+    parser.add_argument('--vectordb', default = 'memory', choices = ['memory', 'faiss', 'chroma', 'lancedb'])
+    parser.add_argument('--embeddings', default = 'fake', help = "fake, huggingface:<model>, ollama:<model> or wordllama:<config>")
+    parser.add_argument('--corpus', default = None)
+    parser.add_argument('--queries', default = None)
+    parser.add_argument('--products', type = int, default = 500)
+    parser.add_argument('--k', type = int, default = 4)
+    parser.add_argument('--seed', type = int, default = 7)
+    parser.add_argument('--output', default = None)
+
+    return parser.parse_args()
+
+def synthetic_corpus(count, seed):
+    from langchain_core.documents import Document
+
+    generator = random.Random(seed)
+    documents, queries = [], []
+
+    for index in range(count):
+        code = f"{generator.choice('ABCDEFGHKLMNPRSTXZ')}{generator.choice('ABCDEFGHKLMNPRSTXZ')}-{generator.randint(1000, 9999)}"
+        name = f"{generator.choice(adjectives)} {generator.choice(adjectives)} {generator.choice(products)}"
+        source = f"product-{index}.txt"
+
+        text = (
+            f"{name} (product code {code}). This {name.split(' ', 2)[2]} {generator.choice(benefits)} and {generator.choice(benefits)}. "
+            f"Price: {generator.randint(20, 900)} AED. Warranty: {generator.randint(1, 5)} years. "
+            f"Available in {generator.choice(['black', 'white', 'grey', 'beige'])} and {generator.choice(['blue', 'green', 'brown', 'red'])}."
+        )
+        documents.append(Document(page_content = text, metadata = {'source': source}))
+
+        queries.append({'query': f"Is {code} in stock?", 'source': source, 'kind': 'code'})
+        queries.append({'query': f"How much does the {name.lower()} cost?", 'source': source, 'kind': 'name'})
+
+    return documents, queries
+
+def file_corpus(directory, queries_path):
+    from langchain_core.documents import Document
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    documents = []
+    for file_name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, file_name)) as file:
+            documents.append(Document(page_content = file.read(), metadata = {'source': file_name}))
+
+    splitter = RecursiveCharacterTextSplitter(separators = ["\n\n", "\n", " ", ".", ",", ""], chunk_size = 1000, chunk_overlap = 50)
+
+    with open(queries_path) as file:
+        queries = [{**json.loads(line), 'kind': 'corpus'} for line in file if line.strip()]
+
+    return splitter.split_documents(documents), queries
+
+def bench_embeddings(option):
+    if option == 'fake':
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        return DeterministicFakeEmbedding(size = 256)
+
+    provider, model = option.split(':', 1)
+
+    if provider == 'huggingface':
+        from utilities.huggingface import huggingface_embeddings
+        return huggingface_embeddings(model)
+
+    if provider == 'wordllama':
+        from langchain_core.embeddings import Embeddings
+        from wordllama import WordLlama
+
+        class WordLlamaEmbeddings(Embeddings):
+            def __init__(self, config):
+                self.model = WordLlama.load(config = config, disable_download = True)
+
+            def embed_documents(self, texts):
+                return self.model.embed(texts, norm = True).tolist()
+
+            def embed_query(self, text):
+                return self.embed_documents([text])[0]
+
+        return WordLlamaEmbeddings(model)
+
+    from utilities.vectorstores import load_embeddings
+    return load_embeddings({'embeddings': provider, 'embeddings_model': model, 'embeddings_url': None, 'embeddings_api_key': None})
+
+def bench_vectorstore(vectordb, documents, embeddings, path):
+    if vectordb == 'memory':
+        from langchain_core.vectorstores import InMemoryVectorStore
+        vectorstore = InMemoryVectorStore(embeddings)
+        vectorstore.add_documents(documents)
+        return vectorstore
+
+    from utilities.vectorstores import open_vectorstore
+
+    if vectordb == 'faiss':
+        from langchain_community.vectorstores import FAISS
+        FAISS.from_documents(documents, embeddings).save_local(path)
+    elif vectordb == 'chroma':
+        from langchain_chroma import Chroma
+        Chroma.from_documents(documents, embeddings, persist_directory = path)
+    elif vectordb == 'lancedb':
+        from langchain_community.vectorstores import LanceDB
+        from lancedb.rerankers import LinearCombinationReranker
+        LanceDB.from_documents(documents, embeddings, reranker = LinearCombinationReranker(weight = 0.3), uri = path)
+
+    return open_vectorstore({'vectordb': vectordb}, embeddings, path)
+
+def evaluate(retrieve, queries, k):
+    latencies, hits, reciprocal_ranks = [], {}, []
+
+    for query in queries:
+        start = time.perf_counter()
+        documents = retrieve(query['query'])[:k]
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        sources = [document.metadata.get('source') for document in documents]
+        rank = sources.index(query['source']) + 1 if query['source'] in sources else None
+
+        hits.setdefault(query['kind'], []).append(rank is not None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+    cuts = statistics.quantiles(latencies, n = 100, method = 'inclusive')
+
+    return {
+        f"recall_at_{k}": {kind: round(sum(values) / len(values), 4) for kind, values in hits.items()},
+        'mrr': round(statistics.mean(reciprocal_ranks), 4),
+        'latency_ms': {'p50': round(cuts[49], 3), 'p95': round(cuts[94], 3), 'p99': round(cuts[98], 3)}
+    }
+
+def main(args):
+    from utilities.hybrid import LexicalIndex, HybridRetriever
+
+    if args.corpus:
+        documents, queries = file_corpus(args.corpus, args.queries)
+    else:
+        documents, queries = synthetic_corpus(args.products, args.seed)
+
+    embeddings = bench_embeddings(args.embeddings)
+
+    with tempfile.TemporaryDirectory() as path:
+        start = time.perf_counter()
+        vectorstore = bench_vectorstore(args.vectordb, documents, embeddings, path)
+        vector_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        LexicalIndex.build(documents).save(path)
+        lexical = LexicalIndex.load(path)
+        lexical_seconds = time.perf_counter() - start
+
+        hybrid = HybridRetriever(vectorstore = vectorstore, lexical = lexical, k = args.k)
+
+        retrievers = {
+            'vector': lambda query: vectorstore.similarity_search(query, k = args.k),
+            'bm25': lambda query: lexical.search(query, args.k),
+            'hybrid': hybrid.invoke
+        }
+
+        results = {name: evaluate(retrieve, queries, args.k) for name, retrieve in retrievers.items()}
+
+    return {
+        'documents': len(documents), 'queries': len(queries),
+        'build_seconds': {'vector': round(vector_seconds, 3), 'bm25': round(lexical_seconds, 3)},
+        'retrievers': results
+    }
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    results = main(args)
+
+    print(json.dumps(results, indent = 2))
+
+    output = args.output or os.path.join('benchmarks', 'results', f"retrieval_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok = True)
+
+    with open(output, 'w') as file:
+        json.dump({'arguments': vars(args), 'created_date': datetime.now().strftime("%d/%m/%Y %H:%M:%S"), **results}, file, indent = 2)
+
+    print(f"Results written to {output}")
@@ -0,0 +1,159 @@
+import asyncio, sys, time, contextvars, tiktoken
+from collections import defaultdict
+from aiohttp import web
+from pymongo import monitoring
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+from langchain_core.documents import Document
+
+from utilities.hybrid import LexicalIndex
+
+enc = tiktoken.get_encoding("cl100k_base")
+
+current_stage = contextvars.ContextVar('current_stage', default = None)
+
+class BenchChatModel(BaseChatModel):
+    latency: float = 0.5
+    output_tokens: int = 60
+
+    @property
+    def _llm_type(self):
+        return 'bench'
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def reply(self, messages):
+        prompt_tokens = sum(len(enc.encode(str(message.content))) for message in messages)
+        content = ' '.join(['lorem'] * self.output_tokens)
+
+        message = AIMessage(
+            content = content,
+            response_metadata = {'token_usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': self.output_tokens}},
+            usage_metadata = {'input_tokens': prompt_tokens, 'output_tokens': self.output_tokens, 'total_tokens': prompt_tokens + self.output_tokens}
+        )
+
+        return ChatResult(generations = [ChatGeneration(message = message)])
+
+    def _generate(self, messages, stop = None, run_manager = None, **kwargs):
+        time.sleep(self.latency)
+        return self.reply(messages)
+
+    async def _agenerate(self, messages, stop = None, run_manager = None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self.reply(messages)
+
+def bench_vectorstore(documents = 200, size = 256):
+    embeddings = DeterministicFakeEmbedding(size = size)
+    vectorstore = InMemoryVectorStore(embeddings)
+    chunks = [
+        Document(page_content = f"Document {index}: " + ' '.join(['ipsum'] * 120), metadata = {'source': f"doc-{index}.txt"})
+        for index in range(documents)
+    ]
+    vectorstore.add_documents(chunks)
+
+    return embeddings, vectorstore, LexicalIndex.build(chunks)
+
+async def sentiment_server(latency):
+    async def score(request):
+        await asyncio.sleep(latency)
+        return web.json_response({'sentiment': 'Neutral'})
+
+    app = web.Application()
+    app.router.add_post('/', score)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+
+    port = site._server.sockets[0].getsockname()[1]
+
+    return runner, f"http://127.0.0.1:{port}/"
+
+def use_fake_redis():
+    import fakeredis.aioredis
+    import utilities.redis
+
+    server = fakeredis.FakeServer()
+    original = utilities.redis.get_redis
+
+    async def get_redis():
+        return fakeredis.aioredis.FakeRedis(server = server, decode_responses = True)
+
+    for module in list(sys.modules.values()):
+        if getattr(module, 'get_redis', None) is original:
+            module.get_redis = get_redis
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = defaultdict(int)
+
+    def started(self, event):
+        self.commands[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def reset(self):
+        commands = dict(self.commands)
+        self.commands.clear()
+
+        return commands
+
+# Every callback the event loop runs is timed and charged to the stage the
+# owning task was in, so a stage's figure is the time it held the loop.
+class LoopBlocking:
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.longest = defaultdict(float)
+        self.original = None
+
+    def install(self):
+        handle = asyncio.events.Handle
+        self.original = original = handle._run
+        blocking = self
+
+        def _run(self):
+            start = time.perf_counter()
+            try:
+                original(self)
+            finally:
+                elapsed = time.perf_counter() - start
+                stage = (self._context.get(current_stage) if self._context is not None else None) or 'other'
+                blocking.totals[stage] += elapsed
+                blocking.longest[stage] = max(blocking.longest[stage], elapsed)
+
+        handle._run = _run
+
+    def uninstall(self):
+        if self.original:
+            asyncio.events.Handle._run = self.original
+
+    def reset(self):
+        totals = {stage: round(seconds * 1000, 3) for stage, seconds in self.totals.items()}
+        longest = {stage: round(seconds * 1000, 3) for stage, seconds in self.longest.items()}
+        self.totals.clear()
+        self.longest.clear()
+
+        return totals, longest
+
+def track_stages():
+    from utilities.timing import StageTimings
+
+    measure = StageTimings.measure
+
+    async def staged_measure(self, name, awaitable):
+        token = current_stage.set(name)
+        try:
+            return await measure(self, name, awaitable)
+        finally:
+            current_stage.reset(token)
+
+    StageTimings.measure = staged_measure
@@ -7,7 +7,7 @@ from decorators.jwt import jwt_token
 from decorators.key import x_app_key
 from decorators.teams import x_super_team
 from utilities.database import connect
-from utilities.validation import check_required_fields, process_name
+from utilities.validation import check_required_fields, process_name, invalidate_tenant
 
 bots_router = APIRouter()
 
@@ -164,6 +164,8 @@ async def disable(request: Request):
         await bots_collections.update_one({"_id": bots_record["_id"]}, {"$set": {"modified_date": date_time}})
         await bots_collections.update_one({"_id": bots_record["_id"]}, {"$set": {"modified_by": user}})
 
+        invalidate_tenant(company_id, bot_id)
+
         return JSONResponse(content={"detail": f"Bot has been disabled."}, status_code = 200)
 
     except HTTPException as e:
@@ -203,6 +205,8 @@ async def enable(request: Request):
         await bots_collections.update_one({"_id": bots_record["_id"]}, {"$set": {"modified_date": date_time}})
         await bots_collections.update_one({"_id": bots_record["_id"]}, {"$set": {"modified_by": user}})
 
+        invalidate_tenant(company_id, bot_id)
+
         return JSONResponse(content={"detail": f"Bot has been disabled."}, status_code = 200)
 
     except HTTPException as e:
@@ -242,6 +246,8 @@ async def enable(request: Request):
         await bots_collections.update_one({"_id": bots_record["_id"]}, {"$set": {"modified_date": date_time}})
         await bots_collections.update_one({"_id": bots_record["_id"]}, {"$set": {"modified_by": user}})
 
+        invalidate_tenant(company_id, bot_id)
+
         return JSONResponse(content={"detail": f"Bot has been updated."}, status_code = 200)
 
     except HTTPException as e:
@@ -2,6 +2,7 @@ import tiktoken, io, csv
 from decouple import config
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import JSONResponse, StreamingResponse
+from sse_starlette.sse import EventSourceResponse
 
 from decorators.jwt import jwt_token
 from decorators.key import x_app_key
@@ -13,6 +14,10 @@ from routers.chats.utilities.agent import agent_flow
 from routers.chats.utilities.client import client_flow
 from routers.chats.utilities.profile import create
 from routers.chats.utilities.graph import client_graph
+from routers.chats.utilities.stream import stream_flow
+from routers.chats.utilities.jobs import job_statistics
+from routers.chats.utilities.idempotency import idempotency_key, idempotent_flow
+from routers.chats.utilities.session_lock import is_merged
 
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -69,6 +74,13 @@ SUPPORTED_QUEUES = ['web', 'whatsapp', 'sdk']
 
 timestamp_format = '%d/%m/%Y %H:%M:%S'
 
+# A message merged into another turn of its session gets no answer of its own
+def chat_response(response):
+    if is_merged(response):
+        return JSONResponse(content = response, status_code = 202)
+
+    return JSONResponse(content={"detail": response}, status_code = 200)
+
 @chats_router.post('/active/get_all')
 @x_super_team
 @x_app_key
@@ -347,9 +359,12 @@ async def batch(request: Request):
         embeddings_collections = db['embeddings']
         embeddings_record = await embeddings_collections.find_one({'bot_id': workspace_record['bot_id'], 'workspace_id': workspace_record['workspace_id']})
 
-        response = await client_flow(bots_record, workspace_record, embeddings_record, configuration_record, text, session_id)
-        
-        return JSONResponse(content={"detail": response}, status_code = 200)
+        response = await idempotent_flow(
+            idempotency_key(request, data), workspace_record, session_id, text,
+            client_flow, bots_record, workspace_record, embeddings_record, configuration_record, text, session_id
+        )
+
+        return chat_response(response)
     
     except HTTPException as e:
         raise e
@@ -379,9 +394,12 @@ async def batch_whatsapp(request: Request):
         embeddings_collections = db['embeddings']
         embeddings_record = await embeddings_collections.find_one({'bot_id': workspace_record['bot_id'], 'workspace_id': workspace_record['workspace_id']})
 
-        response = await client_flow(bots_record, workspace_record, embeddings_record, configuration_record, text, session_id)
-        
-        return JSONResponse(content={"detail": response}, status_code = 200)
+        response = await idempotent_flow(
+            idempotency_key(request, data), workspace_record, session_id, text,
+            client_flow, bots_record, workspace_record, embeddings_record, configuration_record, text, session_id
+        )
+
+        return chat_response(response)
     
     except HTTPException as e:
         raise e
@@ -411,11 +429,91 @@ async def batch_graph(request: Request):
         embeddings_collections = db['embeddings']
         embeddings_record = await embeddings_collections.find_one({'bot_id': workspace_record['bot_id'], 'workspace_id': workspace_record['workspace_id']})
 
-        response = await client_graph(bots_record, workspace_record, embeddings_record, configuration_record, text, session_id)
-        
-        return JSONResponse(content={"detail": response}, status_code = 200)
+        response = await idempotent_flow(
+            idempotency_key(request, data), workspace_record, session_id, text,
+            client_graph, bots_record, workspace_record, embeddings_record, configuration_record, text, session_id
+        )
+
+        return chat_response(response)
+    
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
+
+@chats_router.post('/stream')
+@x_app_key
+@jwt_token
+async def batch_stream(request: Request):
+    try:
+        data = await request.form()
+
+        required_fields = ['token', 'session_id', 'text']
+        if not check_required_fields(data, required_fields):
+            raise HTTPException(status_code = 400, detail = f"An error occurred: missing parameter(s)")
+
+        token, text, session_id = data.get('token'), data.get('text'), data.get('session_id')
+
+        result = await validate_token(token)
+        if not result:
+            raise HTTPException(status_code = 400, detail = f"An error occurred: invalid parameter(s)")
+        else:
+            bots_record, workspace_record, configuration_record = result
+
+        db = await connect()
+        embeddings_collections = db['embeddings']
+        embeddings_record = await embeddings_collections.find_one({'bot_id': workspace_record['bot_id'], 'workspace_id': workspace_record['workspace_id']})
+
+        return EventSourceResponse(
+            stream_flow(client_flow, bots_record, workspace_record, embeddings_record, configuration_record, text, session_id)
+        )
     
     except HTTPException as e:
         raise e
     except Exception as e:
-        raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
+
+@chats_router.post('/graph/stream')
+@x_app_key
+@jwt_token
+async def batch_graph_stream(request: Request):
+    try:
+        data = await request.form()
+
+        required_fields = ['token', 'session_id', 'text']
+        if not check_required_fields(data, required_fields):
+            raise HTTPException(status_code = 400, detail = f"An error occurred: missing parameter(s)")
+
+        token, text, session_id = data.get('token'), data.get('text'), data.get('session_id')
+
+        result = await validate_token(token)
+        if not result:
+            raise HTTPException(status_code = 400, detail = f"An error occurred: invalid parameter(s)")
+        else:
+            bots_record, workspace_record, configuration_record = result
+
+        db = await connect()
+        embeddings_collections = db['embeddings']
+        embeddings_record = await embeddings_collections.find_one({'bot_id': workspace_record['bot_id'], 'workspace_id': workspace_record['workspace_id']})
+
+        return EventSourceResponse(
+            stream_flow(client_graph, bots_record, workspace_record, embeddings_record, configuration_record, text, session_id)
+        )
+    
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
+    
+@chats_router.get('/jobs')
+@x_super_team
+@x_app_key
+@jwt_token
+async def jobs(request: Request):
+    try:
+        return JSONResponse(await job_statistics(), status_code = 200)
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
@@ -1,16 +1,13 @@
-import json, requests, uuid
 from decouple import config
-from datetime import datetime
 from fastapi import HTTPException
 
 from utilities.database import connect
 from utilities.redis import enqueue, delete_from_queue
+from utilities.live_sessions import refresh_session, end_session
+from routers.chats.utilities.conversation import current_time, new_role, append_role, score_role_later
 from routers.chats.utilities.summary import client_summary_anythingllm, client_summary_otherllms
 from routers.chats.utilities.suggestions import client_suggestions_anythingllm, client_suggestions_otherllms
 
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
 slug_db = config("SLUG_DATABASE")
 
 language_english = config("LANGUAGE_ENGLISH") 
@@ -27,14 +24,6 @@ human_agent_end_message = config("HUMAN_AGENT_END_MESSAGE")
 display_agent_end_message_english = config("DISPLAY_AGENT_END_MESSAGE_ENGLISH")
 display_agent_end_message_arabic = config("DISPLAY_AGENT_END_MESSAGE_ARABIC")
 
-sentiment_url = config("SENTIMENT_URL")
-x_app_key = config("X_APP_KEY")
-
-sentiment_headers = {
-    'x-app-key': x_app_key,
-    'x-super-team': '100'
-}
-
 async def agent_flow(
     bots_record, workspace_record, configuration_record, 
     session_id, agent_name, agent_id, agent_email, text
@@ -84,40 +73,23 @@ async def agent_goodbye(
         messages_collections = db['messages']
         profiles_collections = db['profiles']
         
-        message_record = await messages_collections.find_one({"workspace_id": workspace_id, "session_id": session_id})
         profiles_record = await profiles_collections.find_one({"workspace_id": workspace_id, "session_id": session_id})
 
-        now = datetime.now()
-        human_time = now.strftime("%d/%m/%Y %H:%M:%S")  
-
-        if profiles_record['preference'] == language_english:
-            if agent:
-                message_record['roles'].append({
-                    "type": 'human-agent', "text": display_agent_end_message_english, "timestamp": human_time, "agent_name": agent_name, 
-                    "agent_id": agent_id, "agent_email": agent_email, "output_tokens": 0, "sentiment": "Neutral", 'id': str(uuid.uuid4())
-                })
-            else:
-                message_record['roles'].append({
-                    "type": 'human-agent', "text": display_agent_end_message_english, "timestamp": human_time, "agent_name": agent_name, 
-                    "agent_id": agent_id, "agent_email": agent_email, "output_tokens": 0, "sentiment": None, 'id': str(uuid.uuid4())
-                })
-
-        elif profiles_record['preference'] == language_arabic:
-            if agent:
-                message_record['roles'].append({
-                    "type": 'human-agent', "text": display_agent_end_message_arabic, "timestamp": human_time, "agent_name": agent_name, 
-                    "agent_id": agent_id, "agent_email": agent_email, "output_tokens": 0, "sentiment": "Neutral", 'id': str(uuid.uuid4())
-                })
-            else:
-                message_record['roles'].append({
-                    "type": 'human-agent', "text": display_agent_end_message_arabic, "timestamp": human_time, "agent_name": agent_name, 
-                    "agent_id": agent_id, "agent_email": agent_email, "output_tokens": 0, "sentiment": None, 'id': str(uuid.uuid4())
-                })
-
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"end_conversation": 1}})
-
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+        human_time = current_time()
+
+        if profiles_record['preference'] == language_arabic:
+            text = display_agent_end_message_arabic
+        else:
+            text = display_agent_end_message_english
+
+        sentiment = "Neutral" if agent else None
+        role = new_role(
+            'human-agent', text, human_time, agent_name = agent_name, agent_id = agent_id, agent_email = agent_email, 
+            output_tokens = 0, sentiment = sentiment
+        )
+
+        await append_role(messages_collections, session_id, role, {"end_conversation": 1})
+        await end_session(slug, workspace_id, session_id)
 
         await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
 
@@ -140,38 +112,29 @@ async def agent_takeover(
         messages_collections = db['messages']
         profiles_collections = db['profiles']
         
-        message_record = await messages_collections.find_one({"workspace_id": workspace_id, "session_id": session_id})
         profiles_record = await profiles_collections.find_one({"workspace_id": workspace_id, "session_id": session_id})
 
         if not llm_choice == 'anythingllm':
             history_collections = db['history']
             await history_collections.delete_many({'SessionId': session_id})
 
-        now = datetime.now()
-        human_time = now.strftime("%d/%m/%Y %H:%M:%S")  
+        human_time = current_time()
 
-        if profiles_record['preference'] == language_english:
-            text = display_human_takeover_message_english
-        elif profiles_record['preference'] == language_arabic:
+        if profiles_record['preference'] == language_arabic:
             text = display_human_takeover_message_arabic
-
-        if agent:                        
-            message_record['roles'].append({
-                "type": 'human-agent', "text": text, "timestamp": human_time, "agent_name": agent_name, "agent_id": agent_id, 
-                "agent_email": agent_email, "output_tokens": 0, "sentiment": "Neutral", 'id': str(uuid.uuid4())
-            })
         else:
-            message_record['roles'].append({
-                "type": 'human-agent', "text": text, "timestamp": human_time, "agent_name": agent_name, "agent_id": agent_id, 
-                "agent_email": agent_email, "output_tokens": 0, "sentiment": None, 'id': str(uuid.uuid4())
-            })
+            text = display_human_takeover_message_english
 
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+        sentiment = "Neutral" if agent else None
+        role = new_role(
+            'human-agent', text, human_time, agent_name = agent_name, agent_id = agent_id, agent_email = agent_email, 
+            output_tokens = 0, sentiment = sentiment
+        )
 
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+        await append_role(messages_collections, session_id, role, {"human_intervention": 1})
+        await refresh_session(messages_collections, slug, session_id)
 
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"human_intervention": 1}})
+        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
 
         if auto_assignment:
             await enqueue(session_id, f"{agent_id}:{agent_name}:{agent_email}")
@@ -199,44 +162,21 @@ async def agent_message(
         messages_collections = db['messages']
         profiles_collections = db['profiles']
         
-        message_record = await messages_collections.find_one({"workspace_id": workspace_id, "session_id": session_id})
-        profiles_record = await profiles_collections.find_one({"workspace_id": workspace_id, "session_id": session_id})
+        human_time = current_time()
 
-        now = datetime.now()
-        human_time = now.strftime("%d/%m/%Y %H:%M:%S") 
+        role = new_role(
+            'human-agent', text, human_time, agent_name = agent_name, agent_id = agent_id, agent_email = agent_email, output_tokens = 0
+        )
 
-        message_record['roles'].append({
-            "type": 'human-agent', "text": text, "timestamp": human_time, "agent_name": agent_name, "agent_id": agent_id, 
-            "agent_email": agent_email, "output_tokens": 0, "sentiment": None, 'id': str(uuid.uuid4())
-        })
+        await append_role(messages_collections, session_id, role)
+        await refresh_session(messages_collections, slug, session_id)
 
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
-
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+        await profiles_collections.update_one({"workspace_id": workspace_id, "session_id": session_id}, {"$set": {"latest_timestamp": human_time}})
 
         if agent:
-            data = {
-                'text': text
-            }
-
-            try:
-                sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                sentiment_human = json.loads(sentiment.text)
-
-                message_record = await messages_collections.find_one({'session_id': session_id})
-
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'human-agent':
-                        role['sentiment'] = sentiment_human['sentiment'] 
-            except:
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'human-agent':
-                        role['sentiment'] = 'Neutral'     
-
-                await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
+            score_role_later(messages_collections, session_id, role)
 
     except HTTPException as e:
         raise e
     except Exception as e:
-        raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
@@ -1,29 +1,26 @@
-import tiktoken, urllib, json, requests, uuid, pymongo, urllib3, torch
+import tiktoken, urllib3, asyncio
 from decouple import config
-from datetime import datetime, timedelta
 from fastapi import HTTPException
-from langchain_community.vectorstores import FAISS
-from langchain_chroma import Chroma
-from langchain_community.vectorstores import LanceDB
-from lancedb.rerankers import LinearCombinationReranker
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_groq import ChatGroq
-from langchain_ollama import ChatOllama
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.prompts import ChatPromptTemplate
 from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import MessagesPlaceholder
+from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_mongodb.chat_message_histories import MongoDBChatMessageHistory
 
-from utilities.database import connect
+from utilities.database import connect, get_limited_message_history, history_budget
+from utilities.llm import workspace_chat_model, response_tokens
+from utilities.vectorstores import cached_retrieval
+from utilities.hybrid import hybrid_retriever
+from utilities.context import packed_retriever
 from utilities.redis import enqueue
-from routers.chats.utilities.summary import client_summary_otherllms, client_summary_anythingllm
-from routers.chats.utilities.suggestions import (
-    client_suggestions_otherllms, client_message_suggestions_otherllms, client_suggestions_anythingllm, client_message_suggestions_anythingllm
-)
+from utilities.anythingllm import anythingllm_chat, session_thread
+from utilities.live_sessions import live_session_count
+from utilities.answer_cache import lookup_answer, store_answer
+from utilities.canned import canned_reply, generate_reply
+from routers.chats.utilities.conversation import current_time, new_role, new_conversation, conversation_turn
+from routers.chats.utilities.jobs import enqueue_job
+from routers.chats.utilities.session_lock import session_lock, merged_result
 
 enc = tiktoken.get_encoding("cl100k_base")
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -56,57 +53,83 @@ prompt_transfer_arabic = config("PROMPT_TRANSFER_ARABIC")
 
 transfer_queue = config("TRANSFER_QUEUE")
 
-sentiment_url = config("SENTIMENT_URL")
-x_app_key = config("X_APP_KEY")
+timestamp_format = '%d/%m/%Y %H:%M:%S'
 
-sentiment_headers = {
-    'x-app-key': x_app_key,
-    'x-super-team': '100'
-}
+async def run_chain(chain, text, session_id, turn, answer_key = None):
+    config = {"configurable": {"session_id": session_id}}
 
-timestamp_format = '%d/%m/%Y %H:%M:%S'
+    if turn.stream is None:
+        return await chain.ainvoke({'input': text}, config = config)
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
+    response = {} if answer_key else None
+    async for chunk in chain.astream({'input': text}, config = config):
+        if answer_key:
+            token = chunk.get(answer_key)
+            response.update({key: value for key, value in chunk.items() if key != answer_key})
+            if token:
+                response[answer_key] = response.get(answer_key, '') + token
+        else:
+            token = chunk.content
+            response = chunk if response is None else response + chunk
 
-def get_limited_message_history(
-        session_id, connection_string, database_name, collection_name
-):
-    history = MongoDBChatMessageHistory(
-        session_id=session_id,
-        connection_string=connection_string,
-        database_name=database_name,
-        collection_name=collection_name,
-    )
+        if token:
+            turn.emit('token', token)
+
+    return response
 
-    return history
+async def append_history(db, workspace_record, session_id, question, answer):
+    await get_limited_message_history(session_id, db.name, token_budget = history_budget(workspace_record)).aadd_messages([HumanMessage(content = question), AIMessage(content = answer)])
 
 async def client_flow(
-    bots_record, workspace_record, embeddings_record, configuration_record, text, session_id
+    bots_record, workspace_record, embeddings_record, configuration_record, text, session_id, stream = None
 ):
     try:      
         max_sessions = workspace_record['sessions_limit']
-        
-        if await agent_involved_chat(
-            bots_record, workspace_record, configuration_record, session_id, text
-        ):
-            return "Response has been created"
-        
-        if await max_allowed_chats(workspace_record['workspace_id'], session_id, bots_record['bot_name'], max_sessions):
-            return "No agent is available at the moment. Try again later!"
 
-        if text == language_arabic or text == language_english:
-            response = await client_language_message(text, bots_record, workspace_record, configuration_record, session_id)
-        
-        elif text == human_end_message:
-            response = await client_goodbye_message(bots_record, workspace_record, configuration_record, session_id)
-        
-        elif text == transfer_message:
-            response = await client_transfer_message(bots_record, workspace_record, configuration_record, session_id)
+        mergeable = text not in [language_arabic, language_english, human_end_message, transfer_message]
 
-        else:
-            response = await client_conversation(text, bots_record, workspace_record, embeddings_record, configuration_record, session_id)
+        async with session_lock(session_id, text, mergeable, configuration_record.get('merge_messages')) as (text, merged_into):
+            if merged_into:
+                return merged_result(merged_into)
 
-        return response
+            async with conversation_turn(bots_record, workspace_record, session_id, stream) as turn:
+                stages = {
+                    'records': turn.load(),
+                    'sessions_limit': max_allowed_chats(workspace_record['workspace_id'], session_id, bots_record['bot_name'], max_sessions)
+                }
+
+                if not workspace_record['llm'] == 'anythingllm':
+                    stages['llm'] = llm_selection(workspace_record)
+
+                    if embeddings_record and text not in [language_arabic, language_english, human_end_message, transfer_message]:
+                        stages['vectorstore'] = embeddings_and_vectordb_selection(workspace_record)
+
+                turn.prefetched = await turn.timings.gather(stages)
+
+                if await turn.timings.measure('agent', agent_involved_chat(
+                    bots_record, workspace_record, configuration_record, session_id, text, turn
+                )):
+                    return "Response has been created"
+            
+                if turn.prefetched['sessions_limit']:
+                    return "No agent is available at the moment. Try again later!"
+
+                if text == language_arabic or text == language_english:
+                    handler = client_language_message(text, bots_record, workspace_record, configuration_record, session_id, turn)
+            
+                elif text == human_end_message:
+                    handler = client_goodbye_message(bots_record, workspace_record, configuration_record, session_id, turn)
+            
+                elif text == transfer_message:
+                    handler = client_transfer_message(bots_record, workspace_record, configuration_record, session_id, turn)
+
+                else:
+                    handler = client_conversation(text, bots_record, workspace_record, embeddings_record, configuration_record, session_id, turn)
+
+                response = await turn.timings.measure('response', handler)
+                turn.emit('done', response)
+
+            return response
 
     except HTTPException as e:
         raise e
@@ -114,18 +137,11 @@ async def client_flow(
         raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
     
 async def agent_involved_chat(
-    bots_record, workspace_record, configuration_record, session_id, text
+    bots_record, workspace_record, configuration_record, session_id, text, turn
 ):
     
     try:
-        slug = bots_record['bot_name'] + slug_db
-        db = await connect(slug)
-
-        messages_collections = db['messages']
-        profiles_collections = db['profiles']
-        
-        message_record = await messages_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-        profiles_record = await profiles_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
+        message_record = turn.message_record
 
         if not message_record:
             return False
@@ -135,52 +151,22 @@ async def agent_involved_chat(
         
         if message_record['transfer_conversation'] or message_record['human_intervention']:
             if text == human_end_message:
-                await client_goodbye_message(bots_record, workspace_record, configuration_record, session_id)
+                await client_goodbye_message(bots_record, workspace_record, configuration_record, session_id, turn)
                 return True
 
-        now = datetime.now()
-        human_time = now.strftime("%d/%m/%Y %H:%M:%S")
-
-        message_record['roles'].append({
-            "type": 'human', "text": text, "timestamp": human_time, "input_tokens": 0, "sentiment": None, 'id': str(uuid.uuid4())
-        })
+        human_time = current_time()
 
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+        human_role = new_role('human', text, human_time, input_tokens = 0)
 
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+        turn.append(human_role)
+        turn.set_profile({"latest_timestamp": human_time})
 
         if configuration_record['client_query']:
-            data = {
-                'text': text
-            }
-
-            try:
-                sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                sentiment_human = json.loads(sentiment.text)
-
-                message_record = await messages_collections.find_one({'session_id': session_id})
-
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'human':
-                        role['sentiment'] = sentiment_human['sentiment'] 
-            except:
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'human':
-                        role['sentiment'] = 'Neutral'
-                        
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})                    
+            turn.score(human_role)
         
         if configuration_record['summary']:
-            if workspace_record['llm'] == 'anythingllm':
-                await client_message_suggestions_anythingllm(
-                    workspace_record['company_id'], workspace_record['bot_id'], workspace_record['workspace_id'], session_id
-                )
-            else:
-                await client_message_suggestions_otherllms(
-                    workspace_record['company_id'], workspace_record['bot_id'], workspace_record['workspace_id'], session_id
-                )
+            await turn.flush()
+            await enqueue_job(['message_suggestions'], workspace_record, session_id)
 
         return True
 
@@ -199,20 +185,10 @@ async def max_allowed_chats(
 
         messages_collections = db['messages']
 
-        message_records = await messages_collections.find({'workspace_id': workspace_id}).to_list(length=None)
-        message_record = await messages_collections.find_one({"workspace_id": workspace_id, "session_id": session_id})
-
-        session_active = 0
-        for record in message_records:
-            latest_timestamp = datetime.now()
-            expiration_time = datetime.strptime(record['latest_timestamp'], timestamp_format) + timedelta(minutes = int(record['timeout']))
-            
-            if not record['transfer_conversation'] or record['human_intervention']:
-                if not record['end_conversation'] and expiration_time > latest_timestamp:
-                    session_active += 1
+        session_active = await live_session_count(db, workspace_id)
 
         if int(max_sessions) <= session_active:
-            if not message_record:
+            if not await messages_collections.find_one({"workspace_id": workspace_id, "session_id": session_id}, {'_id': 1}):
                 return True
             
         return False
@@ -227,23 +203,7 @@ async def llm_selection(
 ):
     
     try:
-        if workspace_record['llm'] == 'openai':
-            llm = ChatOpenAI(
-                model_name = workspace_record['model'], temperature = float(workspace_record['llm_temperature']), 
-                api_key = workspace_record['llm_api_key']
-            )
-        elif workspace_record['llm'] == 'ollama':
-            if workspace_record['llm_url']:
-                llm = ChatOllama(model = workspace_record['model'], temperature = float(workspace_record['llm_temperature']), 
-                base_url = workspace_record['llm_url']
-            )
-            else:
-                llm = ChatOllama(model = workspace_record['model'], temperature = float(workspace_record['llm_temperature']))
-        elif workspace_record['llm'] == 'groq':
-            llm = ChatGroq(
-                model = workspace_record['model'], temperature = float(workspace_record['llm_temperature']), 
-                api_key = workspace_record['llm_api_key']
-            )
+        llm = workspace_chat_model(workspace_record)
 
         return llm
 
@@ -257,61 +217,7 @@ async def embeddings_and_vectordb_selection(
 ):
     
     try:
-        if workspace_record['embeddings'] == 'openai':
-            embeddings = OpenAIEmbeddings(model = workspace_record['embeddings_model'], openai_api_key = workspace_record['embeddings_api_key'])
-        elif workspace_record['embeddings'] == 'huggingface':
-            embeddings = HuggingFaceEmbeddings(
-                model_name = workspace_record['embeddings_model'], model_kwargs = {'device': device}, encode_kwargs = {'normalize_embeddings': False}
-            )
-        elif workspace_record['embeddings'] == 'ollama':
-            if workspace_record['embeddings_url']:
-                embeddings = OllamaEmbeddings(model = workspace_record['embeddings_model'], base_url = workspace_record['embeddings_url'])
-            else: 
-                embeddings = OllamaEmbeddings(model = workspace_record['embeddings_model'])
-
-        path = (
-            f"library/{workspace_record['company_id']}/{workspace_record['bot_id']}/{workspace_record['workspace_id']}/embeddings"
-        )
-
-        if workspace_record['vectordb'] == 'faiss':
-            vectorstore = FAISS.load_local(path, embeddings, allow_dangerous_deserialization = True)
-        elif workspace_record['vectordb'] == 'chroma':
-            vectorstore = Chroma(persist_directory = path, embedding_function = embeddings)
-        elif workspace_record['vectordb'] == 'lancedb':
-            reranker = LinearCombinationReranker(weight = 0.3)
-            vectorstore = LanceDB(embedding = embeddings, uri = path, reranker = reranker)
-
-        return embeddings, vectorstore
-
-    except HTTPException as e:
-        raise e
-    except Exception as e:
-        raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
-
-async def anythingllm_connection(
-    workspace_record, message_record
-):
-    try:
-        headers = {
-            'accept': 'application/json',
-            'Authorization': f"Bearer {workspace_record['llm_api_key']}",
-            'Content-Type': 'application/json'
-        }
-
-        if not message_record:
-            url = f"{workspace_record['llm_url']}/api/v1/workspace/{workspace_record['model']}/thread/new"
-
-            response = requests.post(url, headers = headers)
-            response = response.json()
-
-            new_slug = response['thread']['slug'] 
-
-            url = f"{workspace_record['llm_url']}/api/v1/workspace/{workspace_record['model']}/thread/{new_slug}/chat"
-        else:
-            new_slug = message_record['slug']
-            url = f"{workspace_record['llm_url']}/api/v1/workspace/{workspace_record['model']}/thread/{message_record['slug']}/chat"
-
-        return url, headers, new_slug
+        return await asyncio.to_thread(cached_retrieval, workspace_record)
 
     except HTTPException as e:
         raise e
@@ -319,7 +225,7 @@ async def anythingllm_connection(
         raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
 
 async def client_language_message(
-    text, bots_record, workspace_record, configuration_record, session_id
+    text, bots_record, workspace_record, configuration_record, session_id, turn
 ):
     
     try:
@@ -328,40 +234,16 @@ async def client_language_message(
         elif text == language_english:
             display_message = display_language_english
 
-        slug = bots_record['bot_name'] + slug_db
-        db = await connect(slug)
-
-        messages_collections = db['messages']
-        profiles_collections = db['profiles']
-        
-        message_record = await messages_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-        profiles_record = await profiles_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
+        message_record = turn.message_record
 
         if workspace_record['llm'] == 'anythingllm':
-            url, headers, new_slug = await anythingllm_connection(workspace_record, message_record)
+            new_slug = await session_thread(workspace_record, message_record, session_id)
 
         else:
-            llm = await llm_selection(workspace_record)
-
-            history_collections = db['history']
-            history_records = await history_collections.find({'SessionId': session_id}, sort=[("_id", pymongo.DESCENDING)]).to_list(length=None)
+            llm = turn.prefetched.get('llm') or await llm_selection(workspace_record)
 
-            chat_limit = int(workspace_record['chat_limit']) * 2
             new_slug = None
 
-            host = config("DATABASE_HOST")
-            username = config("DATABASE_USERNAME")
-            password = config("DATABASE_PASSWORD")
-
-            username = urllib.parse.quote_plus(username)
-            password = urllib.parse.quote_plus(password)
-
-            if len(history_records) > chat_limit:
-                records_to_remove = history_records[chat_limit-6:chat_limit-4]
-                record_ids_to_remove = [record['_id'] for record in records_to_remove]
-
-                await history_collections.delete_many({'_id': {'$in': record_ids_to_remove}})
-
             non_rag_prompt = workspace_record['system_prompt']
 
             qa_prompt = ChatPromptTemplate.from_messages(
@@ -374,175 +256,62 @@ async def client_language_message(
 
             runnable = qa_prompt | llm
 
-            if username and password:
-                chain_with_history = RunnableWithMessageHistory(
-                    runnable,
-                    lambda session_id: get_limited_message_history(
-                        session_id = session_id,
-                        connection_string = f"mongodb://{username}:{password}@{host}:27017",
-                        database_name = f"{bots_record['bot_name'] + slug_db}",
-                        collection_name = "history"
-                    ),
-                    input_messages_key="input",
-                    history_messages_key="chat_history"
-                )
-
-            else:
-                chain_with_history = RunnableWithMessageHistory(
-                    runnable,
-                    lambda session_id: get_limited_message_history(
-                        session_id = session_id,
-                        connection_string = f"mongodb://{host}:27017",
-                        database_name = f"{bots_record['bot_name'] + slug_db}",
-                        collection_name = "history"
-                    ),
-                    input_messages_key="input",
-                    history_messages_key="chat_history"      
-                )
+            chain_with_history = RunnableWithMessageHistory(
+                runnable,
+                lambda session_id: get_limited_message_history(session_id, bots_record['bot_name'] + slug_db, token_budget = history_budget(workspace_record)),
+                input_messages_key = "input",
+                history_messages_key = "chat_history"
+            )
 
-        now = datetime.now()
-        human_time = now.strftime("%d/%m/%Y %H:%M:%S")
+        human_time = current_time()
+        human_role = new_role('human', display_message, human_time, input_tokens = None)
 
-        message_record = await messages_collections.find_one({"session_id": session_id})
         if message_record: 
-            message_record['roles'].append({
-                "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": None, 
-                "sentiment": None, 'id': str(uuid.uuid4())
-            })
-
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+            turn.append(human_role)
 
         else:
-            document = {"session_id": session_id, "roles": [{
-                "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": None, "sentiment": None, 
-                "id": str(str(uuid.uuid4()))}], 'timeout': bots_record['timeout'], 'language': None, 'sentiment': None, 
-                'agent_sentiment': None, 'tags': [None], 'slug': new_slug, 'workspace_id': workspace_record['workspace_id'], 
-                'end_conversation': 0, 'transfer_conversation': 0, 'human_intervention': 0, 'agent_expiry': 0, 
-                'latest_timestamp': human_time
-            }
-            
-            await messages_collections.insert_one(document)
+            turn.create(new_conversation(bots_record, workspace_record, session_id, [human_role], human_time, new_slug))
+            turn.set_profile({"preference": text})
 
-            profiles_record = await profiles_collections.find_one({'session_id': session_id})
-            await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"preference": text}}) 
-
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": human_time}})   
+        turn.set_profile({"latest_timestamp": human_time})
 
         if workspace_record['llm'] == 'anythingllm':
-            data = {
-                "message": display_message,
-                "mode": "chat"
-            }
-
-            response = requests.post(url, headers=headers, json=data)
-            response = response.json()
+            response_text = await anythingllm_chat(workspace_record, new_slug, display_message)
 
             input_tokens = len(enc.encode(display_message))
-            output_tokens = len(enc.encode(response['textResponse']))
-
-            now = datetime.now()
-            bot_time = now.strftime("%d/%m/%Y %H:%M:%S")
+            output_tokens = len(enc.encode(response_text))
+        
+        else:
+            reply = await canned_reply(workspace_record, 'language', text)
 
-            message_record = await messages_collections.find_one({"session_id": session_id})
+            if reply:
+                response_text, input_tokens, output_tokens = reply['text'], reply['input_tokens'], reply['output_tokens']
+                await append_history(turn.db, workspace_record, session_id, display_message, response_text)
 
-            message_record['roles'].append({
-                "type": 'ai-agent', "text": response['textResponse'], "timestamp": bot_time,
-                "output_tokens": output_tokens, "sentiment": None, 'id': str(uuid.uuid4())
-            })     
-        
-        else:                        
-            response = chain_with_history.invoke({'input': display_message}, config={
-                "configurable": {"session_id": session_id}
-            })
-            
-            input_tokens, output_tokens = 0, 0
-            if workspace_record['llm'] == 'ollama':
-                input_tokens = response.response_metadata['prompt_eval_count']
-                output_tokens = response.response_metadata['eval_count']
             else:
-                input_tokens = response.response_metadata['token_usage']['prompt_tokens']
-                output_tokens = response.response_metadata['token_usage']['completion_tokens']
-    
-            now = datetime.now()
-            bot_time = now.strftime("%d/%m/%Y %H:%M:%S")
-
-            message_record = await messages_collections.find_one({"session_id": session_id})
+                response = await chain_with_history.ainvoke({'input': display_message}, config = {
+                    "configurable": {"session_id": session_id}
+                })
 
-            message_record['roles'].append({
-                "type": 'ai-agent', "text": response.content, "timestamp": bot_time,
-                "output_tokens": output_tokens, "sentiment": None, 'id': str(uuid.uuid4())
-            })
+                response_text = response.content
+                input_tokens, output_tokens = response_tokens(workspace_record, response)
+    
+        bot_time = current_time()
 
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})  
+        bot_role = new_role('ai-agent', response_text, bot_time, output_tokens = output_tokens)
 
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})
+        turn.append(bot_role)
 
         if configuration_record["client_query"]:
-            data = {
-                'text': display_message
-            }
-
-            try:
-                sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                sentiment_human = json.loads(sentiment.text)
-
-                message_record = await messages_collections.find_one({'session_id': session_id})
-
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'human':
-                        role['sentiment'] = sentiment_human['sentiment'] 
-            except:
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'human':
-                        role['sentiment'] = 'Neutral'
-               
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})   
+            turn.score(human_role)
 
         if configuration_record["bot_response"]:      
-            if workspace_record['llm'] == 'anythingllm':   
-                data = {
-                    'text': response['textResponse']
-                }
-            else:           
-                data = {
-                    'text': response.content
-                }
+            turn.score(bot_role)
 
-            try:
-                sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                sentiment_ai = json.loads(sentiment.text)
+        turn.set_input_tokens(input_tokens)
+        turn.set_profile({"latest_timestamp": bot_time})
 
-                message_record = await messages_collections.find_one({'session_id': session_id})
-
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'ai-agent':
-                        role['sentiment'] = sentiment_ai['sentiment'] 
-            except:
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'ai-agent':
-                        role['sentiment'] = 'Neutral'                            
-
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-
-        message_record = await messages_collections.find_one({'session_id': session_id})
-
-        for role in message_record['roles']:
-            if role['type'] == 'human' and not role['input_tokens']:
-                role['input_tokens'] = input_tokens
-
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})  
-
-        if workspace_record['llm'] == 'anythingllm': 
-            return response['textResponse']
-        else:
-            return response.content
+        return response_text
 
     except HTTPException as e:
         raise e
@@ -550,25 +319,18 @@ async def client_language_message(
         raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
     
 async def client_goodbye_message(
-    bots_record, workspace_record, configuration_record, session_id
+    bots_record, workspace_record, configuration_record, session_id, turn
 ):
     
     try:
-        slug = bots_record['bot_name'] + slug_db
-        db = await connect(slug)
-
-        messages_collections = db['messages']
-        profiles_collections = db['profiles']
-        
-        message_record = await messages_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-        profiles_record = await profiles_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
+        message_record = turn.message_record
+        profiles_record = turn.profiles_record
 
         if not workspace_record['llm'] == 'anythingllm':
-            history_collections = db['history']
+            history_collections = turn.db['history']
             await history_collections.delete_many({'SessionId': session_id})
 
-        now = datetime.now()
-        human_time = now.strftime("%d/%m/%Y %H:%M:%S")
+        human_time = current_time()
 
         if profiles_record['queue'] == 'web':
             if profiles_record['preference'] == language_english:
@@ -587,56 +349,26 @@ async def client_goodbye_message(
 
                 display_message = display_human_end_message_arabic
 
-        if message_record: 
-            if configuration_record["client_query"]:
-                message_record['roles'].append({
-                    "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": input_tokens, 
-                    "sentiment": "Neutral", 'id': str(uuid.uuid4())
-                })
-            else:
-                message_record['roles'].append({
-                    "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": input_tokens, 
-                    "sentiment": None, 'id': str(uuid.uuid4())
-                })
+        sentiment = "Neutral" if configuration_record["client_query"] else None
+        human_role = new_role('human', display_message, human_time, input_tokens = input_tokens, sentiment = sentiment)
 
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+        if message_record: 
+            turn.append(human_role)
 
         else:
-            if configuration_record["client_query"]:
-                temp = {
-                    "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": input_tokens, 
-                    "sentiment": "Neutral", 'id': str(uuid.uuid4())
-                }
-            else:
-                temp = {
-                    "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": input_tokens, 
-                    "sentiment": None, 'id': str(uuid.uuid4())
-                }
-
             if workspace_record['llm'] == 'anythingllm':
-                _, _, new_slug = await anythingllm_connection(workspace_record, message_record)
+                new_slug = await session_thread(workspace_record, message_record, session_id)
             else:
                 new_slug = None
         
-            document = {
-                "session_id": session_id, "roles": [temp], 'timeout': bots_record['timeout'], 'language': None, 'sentiment': None, 
-                'agent_sentiment': None, 'tags': [None], 'slug': new_slug, 'workspace_id': workspace_record['workspace_id'], 
-                'end_conversation': 0, 'transfer_conversation': 0, 'human_intervention': 0, 'agent_expiry': 0, 
-                'latest_timestamp': human_time
-            }
+            turn.create(new_conversation(bots_record, workspace_record, session_id, [human_role], human_time, new_slug))
 
-            await messages_collections.insert_one(document)
-
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+        turn.set_profile({"latest_timestamp": human_time})
 
         if profiles_record['queue'] == 'web':
-            response = await client_goodbye_web_response(bots_record, workspace_record, configuration_record, session_id)
+            response = await client_goodbye_web_response(bots_record, workspace_record, configuration_record, session_id, turn)
         elif profiles_record['queue'] == 'whatsapp':
-            message_record = await messages_collections.find_one({"session_id": session_id})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"end_conversation": 1}})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+            turn.set_fields({"end_conversation": 1, "latest_timestamp": human_time})
 
             response = "Response has been created"
 
@@ -648,131 +380,49 @@ async def client_goodbye_message(
         raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
     
 async def client_goodbye_web_response(
-    bots_record, workspace_record, configuration_record, session_id
+    bots_record, workspace_record, configuration_record, session_id, turn
 ):
     
     try:
-        slug = bots_record['bot_name'] + slug_db
-        db = await connect(slug)
-
-        messages_collections = db['messages']
-        profiles_collections = db['profiles']
-        
-        message_record = await messages_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-        profiles_record = await profiles_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
+        message_record = turn.message_record
+        profiles_record = turn.profiles_record
 
         if workspace_record['llm'] == 'anythingllm':
             if profiles_record['preference'] == language_english:
-                data = {
-                    "message": prompt_goodbye_english,
-                    "mode": "chat"
-                }
+                message = prompt_goodbye_english
             elif profiles_record['preference'] == language_arabic:
-                data = {
-                    "message": prompt_goodbye_arabic,
-                    "mode": "chat"
-                }
-
-            url, headers, _ = await anythingllm_connection(workspace_record, message_record)
-
-            response = requests.post(url, headers=headers, json=data)
-            response = response.json()
+                message = prompt_goodbye_arabic
 
-            output_tokens = len(enc.encode(response['textResponse']))
-
-            now = datetime.now()
-            bot_time = now.strftime("%d/%m/%Y %H:%M:%S")
-            
-            message_record = await messages_collections.find_one({"session_id": session_id})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"end_conversation": 1}})
-
-            message_record['roles'].append({
-                "type": 'ai-agent', "text": response['textResponse'], "timestamp": bot_time, "output_tokens": output_tokens,
-                "sentiment": None, 'id': str(uuid.uuid4())
-            })
+            response_text = await anythingllm_chat(workspace_record, message_record['slug'], message)
+            output_tokens = len(enc.encode(response_text))
         
         else:
 
-            llm = await llm_selection(workspace_record)
+            reply = await canned_reply(workspace_record, 'goodbye', profiles_record['preference'])
 
-            if profiles_record['preference'] == language_english:
-                response = await llm.ainvoke(prompt_goodbye_english)
-            elif profiles_record['preference'] == language_arabic:
-                response = await llm.ainvoke(prompt_goodbye_arabic)
+            if not reply:
+                llm = turn.prefetched.get('llm') or await llm_selection(workspace_record)
+                reply = await generate_reply(workspace_record, 'goodbye', profiles_record['preference'], llm)
 
-            now = datetime.now()
-            bot_time = now.strftime("%d/%m/%Y %H:%M:%S")
+            response_text, input_tokens, output_tokens = reply['text'], reply['input_tokens'], reply['output_tokens']
 
-            message_record = await messages_collections.find_one({"session_id": session_id})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"end_conversation": 1}})
+        bot_time = current_time()
 
-            if workspace_record['llm'] == 'ollama':
-                message_record['roles'].append({
-                    "type": 'ai-agent', "text": response.content, "timestamp": bot_time, 
-                    "output_tokens": response.response_metadata['eval_count'], "sentiment": None, 'id': str(uuid.uuid4())
-                })
-            else:
-                message_record['roles'].append({
-                    "type": 'ai-agent', "text": response.content, "timestamp": bot_time, 
-                    "output_tokens": response.response_metadata['token_usage']['completion_tokens'], "sentiment": None, 'id': str(uuid.uuid4())
-                })
-            
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})
+        bot_role = new_role('ai-agent', response_text, bot_time, output_tokens = output_tokens)
 
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})    
+        turn.append(bot_role, {"end_conversation": 1})
+        turn.set_profile({"latest_timestamp": bot_time})
 
         if configuration_record["bot_response"]:    
-            if workspace_record['llm'] == 'anythingllm':
-                data = {
-                    'text': response['textResponse']
-                }
-            else:             
-                data = {
-                    'text': response.content
-                }
-
-            try:
-                sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                sentiment_ai = json.loads(sentiment.text)
-
-                message_record = await messages_collections.find_one({'session_id': session_id})
-
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'ai-agent':
-                        role['sentiment'] = sentiment_ai['sentiment'] 
-            except:
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'ai-agent':
-                        role['sentiment'] = 'Neutral'                            
+            turn.score(bot_role)
 
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
+        if workspace_record['llm'] != 'anythingllm':
+            turn.set_input_tokens(input_tokens)
 
-        if workspace_record['llm'] == 'anythingllm':
-            await client_summary_anythingllm(
-                workspace_record['company_id'], workspace_record['bot_id'], workspace_record['workspace_id'], session_id
-            )
-
-            return response['textResponse']
-
-        else:
-            message_record = await messages_collections.find_one({'session_id': session_id})
-
-            for role in message_record['roles']:
-                if role['type'] == 'human' and not role['input_tokens']:
-                    if workspace_record['llm'] == 'ollama':
-                        role['input_tokens'] = response.response_metadata['prompt_eval_count']
-                    else:
-                        role['input_tokens'] = response.response_metadata['token_usage']['prompt_tokens']
-
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
+        await turn.flush()
+        await enqueue_job(['summary'], workspace_record, session_id)
         
-            await client_summary_otherllms(
-                workspace_record["company_id"], workspace_record['bot_id'], workspace_record['workspace_id'], session_id
-            )
-        
-            return response.content
+        return response_text
 
     except HTTPException as e:
         raise e
@@ -780,25 +430,18 @@ async def client_goodbye_web_response(
         raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
     
 async def client_transfer_message(
-    bots_record, workspace_record, configuration_record, session_id
+    bots_record, workspace_record, configuration_record, session_id, turn
 ):
     
     try:
-        slug = bots_record['bot_name'] + slug_db
-        db = await connect(slug)
-
-        messages_collections = db['messages']
-        profiles_collections = db['profiles']
-
         if not workspace_record['llm'] == 'anythingllm':
-            history_collections = db['history']
+            history_collections = turn.db['history']
             await history_collections.delete_many({'SessionId': session_id})
 
-        message_record = await messages_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-        profiles_record = await profiles_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
+        message_record = turn.message_record
+        profiles_record = turn.profiles_record
 
-        now = datetime.now()
-        human_time = now.strftime("%d/%m/%Y %H:%M:%S")
+        human_time = current_time()
 
         if profiles_record['preference'] == language_english:
             if workspace_record['llm'] == 'anythingllm':
@@ -816,56 +459,26 @@ async def client_transfer_message(
 
             display_message = display_transfer_message_arabic
 
-        if message_record: 
-            if configuration_record['client_query']:
-                message_record['roles'].append({
-                    "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": input_tokens, 
-                    "sentiment": "Neutral", 'id': str(uuid.uuid4())
-                })
-            else:
-                message_record['roles'].append({
-                    "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": input_tokens, 
-                    "sentiment": None, 'id': str(uuid.uuid4())
-                })
+        sentiment = "Neutral" if configuration_record['client_query'] else None
+        human_role = new_role('human', display_message, human_time, input_tokens = input_tokens, sentiment = sentiment)
 
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+        if message_record: 
+            turn.append(human_role)
         else:
-            if configuration_record['client_query']:
-                temp = {
-                    "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": input_tokens, 
-                    "sentiment": "Neutral", 'id': str(uuid.uuid4())
-                }
-            else:
-                temp = {
-                    "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": input_tokens,
-                    "sentiment": None, 'id': str(uuid.uuid4())
-                }
-
             if workspace_record['llm'] == 'anythingllm':
-                _, _, new_slug = await anythingllm_connection(workspace_record, message_record)
+                new_slug = await session_thread(workspace_record, message_record, session_id)
             else:
                 new_slug = None
         
-            document = {
-                "session_id": session_id, "roles": [temp], 'timeout': bots_record['timeout'], 'language': None, 'sentiment': None,
-                'agent_sentiment': None, 'tags': [None], 'slug': new_slug, 'workspace_id': workspace_record['workspace_id'], 'end_conversation': 0, 
-                'transfer_conversation': 0, 'human_intervention': 0, 'agent_expiry': 0, 'latest_timestamp': human_time
-            }
+            turn.create(new_conversation(bots_record, workspace_record, session_id, [human_role], human_time, new_slug))
 
-            await messages_collections.insert_one(document)
-
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+        turn.set_profile({"latest_timestamp": human_time})
 
         if profiles_record['queue'] == 'web':
-            response = await client_transfer_web_response(bots_record, workspace_record, configuration_record, session_id)
+            response = await client_transfer_web_response(bots_record, workspace_record, configuration_record, session_id, turn)
         
         elif profiles_record['queue'] == 'whatsapp':
-            message_record = await messages_collections.find_one({"session_id": session_id})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"transfer_conversation": 1}})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"end_conversation": 1}})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+            turn.set_fields({"transfer_conversation": 1, "end_conversation": 1, "latest_timestamp": human_time})
 
             response = "Response has been created"
         
@@ -877,145 +490,52 @@ async def client_transfer_message(
         raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
     
 async def client_transfer_web_response(
-    bots_record, workspace_record, configuration_record, session_id
+    bots_record, workspace_record, configuration_record, session_id, turn
 ):
     
     try:
-        slug = bots_record['bot_name'] + slug_db
-        db = await connect(slug)
-
-        messages_collections = db['messages']
-        profiles_collections = db['profiles']
-        
-        message_record = await messages_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-        profiles_record = await profiles_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
+        message_record = turn.message_record
+        profiles_record = turn.profiles_record
 
         if workspace_record['llm'] == 'anythingllm':
             if profiles_record['preference'] == language_english:
-                data = {
-                    "message": prompt_transfer_english,
-                    "mode": "chat"
-                }
+                message = prompt_transfer_english
             elif profiles_record['preference'] == language_arabic:
-                data = {
-                    "message": prompt_transfer_arabic,
-                    "mode": "chat"
-                }
-
-            url, headers, _ = await anythingllm_connection(workspace_record, message_record)
-
-            response = requests.post(url, headers=headers, json=data)
-            response = response.json()
-
-            output_tokens = len(enc.encode(response['textResponse']))
-
-            now = datetime.now()
-            bot_time = now.strftime("%d/%m/%Y %H:%M:%S")
-            
-            message_record = await messages_collections.find_one({"session_id": session_id})
-
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"transfer_conversation": 1}})                
+                message = prompt_transfer_arabic
 
-            message_record['roles'].append({
-                "type": 'ai-agent', "text": response['textResponse'], "timestamp": bot_time, "output_tokens": output_tokens, 
-                "sentiment": None, 'id': str(uuid.uuid4())
-            })
+            response_text = await anythingllm_chat(workspace_record, message_record['slug'], message)
+            output_tokens = len(enc.encode(response_text))
 
         else:
-            llm = await llm_selection(workspace_record)
+            reply = await canned_reply(workspace_record, 'transfer', profiles_record['preference'])
 
-            response = None
-            if profiles_record['preference'] == language_english:
-                response = await llm.ainvoke(prompt_transfer_english)
-            elif profiles_record['preference'] == language_arabic:
-                response = await llm.ainvoke(prompt_transfer_arabic)
+            if not reply:
+                llm = turn.prefetched.get('llm') or await llm_selection(workspace_record)
+                reply = await generate_reply(workspace_record, 'transfer', profiles_record['preference'], llm)
 
-            now = datetime.now()
-            bot_time = now.strftime("%d/%m/%Y %H:%M:%S")
+            response_text, input_tokens, output_tokens = reply['text'], reply['input_tokens'], reply['output_tokens']
 
-            message_record = await messages_collections.find_one({"session_id": session_id})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"transfer_conversation": 1}})
-
-            if workspace_record['llm'] == 'ollama':
-                message_record['roles'].append({
-                    "type": 'ai-agent', "text": response.content.replace('"', ''), "timestamp": bot_time, 
-                    "output_tokens": response.response_metadata['eval_count'], "sentiment": None, 'id': str(uuid.uuid4())
-                })
-            else:
-                message_record['roles'].append({
-                    "type": 'ai-agent', "text": response.content.replace('"', ''), "timestamp": bot_time, 
-                    "output_tokens": response.response_metadata['token_usage']['completion_tokens'], "sentiment": None, 
-                    'id': str(uuid.uuid4())
-                })
+        bot_time = current_time()
 
         if configuration_record['auto_assignment']:
             queue = transfer_queue + f":{workspace_record['bot_id']}:{workspace_record['workspace_id']}"
             await enqueue(session_id, queue)
 
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})
+        bot_role = new_role('ai-agent', response_text, bot_time, output_tokens = output_tokens)
 
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})
+        turn.append(bot_role, {"transfer_conversation": 1})
+        turn.set_profile({"latest_timestamp": bot_time})
 
         if configuration_record["bot_response"]:    
-            if workspace_record['llm'] == 'anythingllm':
-                data = {
-                    'text': response['textResponse']
-                }
-            else:             
-                data = {
-                    'text': response.content
-                }
+            turn.score(bot_role)
 
-            try:
-                sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                sentiment_ai = json.loads(sentiment.text)
+        if workspace_record['llm'] != 'anythingllm':
+            turn.set_input_tokens(input_tokens)
 
-                message_record = await messages_collections.find_one({'session_id': session_id})
+        await turn.flush()
+        await enqueue_job(['summary', 'suggestions'], workspace_record, session_id)
 
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'ai-agent':
-                        role['sentiment'] = sentiment_ai['sentiment'] 
-            except:
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'ai-agent':
-                        role['sentiment'] = 'Neutral'                            
-
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-
-        if workspace_record['llm'] == 'anythingllm':
-            await client_summary_anythingllm(
-                workspace_record['company_id'], workspace_record['bot_id'], workspace_record['workspace_id'], session_id
-            )
-            
-            await client_suggestions_anythingllm(
-                workspace_record['company_id'], workspace_record['bot_id'], workspace_record['workspace_id'], session_id
-            )
-
-            return response['textResponse']
-        
-        else:
-            message_record = await messages_collections.find_one({'session_id': session_id})
-
-            for role in message_record['roles']:
-                if role['type'] == 'human' and not role['input_tokens']:
-                    if workspace_record['llm'] == 'ollama':
-                        role['input_tokens'] = response.response_metadata['prompt_eval_count']
-                    else:
-                        role['input_tokens'] = response.response_metadata['token_usage']['prompt_tokens']
-
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-
-            await client_summary_otherllms( 
-                workspace_record["company_id"], workspace_record['bot_id'], workspace_record['workspace_id'], session_id
-            )
-
-            await client_suggestions_otherllms( 
-                workspace_record["company_id"], workspace_record['bot_id'], workspace_record['workspace_id'], session_id
-            )
-
-            return response.content
+        return response_text
     
     except HTTPException as e:
         raise e
@@ -1023,39 +543,22 @@ async def client_transfer_web_response(
         raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
     
 async def client_conversation(
-    text, bots_record, workspace_record, embeddings_record, configuration_record, session_id
+    text, bots_record, workspace_record, embeddings_record, configuration_record, session_id, turn
 ):
     
     try:
-        slug = bots_record['bot_name'] + slug_db
-        db = await connect(slug)
-
-        chat_limit = int(workspace_record['chat_limit']) * 2
-
-        if not workspace_record['llm'] == 'anythingllm':
-            history_collections = db['history']
-            history_records = await history_collections.find({'SessionId': session_id}, sort=[("_id", pymongo.DESCENDING)]).to_list(length=None)
-
-            if len(history_records) > chat_limit:
-                records_to_remove = history_records[chat_limit-6:chat_limit-4]
-                record_ids_to_remove = [record['_id'] for record in records_to_remove]
-
-                await history_collections.delete_many({'_id': {'$in': record_ids_to_remove}})
-
-            llm = await llm_selection(workspace_record)
-
         if workspace_record['llm'] == 'anythingllm':
             response = await anythingllm_conversation(
-                text, bots_record, workspace_record, configuration_record, session_id
+                text, bots_record, workspace_record, configuration_record, session_id, turn
             )
         else:
             if embeddings_record:
                 response = await embedding_conversation_chain(
-                    bots_record, workspace_record, configuration_record, session_id, text
+                    bots_record, workspace_record, configuration_record, session_id, text, turn
                 )
             else:
                 response = await non_embedding_conversation_chain(
-                    bots_record, workspace_record, configuration_record, session_id, text                
+                    bots_record, workspace_record, configuration_record, session_id, text, turn
                 )
             
         return response
@@ -1064,145 +567,59 @@ async def client_conversation(
         raise e
     except Exception as e:
         raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
-
+    
 async def anythingllm_conversation(
-    text, bots_record, workspace_record, configuration_record, session_id
+    text, bots_record, workspace_record, configuration_record, session_id, turn
 ):
     
     try:
-        slug = bots_record['bot_name'] + slug_db
-        db = await connect(slug)
+        message_record = turn.message_record
 
-        messages_collections = db['messages']
-        profiles_collections = db['profiles']
-        
-        message_record = await messages_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-        profiles_record = await profiles_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
+        new_slug = await session_thread(workspace_record, message_record, session_id)
 
-        url, headers, new_slug = await anythingllm_connection(workspace_record, message_record)
-
-        now = datetime.now()
-        human_time = now.strftime("%d/%m/%Y %H:%M:%S")
+        human_time = current_time()
 
         input_tokens = len(enc.encode(text))
+        human_role = new_role('human', text, human_time, input_tokens = input_tokens)
 
-        message_record = await messages_collections.find_one({"session_id": session_id})
         if message_record: 
-            message_record['roles'].append({
-                "type": 'human', "text": text, "timestamp": human_time, "input_tokens": input_tokens, "sentiment": None, 'id': str(uuid.uuid4())
-            })
-
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+            turn.append(human_role)
 
         else:
-            document = {"session_id": session_id, "roles": [{
-                "type": 'human', "text": text, "timestamp": human_time, "input_tokens": input_tokens, "sentiment": None, 
-                'id': str(uuid.uuid4())}], 'timeout': bots_record['timeout'], 'language': None, 'sentiment': None, 'agent_sentiment': None, 
-                'tags': [None], 'slug': new_slug, 'workspace_id': workspace_record['workspace_id'], 'end_conversation': 0, 
-                'transfer_conversation': 0, 'human_intervention': 0, 'agent_expiry': 0, 'latest_timestamp': human_time
-            }
+            turn.create(new_conversation(bots_record, workspace_record, session_id, [human_role], human_time, new_slug))
 
-            await messages_collections.insert_one(document)
-
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": human_time}})  
+        turn.set_profile({"latest_timestamp": human_time})
     
-        data = {
-            "message": text,
-            "mode": "chat"
-        }
-
-        response = requests.post(url, headers=headers, json=data)
-        response = response.json()
-
-        output_tokens = len(enc.encode(response['textResponse']))
-
-        now = datetime.now()
-        bot_time = now.strftime("%d/%m/%Y %H:%M:%S")
+        response_text = await anythingllm_chat(workspace_record, new_slug, text)
 
-        message_record = await messages_collections.find_one({"session_id": session_id})
+        output_tokens = len(enc.encode(response_text))
 
-        message_record['roles'].append({
-            "type": 'ai-agent', "text": response['textResponse'], "timestamp": bot_time, "output_tokens": output_tokens, "sentiment": None, 
-            'id': str(uuid.uuid4())
-        })
+        bot_time = current_time()
 
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})  
+        bot_role = new_role('ai-agent', response_text, bot_time, output_tokens = output_tokens)
 
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})
+        turn.append(bot_role)
+        turn.set_profile({"latest_timestamp": bot_time})
 
         if configuration_record['client_query']:
-            data = {
-                'text': text
-            }
-
-            try:
-                sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                sentiment_human = json.loads(sentiment.text)
-
-                message_record = await messages_collections.find_one({'session_id': session_id})
-
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'human':
-                        role['sentiment'] = sentiment_human['sentiment'] 
-            except:
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'human':
-                        role['sentiment'] = 'Neutral'
-                        
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})  
+            turn.score(human_role)
 
         if configuration_record['bot_response']:
-            data = {
-                'text': response['textResponse']
-            }
+            turn.score(bot_role)
 
-            try:
-                sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                sentiment_ai = json.loads(sentiment.text)
-
-                message_record = await messages_collections.find_one({'session_id': session_id})
-
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'ai-agent':
-                        role['sentiment'] = sentiment_ai['sentiment'] 
-            except:
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'ai-agent':
-                        role['sentiment'] = 'Neutral'                            
-
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})  
-
-        return response['textResponse']
+        return response_text
             
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")   
-
+    
 async def non_embedding_conversation_chain(
-    bots_record, workspace_record, configuration_record, session_id, text
+    bots_record, workspace_record, configuration_record, session_id, text, turn
 ):
     
     try:
-        slug = bots_record['bot_name'] + slug_db
-        db = await connect(slug)
-
-        messages_collections = db['messages']
-        profiles_collections = db['profiles']
-        
-        message_record = await messages_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-        profiles_record = await profiles_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-
-        host = config("DATABASE_HOST")
-        username = config("DATABASE_USERNAME")
-        password = config("DATABASE_PASSWORD")
-
-        username = urllib.parse.quote_plus(username)
-        password = urllib.parse.quote_plus(password)
+        message_record = turn.message_record
 
         non_rag_prompt = workspace_record['system_prompt']
 
@@ -1214,137 +631,46 @@ async def non_embedding_conversation_chain(
             ]
         )
 
-        llm = await llm_selection(workspace_record)
+        llm = turn.prefetched.get('llm') or await llm_selection(workspace_record)
 
         runnable = qa_prompt | llm
 
-        if username and password:
-            chain_with_history = RunnableWithMessageHistory(
-                runnable,
-                lambda session_id: get_limited_message_history(
-                    session_id = session_id,
-                    connection_string = f"mongodb://{username}:{password}@{host}:27017",
-                    database_name = f"{bots_record['bot_name'] + slug_db}",
-                    collection_name = "history"
-                ),
-                input_messages_key="input",
-                history_messages_key="chat_history"
-            )
-
-        else:
-            chain_with_history = RunnableWithMessageHistory(
-                runnable,
-                lambda session_id: get_limited_message_history(
-                    session_id = session_id,
-                    connection_string = f"mongodb://{host}:27017",
-                    database_name = f"{bots_record['bot_name'] + slug_db}",
-                    collection_name = "history"
-                ),
-                input_messages_key="input",
-                history_messages_key="chat_history" 
-            )
+        chain_with_history = RunnableWithMessageHistory(
+            runnable,
+            lambda session_id: get_limited_message_history(session_id, bots_record['bot_name'] + slug_db, token_budget = history_budget(workspace_record)),
+            input_messages_key = "input",
+            history_messages_key = "chat_history"
+        )
 
-        now = datetime.now()
-        human_time = now.strftime("%d/%m/%Y %H:%M:%S")
+        human_time = current_time()
+        human_role = new_role('human', text, human_time, input_tokens = None)
 
-        message_record = await messages_collections.find_one({"session_id": session_id})
         if message_record: 
-            message_record['roles'].append({
-                "type": 'human', "text": text, "timestamp": human_time, "input_tokens": None, "sentiment": None, 'id': str(uuid.uuid4())
-            })
-
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+            turn.append(human_role)
 
         else:
-            document = {"session_id": session_id, "roles": [{
-                "type": 'human', "text": text, "timestamp": human_time, "input_tokens": None, "sentiment": None, 'id': str(uuid.uuid4())
-                }], 'timeout': bots_record['timeout'], 'language': None, 'sentiment': None, 'agent_sentiment': None, 'tags': [None], 
-                'slug': None, 'workspace_id': workspace_record['workspace_id'], 'end_conversation': 0, 'transfer_conversation': 0, 
-                'human_intervention': 0, 'agent_expiry': 0, 'latest_timestamp': human_time}
-            
-            await messages_collections.insert_one(document)
+            turn.create(new_conversation(bots_record, workspace_record, session_id, [human_role], human_time))
 
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": human_time}})                    
+        turn.set_profile({"latest_timestamp": human_time})
 
-        response = chain_with_history.invoke({'input': text}, config={
-            "configurable": {"session_id": session_id}
-        })
+        response = await run_chain(chain_with_history, text, session_id, turn)
         
-        input_tokens, output_tokens = 0, 0
-        if workspace_record['llm'] == 'ollama':
-            input_tokens = response.response_metadata['prompt_eval_count']
-            output_tokens = response.response_metadata['eval_count']
-        else:
-            input_tokens = response.response_metadata['token_usage']['prompt_tokens']
-            output_tokens = response.response_metadata['token_usage']['completion_tokens']
+        input_tokens, output_tokens = response_tokens(workspace_record, response)
     
-        now = datetime.now()
-        bot_time = now.strftime("%d/%m/%Y %H:%M:%S")
-
-        message_record = await messages_collections.find_one({"session_id": session_id})
-
-        message_record['roles'].append({
-            "type": 'ai-agent', "text": response.content, "timestamp": bot_time, "output_tokens": output_tokens, 
-            "sentiment": None, 'id': str(uuid.uuid4())
-        })
+        bot_time = current_time()
 
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})  
+        bot_role = new_role('ai-agent', response.content, bot_time, output_tokens = output_tokens)
 
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})
+        turn.append(bot_role)
+        turn.set_profile({"latest_timestamp": bot_time})
 
         if configuration_record['client_query']:
-            data = {
-                'text': text
-            }
-
-            try:
-                sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                sentiment_human = json.loads(sentiment.text)
-
-                message_record = await messages_collections.find_one({'session_id': session_id})
-
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'human':
-                        role['sentiment'] = sentiment_human['sentiment'] 
-            except:
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'human':
-                        role['sentiment'] = 'Neutral'
-                        
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})   
+            turn.score(human_role)
 
         if configuration_record['bot_response']:                       
-            data = {
-                'text': response.content
-            }
+            turn.score(bot_role)
 
-            try:
-                sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                sentiment_ai = json.loads(sentiment.text)
-
-                message_record = await messages_collections.find_one({'session_id': session_id})
-
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'ai-agent':
-                        role['sentiment'] = sentiment_ai['sentiment'] 
-            except:
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'ai-agent':
-                        role['sentiment'] = 'Neutral'                            
-
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})  
-
-        message_record = await messages_collections.find_one({'session_id': session_id})
-
-        for role in message_record['roles']:
-            if role['type'] == 'human' and not role['input_tokens']:
-                role['input_tokens'] = input_tokens
-
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})   
+        turn.set_input_tokens(input_tokens)
 
         return response.content
 
@@ -1354,29 +680,24 @@ async def non_embedding_conversation_chain(
         raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
     
 async def embedding_conversation_chain(
-    bots_record, workspace_record, configuration_record, session_id, text
+    bots_record, workspace_record, configuration_record, session_id, text, turn
 ):
     
     try:
-        slug = bots_record['bot_name'] + slug_db
-        db = await connect(slug)
-
-        messages_collections = db['messages']
-        profiles_collections = db['profiles']
-        
-        message_record = await messages_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-        profiles_record = await profiles_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
+        message_record = turn.message_record
 
-        host = config("DATABASE_HOST")
-        username = config("DATABASE_USERNAME")
-        password = config("DATABASE_PASSWORD")
+        embeddings, vectorstore, lexical = turn.prefetched.get('vectorstore') or await embeddings_and_vectordb_selection(workspace_record)
 
-        username = urllib.parse.quote_plus(username)
-        password = urllib.parse.quote_plus(password)
+        if configuration_record.get('semantic_cache'):
+            question_vector = await embeddings.aembed_query(text)
 
-        _, vectorstore = await embeddings_and_vectordb_selection(workspace_record)
+            cached_answer = lookup_answer(workspace_record, configuration_record, question_vector)
+            if cached_answer:
+                return await cached_answer_conversation(
+                    bots_record, workspace_record, configuration_record, session_id, text, cached_answer, turn
+                )
 
-        retriever = vectorstore.as_retriever(search_kwargs={"k": int(workspace_record['k_retreive'])})
+        retriever = packed_retriever(hybrid_retriever(vectorstore, lexical, int(workspace_record['k_retreive'])), workspace_record)
 
         rag_prompt = workspace_record['system_prompt'] + '\n\n{context}'
 
@@ -1388,66 +709,31 @@ async def embedding_conversation_chain(
             ]
         )
 
-        llm = await llm_selection(workspace_record)
+        llm = turn.prefetched.get('llm') or await llm_selection(workspace_record)
 
         question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
         rag_chain = create_retrieval_chain(retriever, question_answer_chain)
 
-        if username and password:
-            chain_with_history = RunnableWithMessageHistory(
-                rag_chain,
-                lambda session_id: get_limited_message_history(
-                    session_id=session_id,
-                    connection_string = f"mongodb://{username}:{password}@{host}:27017",
-                    database_name=f"{bots_record['bot_name'] + slug_db}",
-                    collection_name="history"
-                ),
-                input_messages_key="input",
-                history_messages_key="chat_history",    
-                output_messages_key="answer"    
-            )
-
-        else:
-            chain_with_history = RunnableWithMessageHistory(
-                rag_chain,
-                lambda session_id: get_limited_message_history(
-                    session_id=session_id,
-                    connection_string=f"mongodb://{host}:27017",
-                    database_name=f"{bots_record['bot_name'] + slug_db}",
-                    collection_name="history"
-                ),
-                input_messages_key="input",
-                history_messages_key="chat_history", 
-                output_messages_key="answer"       
-            )
+        chain_with_history = RunnableWithMessageHistory(
+            rag_chain,
+            lambda session_id: get_limited_message_history(session_id, bots_record['bot_name'] + slug_db, token_budget = history_budget(workspace_record)),
+            input_messages_key = "input",
+            history_messages_key = "chat_history",
+            output_messages_key = "answer"
+        )
 
-        now = datetime.now()
-        human_time = now.strftime("%d/%m/%Y %H:%M:%S")
+        human_time = current_time()
+        human_role = new_role('human', text, human_time, input_tokens = None)
 
-        message_record = await messages_collections.find_one({"session_id": session_id})
         if message_record: 
-            message_record['roles'].append({
-                "type": 'human', "text": text, "timestamp": human_time, "input_tokens": None, "sentiment": None, 'id': str(uuid.uuid4())
-            })
-
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+            turn.append(human_role)
 
         else:
-            document = {"session_id": session_id, "roles": [{
-                "type": 'human', "text": text, "timestamp": human_time, "input_tokens": None, "sentiment": None, 'id': str(uuid.uuid4())
-                }], 'timeout': bots_record['timeout'], 'language': None, 'sentiment': None, 'agent_sentiment': None, 'tags': [None], 
-                'slug': None, 'workspace_id': workspace_record['workspace_id'], 'end_conversation': 0, 'transfer_conversation': 0, 
-                'human_intervention': 0, 'agent_expiry': 0, 'latest_timestamp': human_time}
-            
-            await messages_collections.insert_one(document)
+            turn.create(new_conversation(bots_record, workspace_record, session_id, [human_role], human_time))
 
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": human_time}})                      
+        turn.set_profile({"latest_timestamp": human_time})
 
-        response = chain_with_history.invoke({'input': text}, config={
-            "configurable": {"session_id": session_id}
-        })
+        response = await run_chain(chain_with_history, text, session_id, turn, 'answer')
 
         prompt_tokens = len(enc.encode(workspace_record['system_prompt'])) + 3
         user_tokens = len(enc.encode(response['input'])) + 3
@@ -1465,75 +751,65 @@ async def embedding_conversation_chain(
         tokens = enc.encode(response['answer'])
         output_tokens += len(tokens)
 
-        now = datetime.now()
-        bot_time = now.strftime("%d/%m/%Y %H:%M:%S")
-
-        message_record = await messages_collections.find_one({"session_id": session_id})
-
-        message_record['roles'].append({
-            "type": 'ai-agent', "text": response['answer'], "timestamp": bot_time, "output_tokens": output_tokens, 
-            "sentiment": None, 'id': str(uuid.uuid4())
-        })
+        bot_time = current_time()
 
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})  
+        bot_role = new_role('ai-agent', response['answer'], bot_time, output_tokens = output_tokens)
 
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})
+        turn.append(bot_role)
+        turn.set_profile({"latest_timestamp": bot_time})
 
         if configuration_record['client_query']:
-            data = {
-                'text': text
-            }
-
-            try:
-                sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                sentiment_human = json.loads(sentiment.text)
-
-                message_record = await messages_collections.find_one({'session_id': session_id})
-
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'human':
-                        role['sentiment'] = sentiment_human['sentiment'] 
-            except:
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'human':
-                        role['sentiment'] = 'Neutral'
-                        
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})  
+            turn.score(human_role)
 
         if configuration_record['bot_response']:                    
-            data = {
-                'text': response['answer']
-            }
+            turn.score(bot_role)
 
-            try:
-                sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                sentiment_ai = json.loads(sentiment.text)
+        turn.set_input_tokens(input_tokens)
 
-                message_record = await messages_collections.find_one({'session_id': session_id})
+        if configuration_record.get('semantic_cache'):
+            store_answer(workspace_record, text, question_vector, response['answer'])
 
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'ai-agent':
-                        role['sentiment'] = sentiment_ai['sentiment'] 
-            except:
-                for role in message_record['roles']:
-                    if not role['sentiment'] and role['type'] == 'ai-agent':
-                        role['sentiment'] = 'Neutral'                            
+        return response['answer']
 
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
 
-        message_record = await messages_collections.find_one({'session_id': session_id})
+async def cached_answer_conversation(
+    bots_record, workspace_record, configuration_record, session_id, text, answer, turn
+):
+    
+    try:
+        message_record = turn.message_record
 
-        for role in message_record['roles']:
-            if role['type'] == 'human' and not role['input_tokens']:
-                role['input_tokens'] = input_tokens
+        human_time = current_time()
+        human_role = new_role('human', text, human_time, input_tokens = 0, cached = True)
 
-        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})          
+        if message_record: 
+            turn.append(human_role)
 
-        return response['answer']
+        else:
+            turn.create(new_conversation(bots_record, workspace_record, session_id, [human_role], human_time))
+
+        await append_history(turn.db, workspace_record, session_id, text, answer)
+
+        bot_time = current_time()
+
+        bot_role = new_role('ai-agent', answer, bot_time, output_tokens = 0)
+
+        turn.append(bot_role)
+        turn.set_profile({"latest_timestamp": bot_time})
+
+        if configuration_record['client_query']:
+            turn.score(human_role)
+
+        if configuration_record['bot_response']:                    
+            turn.score(bot_role)
+
+        return answer
 
     except HTTPException as e:
         raise e
     except Exception as e:
-        raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
@@ -0,0 +1,249 @@
+import uuid, asyncio, logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+from decouple import config
+from pymongo import UpdateOne
+
+from utilities.database import connect
+from utilities.timing import StageTimings
+from utilities.live_sessions import track_session
+from routers.chats.utilities.sentiment import sentiment_analysis
+
+logger = logging.getLogger(__name__)
+
+slug_db = config("SLUG_DATABASE")
+
+scoring_tasks = set()
+
+timestamp_format = '%d/%m/%Y %H:%M:%S'
+
+UNSCORED = [None, '']
+UNCOUNTED = [None, 0]
+
+def current_time():
+    return datetime.now().strftime(timestamp_format)
+
+def new_role(role_type, text, timestamp, **fields):
+    role = {"type": role_type, "text": text, "timestamp": timestamp}
+    role.update(fields)
+    role.setdefault("sentiment", None)
+    role['id'] = str(uuid.uuid4())
+
+    return role
+
+def new_conversation(bots_record, workspace_record, session_id, roles, timestamp, slug = None):
+    return {
+        "session_id": session_id, "roles": roles, 'timeout': bots_record['timeout'], 'language': None, 'sentiment': None,
+        'agent_sentiment': None, 'tags': [None], 'slug': slug, 'workspace_id': workspace_record['workspace_id'],
+        'end_conversation': 0, 'transfer_conversation': 0, 'human_intervention': 0, 'agent_expiry': 0,
+        'latest_timestamp': timestamp
+    }
+
+def push_roles_update(roles, timestamp, fields = None):
+    update = {"$push": {"roles": {"$each": roles}}, "$set": {"latest_timestamp": timestamp}}
+    if fields:
+        update["$set"].update(fields)
+
+    return update
+
+def sentiment_update(role_type, sentiment):
+    update = {"$set": {"roles.$[role].sentiment": sentiment}}
+    array_filters = [{"role.type": role_type, "role.sentiment": {"$in": UNSCORED}}]
+
+    return update, array_filters
+
+def role_sentiment_update(role_id, sentiment):
+    update = {"$set": {"roles.$[role].sentiment": sentiment}}
+    array_filters = [{"role.id": role_id}]
+
+    return update, array_filters
+
+def input_tokens_update(input_tokens):
+    update = {"$set": {"roles.$[role].input_tokens": input_tokens}}
+    # A role answered from the answer cache keeps its 0, it cost no LLM input
+    array_filters = [{"role.type": 'human', "role.input_tokens": {"$in": UNCOUNTED}, "role.cached": {"$ne": True}}]
+
+    return update, array_filters
+
+async def append_roles(messages_collections, session_id, roles, timestamp, fields = None):
+    await messages_collections.update_one({"session_id": session_id}, push_roles_update(roles, timestamp, fields))
+
+async def append_role(messages_collections, session_id, role, fields = None):
+    await append_roles(messages_collections, session_id, [role], role['timestamp'], fields)
+
+async def set_sentiment(messages_collections, session_id, role_type, sentiment):
+    update, array_filters = sentiment_update(role_type, sentiment)
+    await messages_collections.update_one({"session_id": session_id}, update, array_filters = array_filters)
+
+async def set_role_sentiment(messages_collections, session_id, role_id, sentiment):
+    update, array_filters = role_sentiment_update(role_id, sentiment)
+    await messages_collections.update_one({"session_id": session_id}, update, array_filters = array_filters)
+
+async def set_input_tokens(messages_collections, session_id, input_tokens):
+    update, array_filters = input_tokens_update(input_tokens)
+    await messages_collections.update_one({"session_id": session_id}, update, array_filters = array_filters)
+
+async def set_fields(messages_collections, session_id, fields):
+    await messages_collections.update_one({"session_id": session_id}, {"$set": fields})
+
+async def score_role(messages_collections, session_id, role):
+    sentiment = await sentiment_analysis(role['text'])
+
+    try:
+        await set_role_sentiment(messages_collections, session_id, role['id'], sentiment)
+    except:
+        pass
+
+def score_role_later(messages_collections, session_id, role):
+    task = asyncio.create_task(score_role(messages_collections, session_id, role))
+
+    scoring_tasks.add(task)
+    task.add_done_callback(scoring_tasks.discard)
+
+    return task
+
+async def drain_scoring():
+    if scoring_tasks:
+        await asyncio.gather(*scoring_tasks, return_exceptions = True)
+
+class ConversationTurn:
+    def __init__(self, db, workspace_id, session_id, stream = None):
+        self.db = db
+        self.messages_collections = db['messages']
+        self.profiles_collections = db['profiles']
+        self.workspace_id = workspace_id
+        self.session_id = session_id
+
+        self.message_record = None
+        self.profiles_record = None
+
+        self.document = None
+        self.roles = []
+        self.message_fields = {}
+        self.patches = []
+        self.profile_fields = {}
+        self.scoring = []
+
+        self.prefetched = {}
+        self.timings = StageTimings()
+        self.stream = stream
+
+    async def load(self):
+        query = {"workspace_id": self.workspace_id, "session_id": self.session_id}
+        self.message_record, self.profiles_record = await asyncio.gather(
+            self.messages_collections.find_one(query), self.profiles_collections.find_one(query)
+        )
+
+        return self
+
+    def create(self, document):
+        self.document = document
+        self.message_record = document
+
+    def append(self, role, fields = None):
+        fields = {"latest_timestamp": role['timestamp'], **(fields or {})}
+
+        self.message_record['roles'].append(role)
+        self.message_record.update(fields)
+
+        if not self.document:
+            self.roles.append(role)
+            self.message_fields.update(fields)
+
+    def set_fields(self, fields):
+        self.message_record.update(fields)
+
+        if not self.document:
+            self.message_fields.update(fields)
+
+    def set_profile(self, fields):
+        self.profiles_record.update(fields)
+        self.profile_fields.update(fields)
+
+    def set_sentiment(self, role_type, sentiment):
+        for role in self.pending_roles():
+            if role['type'] == role_type and role.get('sentiment') in UNSCORED:
+                role['sentiment'] = sentiment
+
+        if not self.document:
+            self.patches.append(sentiment_update(role_type, sentiment))
+
+    def set_input_tokens(self, input_tokens):
+        for role in self.pending_roles():
+            if role['type'] == 'human' and role.get('input_tokens') in UNCOUNTED and not role.get('cached'):
+                role['input_tokens'] = input_tokens
+
+        if not self.document:
+            self.patches.append(input_tokens_update(input_tokens))
+
+    def emit(self, event, data):
+        if self.stream is not None:
+            self.stream.put_nowait((event, data))
+
+    def score(self, role):
+        self.scoring.append(role)
+
+    def pending_roles(self):
+        return self.document['roles'] if self.document else self.roles
+
+    async def flush(self):
+        query = {"session_id": self.session_id}
+        writes = []
+
+        if self.document:
+            writes.append(self.messages_collections.insert_one(self.document))
+        else:
+            operations = []
+
+            update = {}
+            if self.roles:
+                update["$push"] = {"roles": {"$each": self.roles}}
+            if self.message_fields:
+                update["$set"] = self.message_fields
+            if update:
+                operations.append(UpdateOne(query, update))
+
+            for update, array_filters in self.patches:
+                operations.append(UpdateOne(query, update, array_filters = array_filters))
+
+            if operations:
+                writes.append(self.messages_collections.bulk_write(operations, ordered = True))
+
+        if self.document or self.roles or self.message_fields:
+            writes.append(track_session(self.db.name, self.message_record))
+
+        if self.profile_fields and self.profiles_record:
+            writes.append(self.profiles_collections.update_one({"_id": self.profiles_record["_id"]}, {"$set": self.profile_fields}))
+
+        if writes:
+            await asyncio.gather(*writes)
+
+        for role in self.scoring:
+            score_role_later(self.messages_collections, self.session_id, role)
+
+        self.discard()
+
+    def discard(self):
+        self.document = None
+        self.roles = []
+        self.message_fields = {}
+        self.patches = []
+        self.profile_fields = {}
+        self.scoring = []
+
+@asynccontextmanager
+async def conversation_turn(bots_record, workspace_record, session_id, stream = None):
+    db = await connect(bots_record['bot_name'] + slug_db)
+    turn = ConversationTurn(db, workspace_record['workspace_id'], session_id, stream)
+
+    # A turn that fails part way writes nothing it staged, so the conversation
+    # is never left with a question and no answer
+    try:
+        yield turn
+    except BaseException:
+        turn.discard()
+        logger.info(f"Chat turn {session_id} failed, stage timings (ms): {turn.timings.stages}")
+        raise
+
+    await turn.timings.measure('flush', turn.flush())
+    logger.info(f"Chat turn {session_id} stage timings (ms): {turn.timings.stages}")
@@ -1,10 +1,4 @@
-import json, uuid, requests, sqlite3, torch
-from langchain_community.vectorstores import FAISS, LanceDB
-from langchain_chroma import Chroma
-from lancedb.rerankers import LinearCombinationReranker
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_huggingface import HuggingFaceEmbeddings
+import sqlite3, asyncio
 from typing_extensions import TypedDict, Annotated
 from typing import Annotated, Optional
 from langgraph.prebuilt import tools_condition, ToolNode
@@ -22,9 +16,15 @@ from decouple import config
 
 from utilities.database import connect
 from utilities.redis import enqueue
+from utilities.vectorstores import cached_retrieval
+from utilities.hybrid import hybrid_retriever
+from utilities.context import pack_context, context_budget
+from utilities.llm import response_tokens
+from utilities.canned import canned_reply, canned_message
 from routers.chats.utilities.client import agent_involved_chat, max_allowed_chats, llm_selection
-from routers.chats.utilities.summary import client_summary_otherllms
-from routers.chats.utilities.suggestions import client_suggestions_otherllms
+from routers.chats.utilities.conversation import current_time, new_role, new_conversation, conversation_turn
+from routers.chats.utilities.jobs import enqueue_job
+from routers.chats.utilities.session_lock import session_lock, merged_result
 
 host = config("DATABASE_HOST")
 username = config("DATABASE_USERNAME")
@@ -58,14 +58,6 @@ prompt_transfer_arabic = config("PROMPT_TRANSFER_ARABIC")
 
 transfer_queue = config("TRANSFER_QUEUE")
 
-sentiment_url = config("SENTIMENT_URL")
-x_app_key = config("X_APP_KEY")
-
-sentiment_headers = {
-    'x-app-key': x_app_key,
-    'x-super-team': '100'
-}
-
 class State(TypedDict):
     messages: Annotated[list[AnyMessage], add_messages]
 
@@ -73,8 +65,6 @@ db_booking = 'massage_booking.db'
 
 ALLOWED_MASSAGE_TYPES = ['Foot', 'Swedish', 'Deep Tissue', 'Sports']
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
-
 def handle_tool_error(state) -> dict:
     error = state.get("error")
     tool_calls = state["messages"][-1].tool_calls
@@ -136,33 +126,14 @@ async def massage_information_retrieval(query: str, config: RunnableConfig):
     if not company_id or not bot_id or not workspace_id:
         return f"Sorry, there was a problem with the configuration. Can you please try again"    
 
-    path = f"library/{company_id}/{bot_id}/{workspace_id}/embeddings"
-
     db = await connect()
     workspace_collections = db['workspace']
     
     workspace_record = await workspace_collections.find_one({"bot_id": bot_id, "workspace_id": workspace_id, "is_active": 1})
-    if workspace_record['embeddings'] == 'openai':
-        embeddings = OpenAIEmbeddings(model = workspace_record['embeddings_model'], openai_api_key = workspace_record['embeddings_api_key'])
-    elif workspace_record['embeddings'] == 'huggingface':
-        embeddings = HuggingFaceEmbeddings(
-            model_name = workspace_record['embeddings_model'], model_kwargs = {'device': device}, encode_kwargs = {'normalize_embeddings': False}
-        )
-    elif workspace_record['embeddings'] == 'ollama':
-        if workspace_record['embeddings_url']:
-            embeddings = OllamaEmbeddings(model = workspace_record['embeddings_model'], base_url = workspace_record['embeddings_url'])
-        else: 
-            embeddings = OllamaEmbeddings(model = workspace_record['embeddings_model'])
-
-    if workspace_record['vectordb'] == 'faiss':
-        vectorstore = FAISS.load_local(path, embeddings, allow_dangerous_deserialization = True)
-    elif workspace_record['vectordb'] == 'chroma':
-        vectorstore = Chroma(persist_directory = path, embedding_function = embeddings)
-    elif workspace_record['vectordb'] == 'lancedb':
-        reranker = LinearCombinationReranker(weight = 0.3)
-        vectorstore = LanceDB(embedding = embeddings, uri = path, reranker = reranker)
-
-    retrieved_docs = vectorstore.similarity_search(query, k = int(workspace_record['k_retreive']))
+    _, vectorstore, lexical = await asyncio.to_thread(cached_retrieval, workspace_record)
+
+    retrieved_docs = await hybrid_retriever(vectorstore, lexical, int(workspace_record['k_retreive'])).ainvoke(query)
+    retrieved_docs = pack_context(query, retrieved_docs, context_budget(workspace_record), bool(workspace_record.get('context_sentences')))
 
     sources = [
         doc.metadata['source']
@@ -504,6 +475,19 @@ def get_bookings(
 
     return f"I have found these bookings results for your email:\n{results}"
 
+async def run_graph(agent, input, config, turn):
+    if turn.stream is None:
+        return await agent.ainvoke(input, config = config)
+
+    async for event in agent.astream_events(input, config = config, version = "v2"):
+        if event['event'] == 'on_chat_model_stream':
+            token = event['data']['chunk'].content
+            if token and isinstance(token, str):
+                turn.emit('token', token)
+
+    state = await agent.aget_state(config)
+    return state.values
+
 class Assistant:
     def __init__(self, runnable: Runnable):
         self.runnable = runnable
@@ -518,7 +502,7 @@ class Assistant:
             email = configuration.get("email", None)
 
             state = {**state, "company_id": company_id, 'bot_id': bot_id, 'workspace_id': workspace_id, 'email': email}
-            result = self.runnable.invoke(state)
+            result = self.runnable.invoke(state, config)
 
             if not result.tool_calls and (
                 not result.content
@@ -532,32 +516,52 @@ class Assistant:
         return {"messages": result}
     
 async def client_graph(
-    bots_record, workspace_record, embeddings_record, configuration_record, text, session_id
+    bots_record, workspace_record, embeddings_record, configuration_record, text, session_id, stream = None
 ):
     try:
         max_sessions = workspace_record['sessions_limit']
-        
-        if await agent_involved_chat(
-            bots_record, workspace_record, configuration_record, session_id, text
-        ):
-            return "Response has been created"
-        
-        if await max_allowed_chats(workspace_record['workspace_id'], session_id, bots_record['bot_name'], max_sessions):
-            return "No agent is available at the moment. Try again later!"
-        
-        if text == language_arabic or text == language_english:
-            response = await client_language_graph(text, bots_record, workspace_record, configuration_record, session_id)
 
-        elif text == human_end_message:
-            response = await client_goodbye_graph(bots_record, workspace_record, configuration_record, session_id)
-        
-        elif text == transfer_message:
-            response = await client_transfer_graph(bots_record, workspace_record, configuration_record, session_id)
+        mergeable = text not in [language_arabic, language_english, human_end_message, transfer_message]
 
-        else:
-            response = await client_conversation_graph(text, bots_record, workspace_record, embeddings_record, configuration_record, session_id)
+        async with session_lock(session_id, text, mergeable, configuration_record.get('merge_messages')) as (text, merged_into):
+            if merged_into:
+                return merged_result(merged_into)
 
-        return response
+            async with conversation_turn(bots_record, workspace_record, session_id, stream) as turn:
+                stages = {
+                    'records': turn.load(),
+                    'sessions_limit': max_allowed_chats(workspace_record['workspace_id'], session_id, bots_record['bot_name'], max_sessions)
+                }
+
+                if not workspace_record['llm'] == 'anythingllm':
+                    stages['llm'] = llm_selection(workspace_record)
+
+                turn.prefetched = await turn.timings.gather(stages)
+
+                if await turn.timings.measure('agent', agent_involved_chat(
+                    bots_record, workspace_record, configuration_record, session_id, text, turn
+                )):
+                    return "Response has been created"
+            
+                if turn.prefetched['sessions_limit']:
+                    return "No agent is available at the moment. Try again later!"
+            
+                if text == language_arabic or text == language_english:
+                    handler = client_language_graph(text, bots_record, workspace_record, configuration_record, session_id, turn)
+
+                elif text == human_end_message:
+                    handler = client_goodbye_graph(bots_record, workspace_record, configuration_record, session_id, turn)
+            
+                elif text == transfer_message:
+                    handler = client_transfer_graph(bots_record, workspace_record, configuration_record, session_id, turn)
+
+                else:
+                    handler = client_conversation_graph(text, bots_record, workspace_record, embeddings_record, configuration_record, session_id, turn)
+
+                response = await turn.timings.measure('response', handler)
+                turn.emit('done', response)
+
+            return response
         
     except HTTPException as e:
         raise e
@@ -565,10 +569,10 @@ async def client_graph(
         raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
     
 async def graph_create(
-    workspace_record
+    workspace_record, model = None
 ):
     try:
-        model = await llm_selection(workspace_record)
+        model = model or await llm_selection(workspace_record)
 
         tools = [search_bookings, book_bookings, cancel_bookings, massage_information_retrieval, get_bookings]
         model_with_tools = model.bind_tools(tools)
@@ -604,7 +608,7 @@ async def graph_create(
         raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
     
 async def client_language_graph(
-    text, bots_record, workspace_record, configuration_record, session_id
+    text, bots_record, workspace_record, configuration_record, session_id, turn
 ):
     try:
         if text == language_arabic:
@@ -612,48 +616,24 @@ async def client_language_graph(
         elif text == language_english:
             display_message = display_language_english
 
-        slug = bots_record['bot_name'] + slug_db
-        db = await connect(slug)
+        message_record = turn.message_record
+        profiles_record = turn.profiles_record
 
-        messages_collections = db['messages']
-        profiles_collections = db['profiles']
-        
-        message_record = await messages_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-        profiles_record = await profiles_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-
-        now = datetime.now()
-        human_time = now.strftime("%d/%m/%Y %H:%M:%S")
+        human_time = current_time()
+        human_role = new_role('human', display_message, human_time, input_tokens = None)
 
-        message_record = await messages_collections.find_one({"session_id": session_id})
         if message_record: 
-            message_record['roles'].append({
-                "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": None, 
-                "sentiment": None, 'id': str(uuid.uuid4())
-            })
-
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+            turn.append(human_role)
 
         else:
-            document = {"session_id": session_id, "roles": [{
-                "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": None, "sentiment": None, 
-                "id": str(str(uuid.uuid4()))}], 'timeout': bots_record['timeout'], 'language': None, 'sentiment': None, 
-                'agent_sentiment': None, 'tags': [None], 'slug': None, 'workspace_id': workspace_record['workspace_id'], 
-                'end_conversation': 0, 'transfer_conversation': 0, 'human_intervention': 0, 'agent_expiry': 0, 
-                'latest_timestamp': human_time
-            }
-            
-            await messages_collections.insert_one(document)
-
-            profiles_record = await profiles_collections.find_one({'session_id': session_id})
-            await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"preference": text}}) 
+            turn.create(new_conversation(bots_record, workspace_record, session_id, [human_role], human_time))
+            turn.set_profile({"preference": text})
 
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": human_time}})   
+        turn.set_profile({"latest_timestamp": human_time})
 
-        graph = await graph_create(workspace_record)
+        graph = await graph_create(workspace_record, turn.prefetched.get('llm'))
                       
-        async with AsyncMongoDBSaver.from_conn_info(host = host, user = username, password = password, port = 27017, db_name = "checkpoints") as checkpointer:
+        async with AsyncMongoDBSaver.from_pool(db_name = "checkpoints") as checkpointer:
             agent = graph.compile(checkpointer = checkpointer)
             input = {"messages": [HumanMessage(display_message)]}
             config = {
@@ -663,81 +643,34 @@ async def client_language_graph(
                 }
             }
 
-            messages = await agent.ainvoke(input, config = config)
-            for response in messages['messages'][::-1]:
-                if isinstance(response, AIMessage) and response.content: 
-                    input_tokens, output_tokens = 0, 0
-                    if workspace_record['llm'] == 'ollama':
-                        input_tokens = response.response_metadata['prompt_eval_count']
-                        output_tokens = response.response_metadata['eval_count']
-                    else:
-                        input_tokens = response.response_metadata['token_usage']['prompt_tokens']
-                        output_tokens = response.response_metadata['token_usage']['completion_tokens']
+            reply = await canned_reply(workspace_record, 'language', text)
 
-                    now = datetime.now()
-                    bot_time = now.strftime("%d/%m/%Y %H:%M:%S")
+            if reply:
+                message = canned_message(reply)
+                await agent.aupdate_state(config, {"messages": [HumanMessage(display_message), message]}, as_node = "assistant")
+                messages = {"messages": [message]}
+            else:
+                messages = await agent.ainvoke(input, config = config)
 
-                    message_record = await messages_collections.find_one({"session_id": session_id})
+            for response in messages['messages'][::-1]:
+                if isinstance(response, AIMessage) and response.content: 
+                    input_tokens, output_tokens = response_tokens(workspace_record, response)
 
-                    message_record['roles'].append({
-                        "type": 'ai-agent', "text": response.content, "timestamp": bot_time,
-                        "output_tokens": output_tokens, "sentiment": None, 'id': str(uuid.uuid4())
-                    })
+                    bot_time = current_time()
 
-                    profiles_record = await profiles_collections.find_one({'session_id': session_id})
-                    await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})  
+                    bot_role = new_role('ai-agent', response.content, bot_time, output_tokens = output_tokens)
 
-                    await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-                    await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})
+                    turn.append(bot_role)
 
                     if configuration_record["client_query"]:
-                        data = {
-                            'text': display_message
-                        }
-
-                        try:
-                            sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                            sentiment_human = json.loads(sentiment.text)
-
-                            message_record = await messages_collections.find_one({'session_id': session_id})
-
-                            for role in message_record['roles']:
-                                if not role['sentiment'] and role['type'] == 'human':
-                                    role['sentiment'] = sentiment_human['sentiment'] 
-                        except:
-                            for role in message_record['roles']:
-                                if not role['sentiment'] and role['type'] == 'human':
-                                    role['sentiment'] = 'Neutral'
-                        
-                        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})   
+                        turn.score(human_role)
 
                     if configuration_record["bot_response"]:      
-                        try:
-                            sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                            sentiment_ai = json.loads(sentiment.text)
-
-                            message_record = await messages_collections.find_one({'session_id': session_id})
-
-                            for role in message_record['roles']:
-                                if not role['sentiment'] and role['type'] == 'ai-agent':
-                                    role['sentiment'] = sentiment_ai['sentiment'] 
-                        except:
-                            for role in message_record['roles']:
-                                if not role['sentiment'] and role['type'] == 'ai-agent':
-                                    role['sentiment'] = 'Neutral'                            
+                        turn.score(bot_role)
 
-                        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
+                    turn.set_input_tokens(input_tokens)
 
-                    message_record = await messages_collections.find_one({'session_id': session_id})
-
-                    for role in message_record['roles']:
-                        if role['type'] == 'human' and not role['input_tokens']:
-                            role['input_tokens'] = input_tokens
-
-                    await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-
-                    profiles_record = await profiles_collections.find_one({'session_id': session_id})
-                    await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})  
+                    turn.set_profile({"latest_timestamp": bot_time})
 
                     return response.content
 
@@ -747,18 +680,12 @@ async def client_language_graph(
         raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
     
 async def client_goodbye_graph(
-    bots_record, workspace_record, configuration_record, session_id
+    bots_record, workspace_record, configuration_record, session_id, turn
 ):
     
     try:
-        slug = bots_record['bot_name'] + slug_db
-        db = await connect(slug)
-
-        messages_collections = db['messages']
-        profiles_collections = db['profiles']
-        
-        message_record = await messages_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-        profiles_record = await profiles_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
+        message_record = turn.message_record
+        profiles_record = turn.profiles_record
 
         db_temp = await connect('checkpoints')
         checkpoints_collections = db_temp['checkpoints']
@@ -766,8 +693,7 @@ async def client_goodbye_graph(
         await checkpoints_collections.delete_many({'thread_id': session_id})
         await checkpoint_writes_collections.delete_many({'thread_id': session_id})
 
-        now = datetime.now()
-        human_time = now.strftime("%d/%m/%Y %H:%M:%S")
+        human_time = current_time()
 
         if profiles_record['queue'] == 'web':
             if profiles_record['preference'] == language_english:
@@ -778,53 +704,21 @@ async def client_goodbye_graph(
                 input_tokens = None
                 display_message = display_human_end_message_arabic
 
-        if message_record: 
-            if configuration_record["client_query"]:
-                message_record['roles'].append({
-                    "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": input_tokens, 
-                    "sentiment": "Neutral", 'id': str(uuid.uuid4())
-                })
-            else:
-                message_record['roles'].append({
-                    "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": input_tokens, 
-                    "sentiment": None, 'id': str(uuid.uuid4())
-                })
+        sentiment = "Neutral" if configuration_record["client_query"] else None
+        human_role = new_role('human', display_message, human_time, input_tokens = input_tokens, sentiment = sentiment)
 
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+        if message_record: 
+            turn.append(human_role)
 
         else:
-            if configuration_record["client_query"]:
-                temp = {
-                    "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": input_tokens, 
-                    "sentiment": "Neutral", 'id': str(uuid.uuid4())
-                }
-            else:
-                temp = {
-                    "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": input_tokens, 
-                    "sentiment": None, 'id': str(uuid.uuid4())
-                }
+            turn.create(new_conversation(bots_record, workspace_record, session_id, [human_role], human_time))
 
-            new_slug = None
-        
-            document = {
-                "session_id": session_id, "roles": [temp], 'timeout': bots_record['timeout'], 'language': None, 'sentiment': None, 
-                'agent_sentiment': None, 'tags': [None], 'slug': new_slug, 'workspace_id': workspace_record['workspace_id'], 
-                'end_conversation': 0, 'transfer_conversation': 0, 'human_intervention': 0, 'agent_expiry': 0, 
-                'latest_timestamp': human_time
-            }
-
-            await messages_collections.insert_one(document)
-
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+        turn.set_profile({"latest_timestamp": human_time})
 
         if profiles_record['queue'] == 'web':
-            response = await client_goodbye_web_response(bots_record, workspace_record, configuration_record, session_id)
+            response = await client_goodbye_web_response(bots_record, workspace_record, configuration_record, session_id, turn)
         elif profiles_record['queue'] == 'whatsapp':
-            message_record = await messages_collections.find_one({"session_id": session_id})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"end_conversation": 1}})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+            turn.set_fields({"end_conversation": 1, "latest_timestamp": human_time})
 
             response = "Response has been created"
 
@@ -836,23 +730,16 @@ async def client_goodbye_graph(
         raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
     
 async def client_goodbye_web_response(
-    bots_record, workspace_record, configuration_record, session_id
+    bots_record, workspace_record, configuration_record, session_id, turn
 ):
     
     try:
-        slug = bots_record['bot_name'] + slug_db
-        db = await connect(slug)
-
-        messages_collections = db['messages']
-        profiles_collections = db['profiles']
-        
-        message_record = await messages_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-        profiles_record = await profiles_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
+        profiles_record = turn.profiles_record
 
-        graph = await graph_create(workspace_record)
+        graph = await graph_create(workspace_record, turn.prefetched.get('llm'))
                       
         response = None
-        async with AsyncMongoDBSaver.from_conn_info(host = host, user = username, password = password, port = 27017, db_name = "checkpoints") as checkpointer:
+        async with AsyncMongoDBSaver.from_pool(db_name = "checkpoints") as checkpointer:
             agent = graph.compile(checkpointer = checkpointer)
 
             if profiles_record['preference'] == language_english:
@@ -868,68 +755,33 @@ async def client_goodbye_web_response(
                 }
             }            
             
-            messages = await agent.ainvoke(input, config = config)
+            reply = await canned_reply(workspace_record, 'goodbye', profiles_record['preference'])
+
+            if reply:
+                messages = {"messages": [canned_message(reply)]}
+            else:
+                messages = await agent.ainvoke(input, config = config)
+
             for response in messages['messages'][::-1]:
                 if isinstance(response, AIMessage) and response.content: 
 
-                    now = datetime.now()
-                    bot_time = now.strftime("%d/%m/%Y %H:%M:%S")
-
-                    message_record = await messages_collections.find_one({"session_id": session_id})
-                    await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"end_conversation": 1}})
-
-                    if workspace_record['llm'] == 'ollama':
-                        message_record['roles'].append({
-                            "type": 'ai-agent', "text": response.content, "timestamp": bot_time, 
-                            "output_tokens": response.response_metadata['eval_count'], "sentiment": None, 'id': str(uuid.uuid4())
-                        })
-                    else:
-                        message_record['roles'].append({
-                            "type": 'ai-agent', "text": response.content, "timestamp": bot_time, 
-                            "output_tokens": response.response_metadata['token_usage']['completion_tokens'], "sentiment": None, 'id': str(uuid.uuid4())
-                        })
-                        
-                    await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-                    await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})
-
-                    profiles_record = await profiles_collections.find_one({'session_id': session_id})
-                    await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})    
+                    bot_time = current_time()
 
-                    if configuration_record["bot_response"]:              
-                        data = {
-                            'text': response.content
-                        }
-
-                        try:
-                            sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                            sentiment_ai = json.loads(sentiment.text)
+                    input_tokens, output_tokens = response_tokens(workspace_record, response)
 
-                            message_record = await messages_collections.find_one({'session_id': session_id})
+                    bot_role = new_role('ai-agent', response.content, bot_time, output_tokens = output_tokens)
 
-                            for role in message_record['roles']:
-                                if not role['sentiment'] and role['type'] == 'ai-agent':
-                                    role['sentiment'] = sentiment_ai['sentiment'] 
-                        except:
-                            for role in message_record['roles']:
-                                if not role['sentiment'] and role['type'] == 'ai-agent':
-                                    role['sentiment'] = 'Neutral'                            
+                    turn.append(bot_role, {"end_conversation": 1})
 
-                        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
+                    turn.set_profile({"latest_timestamp": bot_time})
 
-                    message_record = await messages_collections.find_one({'session_id': session_id})
+                    if configuration_record["bot_response"]:              
+                        turn.score(bot_role)
 
-                    for role in message_record['roles']:
-                        if role['type'] == 'human' and not role['input_tokens']:
-                            if workspace_record['llm'] == 'ollama':
-                                role['input_tokens'] = response.response_metadata['prompt_eval_count']
-                            else:
-                                role['input_tokens'] = response.response_metadata['token_usage']['prompt_tokens']
+                    turn.set_input_tokens(input_tokens)
 
-                    await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-                
-                    await client_summary_otherllms(
-                        workspace_record["company_id"], workspace_record['bot_id'], workspace_record['workspace_id'], session_id
-                    )
+                    await turn.flush()
+                    await enqueue_job(['summary'], workspace_record, session_id)
                 
                     return response.content
 
@@ -939,27 +791,20 @@ async def client_goodbye_web_response(
         raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
     
 async def client_transfer_graph(
-    bots_record, workspace_record, configuration_record, session_id
+    bots_record, workspace_record, configuration_record, session_id, turn
 ):
     
     try:
-        slug = bots_record['bot_name'] + slug_db
-        db = await connect(slug)
-
-        messages_collections = db['messages']
-        profiles_collections = db['profiles']
-
         db_temp = await connect('checkpoints')
         checkpoints_collections = db_temp['checkpoints']
         checkpoint_writes_collections = db_temp['checkpoint_writes']
         await checkpoints_collections.delete_many({'thread_id': session_id})
         await checkpoint_writes_collections.delete_many({'thread_id': session_id})
 
-        message_record = await messages_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-        profiles_record = await profiles_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
+        message_record = turn.message_record
+        profiles_record = turn.profiles_record
 
-        now = datetime.now()
-        human_time = now.strftime("%d/%m/%Y %H:%M:%S")
+        human_time = current_time()
 
         if profiles_record['preference'] == language_english:
             input_tokens = None
@@ -969,53 +814,21 @@ async def client_transfer_graph(
             input_tokens = None
             display_message = display_transfer_message_arabic
 
-        if message_record: 
-            if configuration_record['client_query']:
-                message_record['roles'].append({
-                    "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": input_tokens, 
-                    "sentiment": "Neutral", 'id': str(uuid.uuid4())
-                })
-            else:
-                message_record['roles'].append({
-                    "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": input_tokens, 
-                    "sentiment": None, 'id': str(uuid.uuid4())
-                })
+        sentiment = "Neutral" if configuration_record['client_query'] else None
+        human_role = new_role('human', display_message, human_time, input_tokens = input_tokens, sentiment = sentiment)
 
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+        if message_record: 
+            turn.append(human_role)
         else:
-            if configuration_record['client_query']:
-                temp = {
-                    "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": input_tokens, 
-                    "sentiment": "Neutral", 'id': str(uuid.uuid4())
-                }
-            else:
-                temp = {
-                    "type": 'human', "text": display_message, "timestamp": human_time, "input_tokens": input_tokens,
-                    "sentiment": None, 'id': str(uuid.uuid4())
-                }
+            turn.create(new_conversation(bots_record, workspace_record, session_id, [human_role], human_time))
 
-            new_slug = None
-        
-            document = {
-                "session_id": session_id, "roles": [temp], 'timeout': bots_record['timeout'], 'language': None, 'sentiment': None,
-                'agent_sentiment': None, 'tags': [None], 'slug': new_slug, 'workspace_id': workspace_record['workspace_id'], 'end_conversation': 0, 
-                'transfer_conversation': 0, 'human_intervention': 0, 'agent_expiry': 0, 'latest_timestamp': human_time
-            }
-
-            await messages_collections.insert_one(document)
-
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+        turn.set_profile({"latest_timestamp": human_time})
 
         if profiles_record['queue'] == 'web':
-            response = await client_transfer_web_response(bots_record, workspace_record, configuration_record, session_id)
+            response = await client_transfer_web_response(bots_record, workspace_record, configuration_record, session_id, turn)
         
         elif profiles_record['queue'] == 'whatsapp':
-            message_record = await messages_collections.find_one({"session_id": session_id})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"transfer_conversation": 1}})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"end_conversation": 1}})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+            turn.set_fields({"transfer_conversation": 1, "end_conversation": 1, "latest_timestamp": human_time})
 
             response = "Response has been created"
         
@@ -1027,23 +840,16 @@ async def client_transfer_graph(
         raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
     
 async def client_transfer_web_response(
-    bots_record, workspace_record, configuration_record, session_id
+    bots_record, workspace_record, configuration_record, session_id, turn
 ):
     
     try:
-        slug = bots_record['bot_name'] + slug_db
-        db = await connect(slug)
+        profiles_record = turn.profiles_record
 
-        messages_collections = db['messages']
-        profiles_collections = db['profiles']
-        
-        message_record = await messages_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-        profiles_record = await profiles_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-
-        graph = await graph_create(workspace_record)
+        graph = await graph_create(workspace_record, turn.prefetched.get('llm'))
                       
         response = None
-        async with AsyncMongoDBSaver.from_conn_info(host = host, user = username, password = password, port = 27017, db_name = "checkpoints") as checkpointer:
+        async with AsyncMongoDBSaver.from_pool(db_name = "checkpoints") as checkpointer:
             agent = graph.compile(checkpointer = checkpointer)
 
             if profiles_record['preference'] == language_english:
@@ -1063,77 +869,37 @@ async def client_transfer_web_response(
                 }
             }
                 
-            messages = await agent.ainvoke(input, config = config)
+            reply = await canned_reply(workspace_record, 'transfer', profiles_record['preference'])
+
+            if reply:
+                messages = {"messages": [canned_message(reply)]}
+            else:
+                messages = await agent.ainvoke(input, config = config)
+
             for response in messages['messages'][::-1]:
                 if isinstance(response, AIMessage) and response.content: 
 
-                    now = datetime.now()
-                    bot_time = now.strftime("%d/%m/%Y %H:%M:%S")
+                    bot_time = current_time()
 
-                    message_record = await messages_collections.find_one({"session_id": session_id})
-                    await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"transfer_conversation": 1}})
-
-                    if workspace_record['llm'] == 'ollama':
-                        message_record['roles'].append({
-                            "type": 'ai-agent', "text": response.content.replace('"', ''), "timestamp": bot_time, 
-                            "output_tokens": response.response_metadata['eval_count'], "sentiment": None, 'id': str(uuid.uuid4())
-                        })
-                    else:
-                        message_record['roles'].append({
-                            "type": 'ai-agent', "text": response.content.replace('"', ''), "timestamp": bot_time, 
-                            "output_tokens": response.response_metadata['token_usage']['completion_tokens'], "sentiment": None, 
-                            'id': str(uuid.uuid4())
-                        })
+                    input_tokens, output_tokens = response_tokens(workspace_record, response)
 
                     if configuration_record['auto_assignment']:
                         queue = transfer_queue + f":{workspace_record['bot_id']}:{workspace_record['workspace_id']}"
                         await enqueue(session_id, queue)
 
-                    await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-                    await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})
-
-                    profiles_record = await profiles_collections.find_one({'session_id': session_id})
-                    await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})
-
-                    if configuration_record["bot_response"]:           
-                        data = {
-                            'text': response.content
-                        }
-
-                        try:
-                            sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                            sentiment_ai = json.loads(sentiment.text)
+                    bot_role = new_role('ai-agent', response.content.replace('"', ''), bot_time, output_tokens = output_tokens)
 
-                            message_record = await messages_collections.find_one({'session_id': session_id})
+                    turn.append(bot_role, {"transfer_conversation": 1})
 
-                            for role in message_record['roles']:
-                                if not role['sentiment'] and role['type'] == 'ai-agent':
-                                    role['sentiment'] = sentiment_ai['sentiment'] 
-                        except:
-                            for role in message_record['roles']:
-                                if not role['sentiment'] and role['type'] == 'ai-agent':
-                                    role['sentiment'] = 'Neutral'                            
+                    turn.set_profile({"latest_timestamp": bot_time})
 
-                        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-
-                    message_record = await messages_collections.find_one({'session_id': session_id})
-
-                    for role in message_record['roles']:
-                        if role['type'] == 'human' and not role['input_tokens']:
-                            if workspace_record['llm'] == 'ollama':
-                                role['input_tokens'] = response.response_metadata['prompt_eval_count']
-                            else:
-                                role['input_tokens'] = response.response_metadata['token_usage']['prompt_tokens']
-
-                    await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
+                    if configuration_record["bot_response"]:           
+                        turn.score(bot_role)
 
-                    await client_summary_otherllms( 
-                        workspace_record["company_id"], workspace_record['bot_id'], workspace_record['workspace_id'], session_id
-                    )
+                    turn.set_input_tokens(input_tokens)
 
-                    await client_suggestions_otherllms( 
-                        workspace_record["company_id"], workspace_record['bot_id'], workspace_record['workspace_id'], session_id
-                    )
+                    await turn.flush()
+                    await enqueue_job(['summary', 'suggestions'], workspace_record, session_id)
 
                     return response.content
         
@@ -1141,49 +907,30 @@ async def client_transfer_web_response(
         raise e
     except Exception as e:
         raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
-
+    
 async def client_conversation_graph(
-    text, bots_record, workspace_record, embeddings_record, configuration_record, session_id
+    text, bots_record, workspace_record, embeddings_record, configuration_record, session_id, turn
 ):
     
     try:
-        slug = bots_record['bot_name'] + slug_db
-        db = await connect(slug)
+        message_record = turn.message_record
+        profiles_record = turn.profiles_record
 
-        messages_collections = db['messages']
-        profiles_collections = db['profiles']
-        
-        message_record = await messages_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-        profiles_record = await profiles_collections.find_one({"workspace_id": workspace_record['workspace_id'], "session_id": session_id})
-
-        now = datetime.now()
-        human_time = now.strftime("%d/%m/%Y %H:%M:%S")
+        human_time = current_time()
+        human_role = new_role('human', text, human_time, input_tokens = None)
 
-        message_record = await messages_collections.find_one({"session_id": session_id})
         if message_record: 
-            message_record['roles'].append({
-                "type": 'human', "text": text, "timestamp": human_time, "input_tokens": None, "sentiment": None, 'id': str(uuid.uuid4())
-            })
-
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-            await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": human_time}})
+            turn.append(human_role)
 
         else:
-            document = {"session_id": session_id, "roles": [{
-                "type": 'human', "text": text, "timestamp": human_time, "input_tokens": None, "sentiment": None, 'id': str(uuid.uuid4())
-                }], 'timeout': bots_record['timeout'], 'language': None, 'sentiment': None, 'agent_sentiment': None, 'tags': [None], 
-                'slug': None, 'workspace_id': workspace_record['workspace_id'], 'end_conversation': 0, 'transfer_conversation': 0, 
-                'human_intervention': 0, 'agent_expiry': 0, 'latest_timestamp': human_time}
-            
-            await messages_collections.insert_one(document)
+            turn.create(new_conversation(bots_record, workspace_record, session_id, [human_role], human_time))
 
-        profiles_record = await profiles_collections.find_one({'session_id': session_id})
-        await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": human_time}})  
+        turn.set_profile({"latest_timestamp": human_time})
 
-        graph = await graph_create(workspace_record)
+        graph = await graph_create(workspace_record, turn.prefetched.get('llm'))
                       
         response = None
-        async with AsyncMongoDBSaver.from_conn_info(host = host, user = username, password = password, port = 27017, db_name = "checkpoints") as checkpointer:
+        async with AsyncMongoDBSaver.from_pool(db_name = "checkpoints") as checkpointer:
             agent = graph.compile(checkpointer = checkpointer)
 
             input = {"messages": [HumanMessage(text)]}
@@ -1195,87 +942,31 @@ async def client_conversation_graph(
                 }
             }            
 
-            messages = await agent.ainvoke(input, config = config)
+            messages = await run_graph(agent, input, config, turn)
             for response in messages['messages'][::-1]:
                 if isinstance(response, AIMessage) and response.content:                   
         
-                    input_tokens, output_tokens = 0, 0
-                    if workspace_record['llm'] == 'ollama':
-                        input_tokens = response.response_metadata['prompt_eval_count']
-                        output_tokens = response.response_metadata['eval_count']
-                    else:
-                        input_tokens = response.response_metadata['token_usage']['prompt_tokens']
-                        output_tokens = response.response_metadata['token_usage']['completion_tokens']
+                    input_tokens, output_tokens = response_tokens(workspace_record, response)
                 
-                    now = datetime.now()
-                    bot_time = now.strftime("%d/%m/%Y %H:%M:%S")
-
-                    message_record = await messages_collections.find_one({"session_id": session_id})
+                    bot_time = current_time()
 
-                    message_record['roles'].append({
-                        "type": 'ai-agent', "text": response.content, "timestamp": bot_time, "output_tokens": output_tokens, 
-                        "sentiment": None, 'id': str(uuid.uuid4())
-                    })
+                    bot_role = new_role('ai-agent', response.content, bot_time, output_tokens = output_tokens)
 
-                    profiles_record = await profiles_collections.find_one({'session_id': session_id})
-                    await profiles_collections.update_one({"_id": profiles_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})  
+                    turn.append(bot_role)
 
-                    await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})
-                    await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"latest_timestamp": bot_time}})
+                    turn.set_profile({"latest_timestamp": bot_time})
 
                     if configuration_record['client_query']:
-                        data = {
-                            'text': text
-                        }
-
-                        try:
-                            sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                            sentiment_human = json.loads(sentiment.text)
-
-                            message_record = await messages_collections.find_one({'session_id': session_id})
-
-                            for role in message_record['roles']:
-                                if not role['sentiment'] and role['type'] == 'human':
-                                    role['sentiment'] = sentiment_human['sentiment'] 
-                        except:
-                            for role in message_record['roles']:
-                                if not role['sentiment'] and role['type'] == 'human':
-                                    role['sentiment'] = 'Neutral'
-                                    
-                        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})   
+                        turn.score(human_role)
 
                     if configuration_record['bot_response']:                       
-                        data = {
-                            'text': response.content
-                        }
-
-                        try:
-                            sentiment = requests.post(sentiment_url, headers = sentiment_headers, data = data, timeout = 8, verify = False)
-                            sentiment_ai = json.loads(sentiment.text)
+                        turn.score(bot_role)
 
-                            message_record = await messages_collections.find_one({'session_id': session_id})
-
-                            for role in message_record['roles']:
-                                if not role['sentiment'] and role['type'] == 'ai-agent':
-                                    role['sentiment'] = sentiment_ai['sentiment'] 
-                        except:
-                            for role in message_record['roles']:
-                                if not role['sentiment'] and role['type'] == 'ai-agent':
-                                    role['sentiment'] = 'Neutral'                            
-
-                        await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})  
-
-                    message_record = await messages_collections.find_one({'session_id': session_id})
-
-                    for role in message_record['roles']:
-                        if role['type'] == 'human' and not role['input_tokens']:
-                            role['input_tokens'] = input_tokens
-
-                    await messages_collections.update_one({"_id": message_record["_id"]}, {"$set": {"roles": message_record['roles']}})   
+                    turn.set_input_tokens(input_tokens)
 
                     return response.content
 
     except HTTPException as e:
         raise e
     except Exception as e:
-        raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code = 500, detail = f"An error occurred: {str(e)}")
@@ -0,0 +1,72 @@
+import asyncio, hashlib, json, time
+from decouple import config
+from fastapi import HTTPException
+
+from utilities.redis import get_redis
+
+IDEMPOTENCY_TTL = config("IDEMPOTENCY_TTL", default = 86400, cast = int)
+IDEMPOTENCY_RUNNING_TTL = config("IDEMPOTENCY_RUNNING_TTL", default = 300, cast = int)
+IDEMPOTENCY_WAIT = config("IDEMPOTENCY_WAIT", default = 120, cast = float)
+IDEMPOTENCY_POLL = config("IDEMPOTENCY_POLL", default = 0.2, cast = float)
+
+def idempotency_key(request, data):
+    return request.headers.get('idempotency-key') or data.get('idempotency_key')
+
+def request_key(workspace_record, session_id, key):
+    return (
+        f"idempotency:{workspace_record['company_id']}:{workspace_record['bot_id']}:{workspace_record['workspace_id']}:"
+        f"{session_id}:{key}"
+    )
+
+def fingerprint(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+async def claim_request(redis, key, text):
+    record = json.dumps({'status': 'running', 'fingerprint': fingerprint(text)})
+
+    return await redis.set(key, record, nx = True, ex = IDEMPOTENCY_RUNNING_TTL)
+
+async def replay_request(redis, key, text):
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+
+    while time.monotonic() < deadline:
+        record = await redis.get(key)
+        if record is None:
+            return None
+
+        record = json.loads(record)
+        if record['fingerprint'] != fingerprint(text):
+            raise HTTPException(status_code = 422, detail = "An error occurred: idempotency key was used with a different request")
+
+        if record['status'] == 'done':
+            return record
+
+        await asyncio.sleep(IDEMPOTENCY_POLL)
+
+    raise HTTPException(status_code = 409, detail = "An error occurred: a request with this idempotency key is still in progress")
+
+async def idempotent_flow(key, workspace_record, session_id, text, flow, *args):
+    if not key:
+        return await flow(*args)
+
+    key = request_key(workspace_record, session_id, key)
+    redis = await get_redis()
+
+    try:
+        while not await claim_request(redis, key, text):
+            record = await replay_request(redis, key, text)
+            if record:
+                return record['response']
+
+        try:
+            response = await flow(*args)
+        except BaseException:
+            await redis.delete(key)
+            raise
+
+        await redis.set(key, json.dumps({'status': 'done', 'fingerprint': fingerprint(text), 'response': response}), ex = IDEMPOTENCY_TTL)
+
+        return response
+
+    finally:
+        await redis.close()
@@ -0,0 +1,159 @@
+import asyncio, json, time, uuid
+from decouple import config
+
+from utilities.redis import get_redis
+from routers.chats.utilities.summary import client_summary_anythingllm, client_summary_otherllms
+from routers.chats.utilities.suggestions import (
+    client_suggestions_anythingllm, client_suggestions_otherllms, client_message_suggestions_anythingllm, client_message_suggestions_otherllms
+)
+
+JOB_WORKERS = config("JOB_WORKERS", default = 8, cast = int)
+JOB_PROVIDER_CONCURRENCY = config("JOB_PROVIDER_CONCURRENCY", default = 4, cast = int)
+JOB_RETRIES = config("JOB_RETRIES", default = 3, cast = int)
+JOB_RETRY_DELAY = config("JOB_RETRY_DELAY", default = 5, cast = float)
+JOB_VISIBILITY_TIMEOUT = config("JOB_VISIBILITY_TIMEOUT", default = 300, cast = int)
+JOB_POLL_INTERVAL = config("JOB_POLL_INTERVAL", default = 0.5, cast = float)
+JOB_FAILED_SIZE = config("JOB_FAILED_SIZE", default = 1000, cast = int)
+
+pending_key = "jobs:pending"
+delayed_key = "jobs:delayed"
+processing_key = "jobs:processing"
+failed_key = "jobs:failed"
+
+JOB_STEPS = {
+    'summary': (client_summary_anythingllm, client_summary_otherllms),
+    'suggestions': (client_suggestions_anythingllm, client_suggestions_otherllms),
+    'message_suggestions': (client_message_suggestions_anythingllm, client_message_suggestions_otherllms)
+}
+
+claim_script = """
+local job = redis.call('RPOP', KEYS[1])
+if job then
+    redis.call('ZADD', KEYS[2], ARGV[1], job)
+end
+return job
+"""
+
+release_script = """
+local jobs = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, job in ipairs(jobs) do
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('LPUSH', KEYS[2], job)
+end
+return #jobs
+"""
+
+workers = []
+providers = {}
+statistics = {'enqueued': 0, 'completed': 0, 'retried': 0, 'failed': 0}
+
+def provider_limit(provider):
+    if provider not in providers:
+        providers[provider] = asyncio.Semaphore(JOB_PROVIDER_CONCURRENCY)
+
+    return providers[provider]
+
+async def enqueue_job(steps, workspace_record, session_id):
+    job = {
+        'id': uuid.uuid4().hex, 'steps': steps, 'step': 0, 'attempts': 0, 'provider': workspace_record['llm'],
+        'company_id': workspace_record['company_id'], 'bot_id': workspace_record['bot_id'],
+        'workspace_id': workspace_record['workspace_id'], 'session_id': session_id
+    }
+
+    redis = await get_redis()
+
+    try:
+        await redis.lpush(pending_key, json.dumps(job))
+    finally:
+        await redis.close()
+
+    statistics['enqueued'] += 1
+
+async def run_job(job):
+    arguments = job['company_id'], job['bot_id'], job['workspace_id'], job['session_id']
+
+    async with provider_limit(job['provider']):
+        while job['step'] < len(job['steps']):
+            anythingllm, otherllms = JOB_STEPS[job['steps'][job['step']]]
+            await (anythingllm if job['provider'] == 'anythingllm' else otherllms)(*arguments)
+            job['step'] += 1
+
+async def finish_job(redis, claimed, job, error = None):
+    async with redis.pipeline(transaction = True) as pipe:
+        pipe.zrem(processing_key, claimed)
+
+        if error is None:
+            statistics['completed'] += 1
+        elif job['attempts'] < JOB_RETRIES:
+            job['attempts'] += 1
+            pipe.zadd(delayed_key, {json.dumps(job): time.time() + JOB_RETRY_DELAY * 2 ** (job['attempts'] - 1)})
+            statistics['retried'] += 1
+        else:
+            pipe.lpush(failed_key, json.dumps({**job, 'error': str(error)}))
+            pipe.ltrim(failed_key, 0, JOB_FAILED_SIZE - 1)
+            statistics['failed'] += 1
+
+        await pipe.execute()
+
+async def job_worker():
+    redis = await get_redis()
+
+    try:
+        while True:
+            now = time.time()
+            await redis.eval(release_script, 2, delayed_key, pending_key, now)
+            await redis.eval(release_script, 2, processing_key, pending_key, now - JOB_VISIBILITY_TIMEOUT)
+
+            claimed = await redis.eval(claim_script, 2, pending_key, processing_key, time.time())
+            if not claimed:
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                continue
+
+            job = json.loads(claimed)
+
+            try:
+                await run_job(job)
+            except asyncio.CancelledError:
+                async with redis.pipeline(transaction = True) as pipe:
+                    pipe.zrem(processing_key, claimed)
+                    pipe.rpush(pending_key, json.dumps(job))
+                    await pipe.execute()
+                raise
+            except Exception as e:
+                await finish_job(redis, claimed, job, e)
+            else:
+                await finish_job(redis, claimed, job)
+
+    finally:
+        await redis.close()
+
+def start_job_workers():
+    for _ in range(JOB_WORKERS - len(workers)):
+        workers.append(asyncio.create_task(job_worker()))
+
+async def stop_job_workers():
+    for task in workers:
+        task.cancel()
+
+    await asyncio.gather(*workers, return_exceptions = True)
+    workers.clear()
+
+async def job_statistics():
+    redis = await get_redis()
+
+    try:
+        async with redis.pipeline(transaction = False) as pipe:
+            pipe.llen(pending_key)
+            pipe.zcard(delayed_key)
+            pipe.zcard(processing_key)
+            pipe.llen(failed_key)
+            pending, delayed, processing, failed = await pipe.execute()
+    finally:
+        await redis.close()
+
+    return {
+        'pending': pending, 'delayed': delayed, 'processing': processing, 'failed': failed,
+        'workers': len(workers), 'provider_concurrency': JOB_PROVIDER_CONCURRENCY,
+        'providers': {provider: JOB_PROVIDER_CONCURRENCY - limit._value for provider, limit in providers.items()},
+        'local': statistics
+    }
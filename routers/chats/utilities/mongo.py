@@ -7,6 +7,8 @@ from pymongo.database import Database as MongoDatabase
 from urllib.parse import quote_plus
 from decouple import config
 
+from utilities.database import get_client
+
 from langgraph.checkpoint.base import (
     BaseCheckpointSaver,
     ChannelVersions,
@@ -299,6 +301,17 @@ class AsyncMongoDBSaver(BaseCheckpointSaver):
             if client:
                 client.close()
 
+    @classmethod
+    @asynccontextmanager
+    async def from_pool(
+        cls, *, db_name: str
+    ) -> AsyncIterator["AsyncMongoDBSaver"]:
+        """Create a saver on the process-wide pooled client.
+
+        The client is owned by `utilities.database` and is left open on exit.
+        """
+        yield AsyncMongoDBSaver(get_client(), db_name)
+
     async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
         """Get a checkpoint tuple from the database asynchronously.
 
@@ -0,0 +1,56 @@
+import asyncio, aiohttp
+from decouple import config
+
+sentiment_url = config("SENTIMENT_URL")
+x_app_key = config("X_APP_KEY")
+
+SENTIMENT_TIMEOUT = config("SENTIMENT_TIMEOUT", default = 8, cast = float)
+SENTIMENT_MAX_CONNECTIONS = config("SENTIMENT_MAX_CONNECTIONS", default = 20, cast = int)
+SENTIMENT_CONCURRENCY = config("SENTIMENT_CONCURRENCY", default = 10, cast = int)
+
+sentiment_headers = {
+    'x-app-key': x_app_key,
+    'x-super-team': '100'
+}
+
+session = None
+semaphore = None
+
+def get_session():
+    global session, semaphore
+
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector = aiohttp.TCPConnector(limit = SENTIMENT_MAX_CONNECTIONS, ssl = False),
+            timeout = aiohttp.ClientTimeout(total = SENTIMENT_TIMEOUT),
+            headers = sentiment_headers
+        )
+        semaphore = asyncio.Semaphore(SENTIMENT_CONCURRENCY)
+
+    return session
+
+async def close_sentiment_session():
+    global session
+
+    if session is not None and not session.closed:
+        await session.close()
+
+    session = None
+
+async def sentiment_response(text):
+    try:
+        client = get_session()
+
+        async with semaphore:
+            async with client.post(sentiment_url, data = {'text': text}) as response:
+                return await response.json(content_type = None)
+    except:
+        return None
+
+async def sentiment_analysis(text):
+    response = await sentiment_response(text)
+
+    try:
+        return response['sentiment']
+    except:
+        return 'Neutral'
@@ -0,0 +1,176 @@
+import asyncio, json, time, uuid
+from contextlib import asynccontextmanager
+from decouple import config
+from fastapi import HTTPException
+
+from utilities.redis import get_redis
+
+SESSION_LOCK_TTL = config("SESSION_LOCK_TTL", default = 180, cast = int)
+SESSION_LOCK_WAIT = config("SESSION_LOCK_WAIT", default = 30, cast = float)
+SESSION_LOCK_POLL = config("SESSION_LOCK_POLL", default = 0.1, cast = float)
+
+release_script = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+extend_script = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+def session_keys(session_id):
+    return f"session:lock:{session_id}", f"session:pending:{session_id}", f"session:messages:{session_id}"
+
+async def enqueue_message(redis, session_id, message_id, text, mergeable):
+    _, pending_key, messages_key = session_keys(session_id)
+    expiry = SESSION_LOCK_TTL + int(SESSION_LOCK_WAIT)
+
+    async with redis.pipeline(transaction = True) as pipe:
+        pipe.rpush(pending_key, message_id)
+        pipe.hset(messages_key, message_id, json.dumps({'text': text, 'mergeable': mergeable, 'enqueued_at': time.time()}))
+        pipe.expire(pending_key, expiry)
+        pipe.expire(messages_key, expiry)
+        await pipe.execute()
+
+async def drop_messages(redis, session_id, message_ids):
+    _, pending_key, messages_key = session_keys(session_id)
+
+    async with redis.pipeline(transaction = True) as pipe:
+        for message_id in message_ids:
+            pipe.lrem(pending_key, 1, message_id)
+        pipe.hdel(messages_key, *message_ids)
+        await pipe.execute()
+
+# A message still queued after SESSION_LOCK_WAIT belongs to a request that
+# gave up or died, so it is dropped instead of blocking the session.
+async def head_message(redis, session_id):
+    _, pending_key, messages_key = session_keys(session_id)
+
+    while True:
+        message_id = await redis.lindex(pending_key, 0)
+        if message_id is None:
+            return None
+
+        entry = await redis.hget(messages_key, message_id)
+        if entry and time.time() - json.loads(entry)['enqueued_at'] <= SESSION_LOCK_WAIT + 1:
+            return message_id
+
+        await drop_messages(redis, session_id, [message_id])
+
+async def take_messages(redis, session_id, merge):
+    _, pending_key, messages_key = session_keys(session_id)
+
+    message_ids = await redis.lrange(pending_key, 0, -1)
+    entries = [json.loads(entry) if entry else None for entry in await redis.hmget(messages_key, message_ids)]
+
+    taken, texts = [message_ids[0]], [entries[0]['text']]
+    if merge and entries[0]['mergeable']:
+        for message_id, entry in zip(message_ids[1:], entries[1:]):
+            if not entry or not entry['mergeable']:
+                break
+            taken.append(message_id)
+            texts.append(entry['text'])
+
+    # Merged messages leave the queue but keep an entry naming the turn that
+    # answers them, for their own requests to report
+    async with redis.pipeline(transaction = True) as pipe:
+        for message_id in taken:
+            pipe.lrem(pending_key, 1, message_id)
+        pipe.hdel(messages_key, taken[0])
+        for message_id in taken[1:]:
+            pipe.hset(messages_key, message_id, json.dumps({'merged_into': taken[0]}))
+        await pipe.execute()
+
+    return '\n'.join(texts)
+
+def merged_result(message_id):
+    return {'merged': True, 'into': message_id}
+
+def is_merged(response):
+    return isinstance(response, dict) and response.get('merged') is True
+
+async def release_lock(redis, lock_key, token):
+    await redis.eval(release_script, 1, lock_key, token)
+
+# Returns None once this message holds the lock and is at the head of the
+# queue, or the id of the message whose turn has taken it into a merged message.
+async def acquire_lock(redis, session_id, message_id, token):
+    lock_key, _, messages_key = session_keys(session_id)
+    deadline = time.monotonic() + SESSION_LOCK_WAIT
+
+    while True:
+        entry = await redis.hget(messages_key, message_id)
+        if entry is None:
+            raise HTTPException(status_code = 429, detail = "An error occurred: session is busy, try again later")
+
+        merged_into = json.loads(entry).get('merged_into')
+        if merged_into:
+            return merged_into
+
+        if await redis.set(lock_key, token, nx = True, ex = SESSION_LOCK_TTL):
+            try:
+                acquired = await head_message(redis, session_id) == message_id
+            except BaseException:
+                await release_lock(redis, lock_key, token)
+                raise
+
+            if acquired:
+                return None
+            await release_lock(redis, lock_key, token)
+
+        if time.monotonic() > deadline:
+            raise HTTPException(status_code = 429, detail = "An error occurred: session is busy, try again later")
+
+        await asyncio.sleep(SESSION_LOCK_POLL)
+
+# The lock outlives SESSION_LOCK_TTL for as long as the turn is running
+async def keep_lock(redis, lock_key, token):
+    while True:
+        await asyncio.sleep(SESSION_LOCK_TTL / 3)
+        if not await redis.eval(extend_script, 1, lock_key, token, SESSION_LOCK_TTL):
+            return
+
+# Yields (text, None) for the turn to answer, with any queued messages merged
+# into text, or (None, message_id) when this message was merged into the turn
+# of message_id and has nothing left to answer.
+@asynccontextmanager
+async def session_lock(session_id, text, mergeable = False, merge = False):
+    lock_key = session_keys(session_id)[0]
+    message_id, token = uuid.uuid4().hex, uuid.uuid4().hex
+    settled = False
+
+    redis = await get_redis()
+
+    try:
+        await enqueue_message(redis, session_id, message_id, text, mergeable)
+
+        merged_into = await acquire_lock(redis, session_id, message_id, token)
+        if merged_into:
+            yield None, merged_into
+            return
+
+        keeper = asyncio.create_task(keep_lock(redis, lock_key, token))
+
+        try:
+            text = await take_messages(redis, session_id, merge)
+            settled = True
+
+            yield text, None
+        finally:
+            keeper.cancel()
+            await release_lock(redis, lock_key, token)
+
+    finally:
+        # A request that gave up, timed out or failed before its turn must not
+        # stay at the head of the queue and hold up the session; a merged one
+        # only clears its entry
+        try:
+            if not settled:
+                await drop_messages(redis, session_id, [message_id])
+        finally:
+            await redis.close()
@@ -0,0 +1,41 @@
+import asyncio, json
+from fastapi import HTTPException
+
+from routers.chats.utilities.session_lock import is_merged
+
+stream_tasks = set()
+
+def finish_stream(queue, task):
+    stream_tasks.discard(task)
+
+    if task.cancelled():
+        return
+
+    error = task.exception()
+    if error is None and is_merged(task.result()):
+        queue.put_nowait(('merged', task.result()))
+    elif error is None:
+        queue.put_nowait(('done', task.result()))
+    elif isinstance(error, HTTPException):
+        queue.put_nowait(('error', error.detail))
+    else:
+        queue.put_nowait(('error', f"An error occurred: {str(error)}"))
+
+async def stream_flow(flow, *args):
+    queue = asyncio.Queue()
+
+    task = asyncio.create_task(flow(*args, stream = queue))
+    stream_tasks.add(task)
+    task.add_done_callback(lambda task: finish_stream(queue, task))
+
+    while True:
+        event, data = await queue.get()
+
+        if event == 'token':
+            yield {'event': 'token', 'data': data}
+        elif event == 'merged':
+            yield {'event': 'merged', 'data': json.dumps(data)}
+            return
+        else:
+            yield {'event': event, 'data': json.dumps({'detail': data})}
+            return
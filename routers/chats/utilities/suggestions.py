@@ -1,10 +1,8 @@
-import requests
 from decouple import config
-from langchain_openai import ChatOpenAI
-from langchain_groq import ChatGroq
-from langchain_ollama import ChatOllama
 
 from utilities.database import connect
+from utilities.llm import utility_chat_model
+from utilities.anythingllm import anythingllm_chat, session_slug
 
 host = config("DATABASE_HOST")
 username = config("DATABASE_USERNAME")
@@ -48,41 +46,28 @@ async def client_suggestions_anythingllm(company_id, bot_id, workspace_id, sessi
     summaries_record = await summaries_collections.find_one({"session_id": session_id})
     summary = summaries_record['summary']
 
-    headers = {
-        'accept': 'application/json',
-        'Authorization': f"Bearer {workspace_record['llm_api_key']}",
-        'Content-Type': 'application/json'
-    }
 
     summaries_record = await summaries_collections.find_one({"session_id": session_id})
     summary = summaries_record['summary']
 
     suggestions = summaries_record['suggestions']
 
-    message_record = await messages_collections.find_one({'session_id': session_id})
-    url = f"{workspace_record['llm_url']}/api/v1/workspace/{workspace_record['model']}/thread/{message_record['slug']}/chat"
+    thread_slug = await session_slug(messages_collections, session_id)
 
     profiles_record = await profiles_collections.find_one({"session_id": session_id})
     if profiles_record['preference'] == language_english:
-        data = {
-            "message": prompt_summary_suggestion_english.format(summary = summary),
-            "mode": "chat"
-        }
+        prompt = prompt_summary_suggestion_english.format(summary = summary)
 
     elif profiles_record['preference'] == language_arabic:
-        data = {
-            "message": prompt_summary_suggestion_arabic.format(summary = summary),
-            "mode": "chat"
-        }    
+        prompt = prompt_summary_suggestion_arabic.format(summary = summary)    
 
-    response = requests.post(url, headers=headers, json=data)
-    response = response.json()  
+    response_text = await anythingllm_chat(workspace_record, thread_slug, prompt)
 
-    suggestions.append(response['textResponse'])
+    suggestions.append(response_text)
 
     await summaries_collections.update_one({"_id": summaries_record["_id"]}, {"$set": {"suggestions": suggestions}}) 
 
-    return response['textResponse']
+    return response_text
 
 async def client_suggestions_otherllms(company_id, bot_id, workspace_id, session_id):
     db = await connect()
@@ -111,15 +96,7 @@ async def client_suggestions_otherllms(company_id, bot_id, workspace_id, session
 
     suggestions = summaries_record['suggestions']
     
-    if workspace_record['llm'] == 'openai':
-        llm = ChatOpenAI(model_name = "gpt-3.5-turbo", temperature = 0, api_key = workspace_record['llm_api_key'], )
-    elif workspace_record['llm'] == 'ollama':
-        if workspace_record['llm_url']:
-            llm = ChatOllama(model = workspace_record['model'], base_url = workspace_record['llm_url'])
-        else:
-            llm = ChatOllama(model = workspace_record['model'])
-    elif workspace_record['llm'] == 'groq':
-        llm = ChatGroq(model = workspace_record['model'], api_key = workspace_record['llm_api_key'])
+    llm = utility_chat_model(workspace_record)
 
     profiles_record = await profiles_collections.find_one({"session_id": session_id})
     if profiles_record['preference'] == language_english:
@@ -166,38 +143,25 @@ async def client_message_suggestions_anythingllm(company_id, bot_id, workspace_i
     message = history.pop()  
     history = '. '.join(history)
 
-    headers = {
-        'accept': 'application/json',
-        'Authorization': f"Bearer {workspace_record['llm_api_key']}",
-        'Content-Type': 'application/json'
-    }
 
     summaries_record = await summaries_collections.find_one({"session_id": session_id})
 
-    message_record = await messages_collections.find_one({'session_id': session_id})
-    url = f"{workspace_record['llm_url']}/api/v1/workspace/{workspace_record['model']}/thread/{message_record['slug']}/chat"
+    thread_slug = await session_slug(messages_collections, session_id)
 
     profiles_record = await profiles_collections.find_one({"session_id": session_id})
     if profiles_record['preference'] == language_english:
-        data = {
-            "message": prompt_message_suggestion_english.format(history = history, message = message),
-            "mode": "chat"
-        }
+        prompt = prompt_message_suggestion_english.format(history = history, message = message)
 
     elif profiles_record['preference'] == language_arabic:
-        data = {
-            "message": prompt_message_suggestion_arabic.format(history = history, message = message),
-            "mode": "chat"
-        }    
+        prompt = prompt_message_suggestion_arabic.format(history = history, message = message)    
 
-    response = requests.post(url, headers=headers, json=data)
-    response = response.json()  
+    response_text = await anythingllm_chat(workspace_record, thread_slug, prompt)
 
-    suggestions.append(response['textResponse'])
+    suggestions.append(response_text)
 
     await summaries_collections.update_one({"_id": summaries_record["_id"]}, {"$set": {"suggestions": suggestions}})  
 
-    return response['textResponse']
+    return response_text
 
 async def client_message_suggestions_otherllms(company_id, bot_id, workspace_id, session_id):
     db = await connect()
@@ -232,15 +196,7 @@ async def client_message_suggestions_otherllms(company_id, bot_id, workspace_id,
     message = history.pop()  
     history = '. '.join(history)
 
-    if workspace_record['llm'] == 'openai':
-        llm = ChatOpenAI(model_name = "gpt-3.5-turbo", temperature = 0, api_key = workspace_record['llm_api_key'], )
-    elif workspace_record['llm'] == 'ollama':
-        if workspace_record['llm_url']:
-            llm = ChatOllama(model = workspace_record['model'], base_url = workspace_record['llm_url'])
-        else:
-            llm = ChatOllama(model = workspace_record['model'])
-    elif workspace_record['llm'] == 'groq':
-        llm = ChatGroq(model = workspace_record['model'], api_key = workspace_record['llm_api_key'])
+    llm = utility_chat_model(workspace_record)
 
     profiles_record = await profiles_collections.find_one({"session_id": session_id})
     if profiles_record['preference'] == language_english:
@@ -1,11 +1,9 @@
-import requests
 from decouple import config
 from datetime import datetime
-from langchain_openai import ChatOpenAI
-from langchain_groq import ChatGroq
-from langchain_ollama import ChatOllama
 
 from utilities.database import connect
+from utilities.llm import utility_chat_model
+from utilities.anythingllm import anythingllm_chat, session_slug
 
 host = config("DATABASE_HOST")
 username = config("DATABASE_USERNAME")
@@ -50,45 +48,31 @@ async def client_summary_anythingllm(company_id, bot_id, workspace_id, session_i
 
     messages = '. '.join(messages)
 
-    headers = {
-        'accept': 'application/json',
-        'Authorization': f"Bearer {workspace_record['llm_api_key']}",
-        'Content-Type': 'application/json'
-    }
-
-    message_record = await messages_collections.find_one({'session_id': session_id})
-    url = f"{workspace_record['llm_url']}/api/v1/workspace/{workspace_record['model']}/thread/{message_record['slug']}/chat"
+    thread_slug = await session_slug(messages_collections, session_id)
 
     now = datetime.now()
     human_time = now.strftime("%d/%m/%Y %H:%M:%S")
 
     profiles_record = await profiles_collections.find_one({"session_id": session_id})
     if profiles_record['preference'] == language_english:
-        data = {
-            "message": prompt_summary_english.format(messages=messages),
-            "mode": "chat"
-        }
+        prompt = prompt_summary_english.format(messages=messages)
 
     elif profiles_record['preference'] == language_arabic:
-        data = {
-            "message": prompt_summary_arabic.format(messages=messages),
-            "mode": "chat"
-        }
+        prompt = prompt_summary_arabic.format(messages=messages)
 
-    response = requests.post(url, headers=headers, json=data)
-    response = response.json()
+    response_text = await anythingllm_chat(workspace_record, thread_slug, prompt)
 
     now = datetime.now()
     summary_time = now.strftime("%d/%m/%Y %H:%M:%S")   
 
     document = {
-        'company_id': company_id, 'bot_id': bot_id, 'session_id': session_id, 'summary': response['textResponse'], 
+        'company_id': company_id, 'bot_id': bot_id, 'session_id': session_id, 'summary': response_text, 
         'suggestions': [], 'is_active': 1, 'created_date': summary_time
     }
 
     await summaries_collections.insert_one(document)
 
-    return response['textResponse']
+    return response_text
 
 async def client_summary_otherllms(company_id, bot_id, workspace_id, session_id):
     db = await connect()
@@ -119,15 +103,7 @@ async def client_summary_otherllms(company_id, bot_id, workspace_id, session_id)
 
     messages = '. '.join(messages)
 
-    if workspace_record['llm'] == 'openai':
-        llm = ChatOpenAI(model_name = "gpt-3.5-turbo", temperature = 0, api_key = workspace_record['llm_api_key'], )
-    elif workspace_record['llm'] == 'ollama':
-        if workspace_record['llm_url']:
-            llm = ChatOllama(model = workspace_record['model'], base_url = workspace_record['llm_url'])
-        else:
-            llm = ChatOllama(model = workspace_record['model'])
-    elif workspace_record['llm'] == 'groq':
-        llm = ChatGroq(model = workspace_record['model'], api_key = workspace_record['llm_api_key'])
+    llm = utility_chat_model(workspace_record)
 
     now = datetime.now()
     human_time = now.strftime("%d/%m/%Y %H:%M:%S")
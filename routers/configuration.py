@@ -7,7 +7,7 @@ from decorators.jwt import jwt_token
 from decorators.key import x_app_key
 from decorators.teams import x_super_team
 from utilities.database import connect
-from utilities.validation import check_required_fields
+from utilities.validation import check_required_fields, invalidate_tenant
 
 configuration_router = APIRouter()
 
@@ -28,6 +28,8 @@ async def create(request: Request):
         token, summary, suggestion  = data.get('token'), int(data.get('summary')), int(data.get('suggestion')), 
         client_query, bot_response, agent = int(data.get('client_query')), int(data.get('bot_response')), int(data.get('agent')) 
         auto_assignment, conversation = int(data.get('auto_assignment')), int(data.get('conversation'))
+        semantic_cache, semantic_cache_threshold = int(data.get('semantic_cache', 0)), data.get('semantic_cache_threshold')
+        merge_messages = int(data.get('merge_messages', 0))
 
         company_id = request.headers.get('x-super-team')
         user = request.state.current_user
@@ -70,7 +72,9 @@ async def create(request: Request):
         document = {
             'company_id': company_id, 'bot_id': bot_id, "workspace_id": workspace_id, "summary": summary, "suggestion": suggestion, 
             "auto_assignment": auto_assignment, "client_query": client_query, "bot_response": bot_response, "agent": agent, 
-            "conversation": conversation, 'is_active': 1, 'created_date': date_time, 'modified_date': date_time, 'created_by': user, 'modified_by': user
+            "conversation": conversation, "semantic_cache": semantic_cache,
+            "semantic_cache_threshold": float(semantic_cache_threshold) if semantic_cache_threshold else None, "merge_messages": merge_messages,
+            'is_active': 1, 'created_date': date_time, 'modified_date': date_time, 'created_by': user, 'modified_by': user
         }  
 
         await configuration_collections.insert_one(document)
@@ -228,12 +232,25 @@ async def update(request: Request):
         await configuration_collections.update_one({"_id": configuration_record["_id"]}, {"$set": {"bot_response": bot_response}})
         await configuration_collections.update_one({"_id": configuration_record["_id"]}, {"$set": {"agent": agent}})
         await configuration_collections.update_one({"_id": configuration_record["_id"]}, {"$set": {"conversation": conversation}})
+
+        if 'semantic_cache' in data:
+            await configuration_collections.update_one({"_id": configuration_record["_id"]}, {"$set": {"semantic_cache": int(data.get('semantic_cache'))}})
+        if 'merge_messages' in data:
+            await configuration_collections.update_one({"_id": configuration_record["_id"]}, {"$set": {"merge_messages": int(data.get('merge_messages'))}})
+        if 'semantic_cache_threshold' in data:
+            semantic_cache_threshold = data.get('semantic_cache_threshold')
+            await configuration_collections.update_one(
+                {"_id": configuration_record["_id"]}, {"$set": {"semantic_cache_threshold": float(semantic_cache_threshold) if semantic_cache_threshold else None}}
+            )
+
         await configuration_collections.update_one({"_id": configuration_record["_id"]}, {"$set": {"modified_date": date_time}})
         await configuration_collections.update_one({"_id": configuration_record["_id"]}, {"$set": {"modified_by": user}})
 
         await bots_collections.update_one({"_id": bots_record["_id"]}, {"$set": {"modified_date": date_time}})
         await bots_collections.update_one({"_id": bots_record["_id"]}, {"$set": {"modified_by": user}})
 
+        invalidate_tenant(company_id, bot_id, workspace_id)
+
         return JSONResponse(content={"detail": f"Configuration has been updated."}, status_code = 200)
 
     except HTTPException as e:
@@ -1,4 +1,4 @@
-import pymongo, time, random, string
+import pymongo, time, random, string, asyncio
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
@@ -11,6 +11,9 @@ from decorators.key import x_app_key
 from decorators.teams import x_super_team
 from utilities.database import connect
 from utilities.validation import check_required_fields, check_link_validity
+from utilities.vectorstores import invalidate_vectorstore
+from utilities.answer_cache import invalidate_answers
+from utilities.indexing import remove_document
 
 documents_router = APIRouter()
 
@@ -420,6 +423,10 @@ async def disable(request: Request):
         await library_collections.update_one({"_id": library_record["_id"]}, {"$set": {"modified_date": date_time}})
         await library_collections.update_one({"_id": library_record["_id"]}, {"$set": {"modified_by": user}})
 
+        if await asyncio.to_thread(remove_document, workspace_record, document_id):
+            invalidate_vectorstore(company_id, bot_id, workspace_id)
+            invalidate_answers(company_id, bot_id, workspace_id)
+
         await bots_collections.update_one({"_id": bots_record["_id"]}, {"$set": {"modified_date": date_time}})
         await bots_collections.update_one({"_id": bots_record["_id"]}, {"$set": {"modified_by": user}})
 
@@ -1,4 +1,3 @@
-from langchain_ollama import ChatOllama
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import JSONResponse
 from decouple import config
@@ -8,6 +7,7 @@ from decorators.jwt import jwt_token
 from decorators.key import x_app_key
 from decorators.teams import x_super_team
 from utilities.validation import check_required_fields
+from utilities.llm import chat_model
 
 prompt_summary_english = config("PROMPT_SUMMARY_ENGLISH")
 
@@ -27,7 +27,7 @@ async def create(request: Request):
         
         messages = data.get('messages')  
 
-        llm = ChatOllama(model = 'llama3.1')
+        llm = chat_model('ollama', 'llama3.1')
 
         now = datetime.now()
         human_time = now.strftime("%d/%m/%Y %H:%M:%S")
@@ -7,7 +7,7 @@ from decorators.jwt import jwt_token
 from decorators.key import x_app_key
 from decorators.teams import x_super_team
 from utilities.database import connect
-from utilities.validation import check_required_fields
+from utilities.validation import check_required_fields, invalidate_tenant
 
 tokens_router = APIRouter()
 
@@ -120,6 +120,8 @@ async def regenerate(request: Request):
         await bots_collections.update_one({"_id": bots_record["_id"]}, {"$set": {"modified_date": date_time}})
         await bots_collections.update_one({"_id": bots_record["_id"]}, {"$set": {"modified_by": user}})
                 
+        invalidate_tenant(company_id, bot_id, workspace_id)
+
         return JSONResponse(content={"detail": f"Token has been created."}, status_code = 200)
 
     except HTTPException as e:
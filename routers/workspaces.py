@@ -7,7 +7,10 @@ from decorators.jwt import jwt_token
 from decorators.key import x_app_key
 from decorators.teams import x_super_team
 from utilities.database import connect
-from utilities.validation import process_name, check_required_fields
+from utilities.validation import process_name, check_required_fields, invalidate_tenant
+from utilities.llm import invalidate_chat_models
+from utilities.answer_cache import invalidate_answers
+from utilities.canned import schedule_replies
 
 SUPPORTED_LLMS = ['ollama', 'openai', 'groq', 'anythingllm']
 SUPPORTED_EMBEDDINGS = ['ollama', 'openai', 'huggingface']
@@ -126,7 +129,8 @@ async def create(request: Request):
         embeddings, embeddings_api_key, embeddings_url = data.get('embeddings'), data.get('embeddings_api_key'), data.get('embeddings_url')
         embeddings_model, vector_db_url, vector_db_api_key = data.get('embeddings_model'), data.get('vector_db_url'), data.get('vector_db_api_key')
         vectordb, system_prompt, chat_limit = data.get('vectordb'), data.get('system_prompt'), data.get('chat_limit')
-        k_retreive, llm_temperature = data.get('k_retreive'), data.get('llm_temperature')
+        k_retreive, llm_temperature, history_tokens = data.get('k_retreive'), data.get('llm_temperature'), data.get('history_tokens')
+        context_tokens, context_sentences = data.get('context_tokens'), data.get('context_sentences')
 
         company_id = request.headers.get('x-super-team')
         user = request.state.current_user
@@ -203,11 +207,12 @@ async def create(request: Request):
                 'company_id': company_id, 'bot_id': bot_id, 'workspace_id': workspace_id, 'workspace_name': workspace_name, 'llm': llm, 
                 'model': model, 'llm_api_key': llm_api_key, 'llm_url': llm_url, 'embeddings': embeddings, 'embeddings_api_key': embeddings_api_key, 
                 'embeddings_url': embeddings_url, 'vectordb': vectordb, 'vector_db_url': vector_db_url, 'vector_db_api_key': vector_db_api_key, 
-                'system_prompt': system_prompt, 'k_retreive': k_retreive, 'llm_temperature': llm_temperature, 'chat_limit': chat_limit, 'sessions_limit': sessions_limit, 'is_active': 1, 
+                'system_prompt': system_prompt, 'k_retreive': k_retreive, 'llm_temperature': llm_temperature, 'chat_limit': chat_limit, 'history_tokens': history_tokens, 'context_tokens': context_tokens, 'context_sentences': context_sentences, 'sessions_limit': sessions_limit, 'is_active': 1, 
                 'created_date': date_time, 'modified_date': date_time, 'created_by': user, 'modified_by': user, 'embeddings_model': embeddings_model
             }
 
             await workspace_collections.insert_one(document)
+            schedule_replies(document)
 
             now = datetime.now()
             date_time = now.strftime("%d/%m/%Y %H:%M:%S")
@@ -283,11 +288,12 @@ async def create(request: Request):
             'model': model, 'llm_api_key': llm_api_key, 'llm_url': llm_url, 'embeddings': embeddings, 'embeddings_model': embeddings_model,
             'embeddings_api_key': embeddings_api_key, 'embeddings_url': embeddings_url, 'vectordb': vectordb, 'vector_db_url': vector_db_url, 
             'vector_db_api_key': vector_db_api_key, 'system_prompt': system_prompt, 'k_retreive': k_retreive, 'llm_temperature': llm_temperature, 
-            'chat_limit': chat_limit, 'sessions_limit': sessions_limit, 'is_active': 1, 'created_date': date_time, 'modified_date': date_time, 
+            'chat_limit': chat_limit, 'history_tokens': history_tokens, 'context_tokens': context_tokens, 'context_sentences': context_sentences, 'sessions_limit': sessions_limit, 'is_active': 1, 'created_date': date_time, 'modified_date': date_time, 
             'created_by': user, 'modified_by': user
         }
         
         await workspace_collections.insert_one(document)
+        schedule_replies(document)
 
         now = datetime.now()
         date_time = now.strftime("%d/%m/%Y %H:%M:%S")
@@ -346,7 +352,7 @@ async def update(request: Request):
         updatable_fields = [
             'llm', 'model', 'llm_api_key', 'llm_url', 'embeddings', 'embeddings_api_key', 'embeddings_model',
             'embeddings_url', 'vectordb', 'vector_db_url', 'vector_db_api_key', 'k_retreive',
-            'system_prompt', 'chat_limit', 'sessions_limit', 'llm_temperature'
+            'system_prompt', 'chat_limit', 'history_tokens', 'context_tokens', 'context_sentences', 'sessions_limit', 'llm_temperature'
         ]
 
         update_data = {
@@ -376,6 +382,17 @@ async def update(request: Request):
             {"$set": {"modified_date": update_data['modified_date'], "modified_by": user}}
         )
 
+        if any(update_data[key] != workspace_record.get(key) for key in ['llm', 'model', 'llm_api_key', 'llm_url', 'llm_temperature']):
+            invalidate_chat_models(workspace_record)
+
+        if any(update_data[key] != workspace_record.get(key) for key in ['llm', 'model', 'system_prompt', 'embeddings', 'embeddings_model']):
+            invalidate_answers(company_id, bot_id, workspace_id)
+
+        if any(update_data[key] != workspace_record.get(key) for key in ['llm', 'model', 'llm_api_key', 'llm_url', 'llm_temperature', 'system_prompt']):
+            schedule_replies({**workspace_record, **update_data})
+
+        invalidate_tenant(company_id, bot_id, workspace_id)
+
         return JSONResponse(content={"detail": "Workspace has been updated."}, status_code=200)
 
     except Exception as e:
@@ -422,6 +439,8 @@ async def disable(request: Request):
         await bots_collections.update_one({"_id": bots_record["_id"]}, {"$set": {"modified_date": date_time}})
         await bots_collections.update_one({"_id": bots_record["_id"]}, {"$set": {"modified_by": user}})
 
+        invalidate_tenant(company_id, bot_id, workspace_id)
+
         return JSONResponse(content={"detail": f"workspace has been disabled."}, status_code = 200)
 
     except HTTPException as e:
@@ -0,0 +1,47 @@
+import os, sys, pytest
+
+# Settings normally read from .env; the tests only need them to be present.
+for key in [
+    "AGENT_ARRIVAL_ARABIC", "AGENT_ARRIVAL_ENGLISH", "DISPLAY_AGENT_END_MESSAGE_ARABIC", "DISPLAY_AGENT_END_MESSAGE_ENGLISH",
+    "DISPLAY_HUMAN_END_MESSAGE_ARABIC", "DISPLAY_HUMAN_END_MESSAGE_ENGLISH", "DISPLAY_HUMAN_TAKEOVER_MESSAGE_ARABIC",
+    "DISPLAY_HUMAN_TAKEOVER_MESSAGE_ENGLISH", "DISPLAY_LANGUAGE_ARABIC", "DISPLAY_LANGUAGE_ENGLISH", "DISPLAY_TRANSFER_MESSAGE_ARABIC",
+    "DISPLAY_TRANSFER_MESSAGE_ENGLISH", "HUMAN_AGENT_END_MESSAGE", "HUMAN_END_MESSAGE", "HUMAN_TAKEOVER_MESSAGE",
+    "PROMPT_GOODBYE_ARABIC", "PROMPT_GOODBYE_ENGLISH", "PROMPT_MESSAGE_SUGGESTION_ARABIC", "PROMPT_MESSAGE_SUGGESTION_ENGLISH",
+    "PROMPT_SUMMARY_ARABIC", "PROMPT_SUMMARY_ENGLISH", "PROMPT_SUMMARY_SUGGESTION_ARABIC", "PROMPT_SUMMARY_SUGGESTION_ENGLISH",
+    "PROMPT_TRANSFER_ARABIC", "PROMPT_TRANSFER_ENGLISH", "TRANSFER_MESSAGE", "TOKEN_SALT", "X_APP_KEY"
+]:
+    os.environ.setdefault(key, key.lower())
+
+os.environ.setdefault("LANGUAGE_ENGLISH", "English")
+os.environ.setdefault("LANGUAGE_ARABIC", "Arabic")
+os.environ.setdefault("DATABASE_HOST", "localhost")
+os.environ.setdefault("DATABASE_USERNAME", "")
+os.environ.setdefault("DATABASE_PASSWORD", "")
+os.environ.setdefault("DATABASE_NAME", "test")
+os.environ.setdefault("SLUG_DATABASE", "_test")
+os.environ.setdefault("SENTIMENT_URL", "http://localhost/")
+os.environ.setdefault("TRANSFER_QUEUE", "transfer")
+
+# aioredis 2.0.1 does not import on Python 3.11+; redis.asyncio is the same
+# client under its new name.
+try:
+    import aioredis
+except (ImportError, TypeError):
+    import redis.asyncio
+    sys.modules['aioredis'] = redis.asyncio
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    import fakeredis
+
+    server = fakeredis.FakeServer()
+
+    async def get_redis():
+        return fakeredis.aioredis.FakeRedis(server = server, decode_responses = True)
+
+    def patch(*modules):
+        for module in modules:
+            monkeypatch.setattr(module, 'get_redis', get_redis)
+        return get_redis
+
+    return patch
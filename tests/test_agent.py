@@ -0,0 +1,37 @@
+import asyncio, pytest
+
+from routers.chats.utilities import agent
+
+@pytest.mark.parametrize('preference, text', [
+    (agent.language_arabic, agent.display_agent_end_message_arabic),
+    (agent.language_english, agent.display_agent_end_message_english),
+    (None, agent.display_agent_end_message_english)
+])
+def test_agent_goodbye_text_follows_preference(monkeypatch, preference, text):
+    roles = []
+
+    class Profiles:
+        async def find_one(self, query):
+            return {'_id': 1, 'preference': preference}
+
+        async def update_one(self, query, update):
+            pass
+
+    async def connect(database = None):
+        return {'messages': None, 'profiles': Profiles()}
+
+    async def append_role(messages_collections, session_id, role, fields = None):
+        roles.append((role, fields))
+
+    async def end_session(database_name, workspace_id, session_id):
+        pass
+
+    monkeypatch.setattr(agent, 'connect', connect)
+    monkeypatch.setattr(agent, 'append_role', append_role)
+    monkeypatch.setattr(agent, 'end_session', end_session)
+
+    asyncio.run(agent.agent_goodbye('bot', 'w1', 's1', True, False, 'a1', 'a@example.com', 'Agent'))
+
+    [(role, fields)] = roles
+    assert role['text'] == text
+    assert fields == {"end_conversation": 1}
@@ -0,0 +1,62 @@
+import asyncio, pytest
+
+from utilities import canned
+from utilities.canned import refresh_replies, canned_reply, failed_key, all_pools
+
+workspace_record = {'company_id': 'c', 'bot_id': 'b', 'workspace_id': 'w', 'llm': 'openai', 'system_prompt': ''}
+
+@pytest.fixture
+def calls(fake_redis, monkeypatch):
+    calls = []
+
+    async def generate_reply(workspace_record, kind, language, llm = None):
+        calls.append((kind, language))
+        if kind == 'goodbye':
+            raise ValueError("model not found")
+        return {'text': f"{kind} {language}", 'input_tokens': 1, 'output_tokens': 1}
+
+    monkeypatch.setattr(canned, 'generate_reply', generate_reply)
+    monkeypatch.setattr(canned, 'CANNED_REPLIES_VARIANTS', 2)
+    monkeypatch.setattr(canned, 'build_tasks', {})
+    fake_redis(canned)
+
+    return calls
+
+async def sweep():
+    await refresh_replies(workspace_record)
+    await asyncio.gather(*canned.build_tasks.values())
+
+def test_failed_pools_are_not_rebuilt_every_sweep(calls):
+    async def main():
+        await sweep()
+        first = len(calls)
+
+        await sweep()
+        await canned_reply(workspace_record, 'goodbye', canned.language_english)
+        await asyncio.gather(*canned.build_tasks.values())
+
+        return first, len(calls)
+
+    first, total = asyncio.run(main())
+
+    assert first == len(all_pools()) * 2
+    assert total == first
+
+def test_only_stale_pools_are_rebuilt_after_the_retry_delay(calls):
+    async def main():
+        await sweep()
+        reply = await canned_reply(workspace_record, 'transfer', canned.language_arabic)
+
+        redis = await canned.get_redis()
+        try:
+            await redis.delete(failed_key(workspace_record, 'goodbye', canned.language_english))
+        finally:
+            await redis.close()
+
+        calls.clear()
+        await sweep()
+
+        return reply
+
+    assert asyncio.run(main())['text'] == f"transfer {canned.language_arabic}"
+    assert calls == [('goodbye', canned.language_english)] * 2
@@ -0,0 +1,68 @@
+import asyncio
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+from utilities.context import pack_context, packed_retriever, deduplicate, context_budget, enc, CONTEXT_TOKEN_BUDGET
+
+def document(text, source = 'guide.pdf'):
+    return Document(page_content = text, metadata = {'source': source})
+
+def used_tokens(documents):
+    return sum(len(enc.encode(document.page_content)) + 3 for document in documents)
+
+long_text = ' '.join(f"Sentence number {i} describes the warranty terms of the device." for i in range(60))
+
+def test_packed_context_stays_within_the_budget():
+    documents = [document(long_text, 'a.pdf'), document(long_text.upper(), 'b.pdf'), document("Short note.", 'c.pdf')]
+
+    packed = pack_context("warranty", documents, 300)
+
+    assert used_tokens(packed) <= 300
+    assert packed[0].page_content.startswith("Sentence number 0")
+    assert packed[0].page_content.endswith('.')
+
+def test_small_documents_are_kept_whole_in_rank_order():
+    documents = [document("First answer.", 'a.pdf'), document("Second answer.", 'b.pdf')]
+
+    assert pack_context("answer", documents, 1500) == documents
+
+def test_packing_stops_when_too_little_budget_is_left():
+    documents = [document(long_text, 'a.pdf'), document(long_text, 'b.pdf'), document("Short note.", 'c.pdf')]
+    first = pack_context("warranty", documents[:1], 1500)
+
+    packed = pack_context("warranty", documents, used_tokens(first) + 10)
+
+    assert [document.metadata['source'] for document in packed] == ['a.pdf']
+
+def test_contained_and_overlapping_chunks_are_deduplicated():
+    documents = [
+        document("The device ships with a charger. It weighs two kilograms."),
+        document("It weighs two kilograms."),
+        document("It weighs two kilograms.", 'other.pdf'),
+        document("It weighs two kilograms. Support is available by phone.")
+    ]
+
+    assert [(document.metadata['source'], document.page_content) for document in deduplicate(documents)] == [
+        ('guide.pdf', "The device ships with a charger. It weighs two kilograms."),
+        ('other.pdf', "It weighs two kilograms."),
+        ('guide.pdf', "Support is available by phone.")
+    ]
+
+def test_sentence_mode_keeps_only_relevant_sentences():
+    text = "Returns are accepted within 30 days. The office has a garden. Refunds follow returns within a week."
+
+    [packed] = pack_context("returns refunds", [document(text)], 1500, sentences = True)
+
+    assert "garden" not in packed.page_content
+    assert "Returns are accepted" in packed.page_content
+
+def test_packed_retriever_uses_the_workspace_budget():
+    retriever = RunnableLambda(lambda query: [document(long_text, 'a.pdf'), document(long_text, 'b.pdf')])
+    workspace_record = {'context_tokens': 200}
+
+    packed = packed_retriever(retriever, workspace_record)
+
+    assert context_budget(workspace_record) == 200
+    assert context_budget({}) == CONTEXT_TOKEN_BUDGET
+    assert used_tokens(packed.invoke({'input': "warranty"})) <= 200
+    assert used_tokens(asyncio.run(packed.ainvoke({'input': "warranty"}))) <= 200
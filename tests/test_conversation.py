@@ -0,0 +1,138 @@
+import asyncio, pytest
+
+from routers.chats.utilities import conversation
+from routers.chats.utilities.conversation import ConversationTurn, new_role, input_tokens_update
+
+class RecordingCollection:
+    def __init__(self, calls, name, record = None):
+        self.calls, self.name, self.record = calls, name, record
+
+    async def find_one(self, query, *args, **kwargs):
+        return self.record
+
+    async def insert_one(self, document):
+        self.calls.append((self.name, 'insert_one', document))
+
+    async def update_one(self, query, update, **kwargs):
+        self.calls.append((self.name, 'update_one', update))
+
+    async def bulk_write(self, operations, ordered = True):
+        self.calls.append((self.name, 'bulk_write', [(operation._doc, operation._array_filters) for operation in operations]))
+
+class RecordingDatabase:
+    name = 'bot_test'
+
+    def __init__(self, message_record = None, profiles_record = None):
+        self.calls = []
+        self.collections = {
+            'messages': RecordingCollection(self.calls, 'messages', message_record),
+            'profiles': RecordingCollection(self.calls, 'profiles', profiles_record)
+        }
+
+    def __getitem__(self, name):
+        return self.collections[name]
+
+@pytest.fixture
+def tracked(monkeypatch):
+    sessions = []
+
+    async def track_session(database_name, record):
+        sessions.append(record['session_id'])
+
+    monkeypatch.setattr(conversation, 'track_session', track_session)
+    return sessions
+
+def load_turn(message_record, profiles_record = None):
+    db = RecordingDatabase(message_record, profiles_record or {'_id': 1})
+    return db, asyncio.run(ConversationTurn(db, 'w1', 's1').load())
+
+def test_cached_role_keeps_its_input_tokens(tracked):
+    cached = new_role('human', 'hi', '01/01/2025 10:00:00', input_tokens = 0, cached = True)
+    db, turn = load_turn({'session_id': 's1', 'workspace_id': 'w1', 'roles': [cached]})
+
+    asked = new_role('human', 'why?', '01/01/2025 10:01:00', input_tokens = None)
+    turn.append(asked)
+    turn.set_input_tokens(42)
+
+    assert cached['input_tokens'] == 0
+    assert asked['input_tokens'] == 42
+
+    update, array_filters = input_tokens_update(42)
+    assert update == {"$set": {"roles.$[role].input_tokens": 42}}
+    assert array_filters[0]['role.cached'] == {"$ne": True}
+
+def test_flush_pushes_roles_before_patches(tracked):
+    db, turn = load_turn({'session_id': 's1', 'workspace_id': 'w1', 'roles': []})
+
+    human = new_role('human', 'hello', '01/01/2025 10:00:00', input_tokens = None)
+    turn.append(human)
+    turn.set_sentiment('human', 'positive')
+    turn.set_input_tokens(10)
+    turn.set_fields({'language': 'English'})
+    turn.set_profile({'latest_timestamp': '01/01/2025 10:00:00'})
+
+    asyncio.run(turn.flush())
+
+    [(_, _, operations)] = [call for call in db.calls if call[1] == 'bulk_write']
+    assert operations[0][0]["$push"] == {"roles": {"$each": [human]}}
+    assert operations[0][0]["$set"] == {'latest_timestamp': '01/01/2025 10:00:00', 'language': 'English'}
+    assert [update for update, _ in operations[1:]] == [
+        {"$set": {"roles.$[role].sentiment": 'positive'}}, {"$set": {"roles.$[role].input_tokens": 10}}
+    ]
+    assert ('profiles', 'update_one', {"$set": {'latest_timestamp': '01/01/2025 10:00:00'}}) in db.calls
+    assert tracked == ['s1']
+
+    asyncio.run(turn.flush())
+    assert len(db.calls) == 2
+
+def test_flush_inserts_a_new_conversation(tracked):
+    db, turn = load_turn(None)
+
+    document = {'session_id': 's1', 'workspace_id': 'w1', 'roles': [new_role('human', 'hello', '01/01/2025 10:00:00')]}
+    turn.create(document)
+    turn.set_input_tokens(7)
+
+    asyncio.run(turn.flush())
+
+    assert db.calls == [('messages', 'insert_one', document)]
+    assert document['roles'][0]['input_tokens'] == 7
+
+def test_failed_turn_writes_nothing(tracked, monkeypatch):
+    db = RecordingDatabase({'session_id': 's1', 'workspace_id': 'w1', 'roles': []}, {'_id': 1})
+
+    async def connect(database = None):
+        return db
+
+    monkeypatch.setattr(conversation, 'connect', connect)
+
+    async def main():
+        async with conversation.conversation_turn({'bot_name': 'bot'}, {'workspace_id': 'w1'}, 's1') as turn:
+            await turn.load()
+            turn.append(new_role('human', 'hello', '01/01/2025 10:00:00', input_tokens = None))
+            turn.set_fields({'language': 'English'})
+            turn.set_profile({'latest_timestamp': '01/01/2025 10:00:00'})
+            raise RuntimeError("llm unavailable")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main())
+
+    assert db.calls == []
+    assert tracked == []
+
+def test_turn_is_written_on_normal_exit(tracked, monkeypatch):
+    db = RecordingDatabase({'session_id': 's1', 'workspace_id': 'w1', 'roles': []}, {'_id': 1})
+
+    async def connect(database = None):
+        return db
+
+    monkeypatch.setattr(conversation, 'connect', connect)
+
+    async def main():
+        async with conversation.conversation_turn({'bot_name': 'bot'}, {'workspace_id': 'w1'}, 's1') as turn:
+            await turn.load()
+            turn.append(new_role('human', 'hello', '01/01/2025 10:00:00', input_tokens = None))
+            return "answer"
+
+    assert asyncio.run(main()) == "answer"
+    assert [call[1] for call in db.calls] == ['bulk_write']
+    assert tracked == ['s1']
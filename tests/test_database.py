@@ -0,0 +1,36 @@
+import asyncio, pytest
+
+from utilities import database
+from utilities.database import connect, connect_sync, get_client, get_sync_client, close_connections
+
+@pytest.fixture(autouse = True)
+def clients(monkeypatch):
+    monkeypatch.setattr(database, 'clients', {})
+    yield database.clients
+    asyncio.run(close_connections())
+
+def test_databases_share_one_pooled_client():
+    async def main():
+        return await connect(), await connect('bot_slug'), await connect()
+
+    main_db, tenant_db, again = asyncio.run(main())
+
+    assert main_db.client is tenant_db.client is again.client is get_client()
+    assert tenant_db.name == 'bot_slug'
+    assert connect_sync().client is connect_sync('bot_slug').client is get_sync_client()
+    assert get_sync_client() is not get_client()
+
+def test_client_options_come_from_config():
+    options = get_client().options.pool_options
+
+    assert options.max_pool_size == database.max_pool_size
+    assert options.min_pool_size == database.min_pool_size
+
+def test_close_connections_drops_the_clients(clients):
+    client, sync_client = get_client(), get_sync_client()
+
+    asyncio.run(close_connections())
+
+    assert clients == {}
+    assert get_client() is not client
+    assert get_sync_client() is not sync_client
@@ -0,0 +1,22 @@
+from utilities import huggingface, vectorstores
+
+class FakeEmbeddings:
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+def test_evicted_model_is_released_by_the_vectorstore_cache(monkeypatch):
+    monkeypatch.setattr(huggingface, 'HuggingFaceEmbeddings', FakeEmbeddings)
+    monkeypatch.setattr(huggingface, 'model_size', lambda embeddings: 3 * 1024 * 1024)
+    monkeypatch.setattr(huggingface, 'EMBEDDINGS_MEMORY_CAP_MB', 5)
+    monkeypatch.setattr(huggingface, 'models', huggingface.OrderedDict())
+    monkeypatch.setattr(vectorstores, 'vectorstores', vectorstores.OrderedDict())
+
+    first = huggingface.huggingface_embeddings('first')
+    vectorstores.vectorstores[('c', 'b', 'w', 'huggingface', 'first', None, 'faiss')] = {'embeddings': first, 'size': 0}
+    vectorstores.vectorstores[('c', 'b', 'x', 'openai', 'first', None, 'faiss')] = {'embeddings': None, 'size': 0}
+
+    huggingface.huggingface_embeddings('second')
+
+    assert list(huggingface.models) == ['second']
+    assert not huggingface.is_resident('first')
+    assert list(vectorstores.vectorstores) == [('c', 'b', 'x', 'openai', 'first', None, 'faiss')]
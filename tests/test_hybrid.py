@@ -0,0 +1,70 @@
+import asyncio
+from langchain_core.documents import Document
+
+from utilities.hybrid import LexicalIndex, HybridRetriever, reciprocal_rank_fusion, tokenize, hybrid_retriever
+
+def document(text, source = 'guide.pdf'):
+    return Document(page_content = text, metadata = {'source': source})
+
+documents = [
+    document("Reset the router by holding the power button."),
+    document("Error XK-4471 means the firmware update failed."),
+    document("The router firmware can be updated from the admin page."),
+    document("Opening hours are nine to five on weekdays.")
+]
+
+class DenseStore:
+    def __init__(self, ranking):
+        self.ranking = ranking
+
+    def similarity_search(self, query, k):
+        return self.ranking[:k]
+
+    async def asimilarity_search(self, query, k):
+        return self.ranking[:k]
+
+def test_codes_are_kept_as_single_terms():
+    assert tokenize("Error XK-4471 in v2.1") == ['error', 'xk-4471', 'in', 'v2.1', 'xk', '4471', 'v2', '1']
+
+def test_bm25_ranks_exact_terms_first():
+    index = LexicalIndex.build(documents)
+
+    assert index.search("XK-4471", 2) == [documents[1]]
+    ranked = index.search("router firmware", 4)
+    assert ranked[0] == documents[2]
+    assert len(ranked) == 3 and documents[3] not in ranked
+    assert index.search("holiday", 4) == []
+
+def test_bm25_index_round_trips(tmp_path):
+    LexicalIndex.build(documents).save(str(tmp_path))
+    index = LexicalIndex.load(str(tmp_path))
+
+    assert index.search("XK-4471", 1) == [documents[1]]
+    assert LexicalIndex.load(str(tmp_path / 'missing')) is None
+
+def test_rrf_rewards_documents_found_by_both_rankings():
+    dense = [documents[3], documents[2], documents[0]]
+    lexical = [documents[1], documents[2]]
+
+    fused = reciprocal_rank_fusion([dense, lexical], 3)
+
+    assert fused[0] == documents[2]
+    assert set(document.page_content for document in fused[1:]) == {documents[3].page_content, documents[1].page_content}
+
+def test_rrf_merges_the_same_chunk_from_both_rankings():
+    copy = document(documents[0].page_content)
+
+    assert reciprocal_rank_fusion([[documents[0]], [copy]], 4) == [documents[0]]
+
+def test_hybrid_retriever_finds_what_dense_search_misses():
+    retriever = HybridRetriever(vectorstore = DenseStore([documents[3], documents[0]]), lexical = LexicalIndex.build(documents), k = 2)
+
+    assert documents[1] in retriever.invoke("what is XK-4471")
+    assert documents[1] in asyncio.run(retriever.ainvoke("what is XK-4471"))
+
+def test_without_a_lexical_index_the_vectorstore_retriever_is_used():
+    class Store:
+        def as_retriever(self, search_kwargs):
+            return search_kwargs
+
+    assert hybrid_retriever(Store(), None, 3) == {"k": 3}
@@ -0,0 +1,85 @@
+import asyncio, pytest
+from fastapi import HTTPException
+
+from routers.chats.utilities import idempotency
+from routers.chats.utilities.idempotency import idempotent_flow
+
+workspace_record = {'company_id': 'c', 'bot_id': 'b', 'workspace_id': 'w'}
+
+@pytest.fixture(autouse = True)
+def redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_POLL', 0.01)
+    return fake_redis(idempotency)
+
+def counting_flow(calls, delay = 0):
+    async def flow(text):
+        calls.append(text)
+        await asyncio.sleep(delay)
+        return f"answer {len(calls)}"
+
+    return flow
+
+def test_retry_replays_the_stored_response():
+    calls = []
+    flow = counting_flow(calls)
+
+    async def main():
+        first = await idempotent_flow('k1', workspace_record, 's1', 'hello', flow, 'hello')
+        second = await idempotent_flow('k1', workspace_record, 's1', 'hello', flow, 'hello')
+        other = await idempotent_flow('k2', workspace_record, 's1', 'hello', flow, 'hello')
+        return first, second, other
+
+    assert asyncio.run(main()) == ('answer 1', 'answer 1', 'answer 2')
+    assert calls == ['hello', 'hello']
+
+def test_concurrent_retry_waits_for_the_running_request():
+    calls = []
+    flow = counting_flow(calls, delay = 0.1)
+
+    async def main():
+        return await asyncio.gather(
+            idempotent_flow('k1', workspace_record, 's1', 'hello', flow, 'hello'),
+            idempotent_flow('k1', workspace_record, 's1', 'hello', flow, 'hello')
+        )
+
+    assert asyncio.run(main()) == ['answer 1', 'answer 1']
+    assert calls == ['hello']
+
+def test_key_reused_with_a_different_request_is_rejected():
+    flow = counting_flow([])
+
+    async def main():
+        await idempotent_flow('k1', workspace_record, 's1', 'hello', flow, 'hello')
+        await idempotent_flow('k1', workspace_record, 's1', 'goodbye', flow, 'goodbye')
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main())
+
+    assert error.value.status_code == 422
+
+def test_failed_request_can_be_retried():
+    calls = []
+
+    async def flow(text):
+        calls.append(text)
+        if len(calls) == 1:
+            raise RuntimeError("llm unavailable")
+        return "answer"
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            await idempotent_flow('k1', workspace_record, 's1', 'hello', flow, 'hello')
+
+        return await idempotent_flow('k1', workspace_record, 's1', 'hello', flow, 'hello')
+
+    assert asyncio.run(main()) == "answer"
+    assert len(calls) == 2
+
+def test_requests_without_a_key_always_run():
+    calls = []
+    flow = counting_flow(calls)
+
+    async def main():
+        return [await idempotent_flow(None, workspace_record, 's1', 'hello', flow, 'hello') for _ in range(2)]
+
+    assert asyncio.run(main()) == ['answer 1', 'answer 2']
@@ -0,0 +1,128 @@
+import pytest
+from concurrent.futures import Future
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+
+from utilities import indexing
+from utilities.indexing import update_index, remove_document, read_manifest
+from utilities.hybrid import LexicalIndex
+from utilities.vectorstores import index_version
+
+workspace_record = {
+    'company_id': 'c', 'bot_id': 'b', 'workspace_id': 'w', 'embeddings': 'huggingface', 'embeddings_model': 'fake', 'vectordb': 'faiss'
+}
+
+def paragraph(topic):
+    return ' '.join(f"Paragraph about {topic}, line {i}." for i in range(25))
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    source_path, path = tmp_path / 'documents', tmp_path / 'embeddings'
+    source_path.mkdir()
+    embedded = []
+
+    embeddings = DeterministicFakeEmbedding(size = 16)
+    embed_documents = embeddings.embed_documents
+
+    def counting(texts):
+        embedded.extend(texts)
+        return embed_documents(texts)
+
+    object.__setattr__(embeddings, 'embed_documents', counting)
+
+    # Parses in-process, the parser pool itself is not under test here
+    def submit_record(record, path):
+        future = Future()
+        with open(f"{path}/{record['file_name']}") as file:
+            future.set_result([Document(page_content = file.read(), metadata = {'source': record['file_name']})])
+        return future
+
+    monkeypatch.setattr(indexing, 'embeddings_path', lambda *workspace_key: str(path))
+    monkeypatch.setattr(indexing, 'documents_path', lambda *workspace_key: str(source_path))
+    monkeypatch.setattr(indexing, 'load_embeddings', lambda workspace_record: embeddings)
+    monkeypatch.setattr(indexing, 'submit_record', submit_record)
+
+    def write(file_name, *topics):
+        (source_path / file_name).write_text('\n\n'.join(paragraph(topic) for topic in topics))
+        return {'document_id': file_name, 'file_name': file_name, 'url': None}
+
+    def stored():
+        vectorstore = FAISS.load_local(str(path), embeddings, allow_dangerous_deserialization = True)
+        return set(vectorstore.index_to_docstore_id.values())
+
+    return write, embedded, stored, str(path)
+
+def test_only_new_chunks_are_embedded(workspace):
+    write, embedded, stored, path = workspace
+
+    first, second = write('a.txt', 'shipping', 'returns'), write('b.txt', 'warranty')
+    result = update_index(workspace_record, [first, second])
+
+    assert result == {'documents': 2, 'parsed': 2, 'failed': 0, 'chunks': 3, 'embedded': 3, 'removed': 0}
+    assert len(embedded) == 3
+    manifest = read_manifest(path)
+    assert stored() == {chunk_id for entry in manifest['documents'].values() for chunk_id in entry['chunks']}
+    version = index_version(('c', 'b', 'w'), path)
+
+    embedded.clear()
+    result = update_index(workspace_record, [first, second])
+
+    assert result['parsed'] == 0 and result['embedded'] == 0 and result['removed'] == 0
+    assert embedded == []
+
+    first = write('a.txt', 'shipping', 'refunds')
+    result = update_index(workspace_record, [first, second])
+
+    assert result['parsed'] == 1 and result['embedded'] == 1 and result['removed'] == 1
+    assert embedded == [paragraph('refunds')]
+    assert index_version(('c', 'b', 'w'), path) != version
+
+def test_documents_no_longer_in_the_library_are_removed(workspace):
+    write, embedded, stored, path = workspace
+
+    first, second = write('a.txt', 'shipping'), write('b.txt', 'warranty', 'repairs')
+    update_index(workspace_record, [first, second])
+    kept = read_manifest(path)['documents']['a.txt']['chunks']
+
+    result = update_index(workspace_record, [first])
+
+    assert result['removed'] == 2 and result['chunks'] == 1
+    assert stored() == set(kept)
+    assert [document.metadata['chunk_id'] for document in LexicalIndex.load(path).documents] == kept
+
+def test_remove_document_drops_its_chunks(workspace):
+    write, embedded, stored, path = workspace
+
+    first, second = write('a.txt', 'shipping'), write('b.txt', 'warranty')
+    update_index(workspace_record, [first, second])
+
+    assert remove_document(workspace_record, 'b.txt') == 1
+    assert remove_document(workspace_record, 'b.txt') == 0
+    assert list(read_manifest(path)['documents']) == ['a.txt']
+    assert stored() == set(read_manifest(path)['documents']['a.txt']['chunks'])
+
+def test_unreadable_document_keeps_its_chunks(workspace):
+    write, embedded, stored, path = workspace
+
+    first = write('a.txt', 'shipping')
+    update_index(workspace_record, [first])
+    chunks = stored()
+
+    first['file_name'] = 'missing.txt'
+    result = update_index(workspace_record, [first])
+
+    assert result['failed'] == 1 and result['removed'] == 0
+    assert stored() == chunks
+
+def test_changing_the_embeddings_model_rebuilds(workspace):
+    write, embedded, stored, path = workspace
+
+    first = write('a.txt', 'shipping')
+    update_index(workspace_record, [first])
+
+    embedded.clear()
+    result = update_index({**workspace_record, 'embeddings_model': 'other'}, [first])
+
+    assert result['embedded'] == 1 and result['removed'] == 0
+    assert len(embedded) == 1
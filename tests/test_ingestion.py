@@ -0,0 +1,92 @@
+import asyncio, time, pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from utilities import ingestion
+from utilities.ingestion import start_ingestion, ingestion_status, ingestion_lock_key
+
+workspace_record = {'company_id': 'c', 'bot_id': 'b', 'workspace_id': 'w'}
+library_records = [{'document_id': 'd1', 'url': None, 'file_name': 'a.pdf'}]
+
+@pytest.fixture
+def get_redis(fake_redis, monkeypatch):
+    db = AsyncMongoMockClient()['test']
+
+    async def connect(database = None):
+        return db
+
+    async def finish_build(workspace_record, user):
+        pass
+
+    monkeypatch.setattr(ingestion, 'connect', connect)
+    monkeypatch.setattr(ingestion, 'finish_build', finish_build)
+    monkeypatch.setattr(ingestion, 'INGESTION_PROGRESS_INTERVAL', 0.02)
+
+    return fake_redis(ingestion)
+
+def slow_index(steps, reported):
+    def update_index(workspace_record, library_records, report):
+        report('document', document_id = 'd1', status = 'parsed', chunks = steps, added = steps)
+        report('embedding', total = steps)
+        for _ in range(steps):
+            time.sleep(0.02)
+            report('embedded', count = 1)
+            reported.append(1)
+        return {'documents': 1, 'parsed': 1, 'failed': 0, 'chunks': steps, 'embedded': steps, 'removed': 0}
+
+    return update_index
+
+async def finished(job_id):
+    while True:
+        job = await ingestion_status('c', 'b', 'w', job_id)
+        if job['finished_at']:
+            return job
+        await asyncio.sleep(0.02)
+
+def test_build_runs_once_per_workspace(get_redis, monkeypatch):
+    monkeypatch.setattr(ingestion, 'update_index', slow_index(5, []))
+
+    async def main():
+        started, job_id = await start_ingestion(workspace_record, library_records, 'user')
+        again = await start_ingestion(workspace_record, library_records, 'user')
+        job = await finished(job_id)
+
+        redis = await get_redis()
+        try:
+            held = await redis.exists(ingestion_lock_key('c', 'b', 'w'))
+        finally:
+            await redis.close()
+
+        return started, again, job_id, job, held
+
+    started, again, job_id, job, held = asyncio.run(main())
+
+    assert started and again == (False, job_id)
+    assert job['status'] == 'completed'
+    assert job['progress']['chunks_embedded'] == 5
+    assert not held
+
+def test_build_stops_when_another_job_takes_the_lock(get_redis, monkeypatch):
+    reported = []
+    monkeypatch.setattr(ingestion, 'update_index', slow_index(50, reported))
+
+    async def main():
+        _, job_id = await start_ingestion(workspace_record, library_records, 'user')
+        await asyncio.sleep(0.1)
+
+        # The lock lapsed and another build claimed the workspace
+        lock_key = ingestion_lock_key('c', 'b', 'w')
+        redis = await get_redis()
+        try:
+            await redis.set(lock_key, 'other', ex = 30)
+            job = await finished(job_id)
+
+            return job, await redis.get(lock_key), await redis.ttl(lock_key)
+        finally:
+            await redis.close()
+
+    job, owner, ttl = asyncio.run(main())
+
+    assert job['status'] == 'failed'
+    assert 'lost its workspace lock' in job['error']
+    assert owner == 'other' and ttl <= 30
+    assert len(reported) < 50
@@ -0,0 +1,51 @@
+import asyncio
+from datetime import datetime
+
+from utilities import live_sessions
+from utilities.live_sessions import live_session_count, track_session, timestamp_format
+
+class Messages:
+    def __init__(self, records):
+        self.records, self.scans = records, []
+
+    def find(self, query, projection):
+        self.scans.append((query, projection))
+
+        async def cursor():
+            for record in self.records:
+                yield {field: record[field] for field in projection if projection[field] and field in record}
+
+        return cursor()
+
+class Database:
+    name = 'bot_test'
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    def __getitem__(self, name):
+        return self.messages
+
+def session(session_id, **fields):
+    return {
+        '_id': session_id, 'session_id': session_id, 'workspace_id': 'w1', 'latest_timestamp': datetime.now().strftime(timestamp_format),
+        'timeout': 10, 'end_conversation': 0, 'transfer_conversation': 0, 'human_intervention': 0, **fields
+    }
+
+def test_sessions_are_seeded_once_then_tracked(fake_redis):
+    fake_redis(live_sessions)
+    messages = Messages([session('s1'), session('s2'), session('s3', transfer_conversation = 1)])
+    db = Database(messages)
+
+    async def main():
+        counts = [await live_session_count(db, 'w1')]
+
+        await track_session(db.name, session('s4'))
+        await track_session(db.name, session('s1', end_conversation = 1))
+        counts.append(await live_session_count(db, 'w1'))
+
+        return counts
+
+    assert asyncio.run(main()) == [2, 2]
+    assert len(messages.scans) == 1
+    assert messages.scans[0][1]['_id'] == 0
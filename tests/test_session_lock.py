@@ -0,0 +1,164 @@
+import asyncio, pytest
+from fastapi import HTTPException
+
+from routers.chats.utilities import session_lock as module
+from routers.chats.utilities.session_lock import session_lock, session_keys, merged_result, is_merged
+
+@pytest.fixture
+def get_redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(module, 'SESSION_LOCK_POLL', 0.01)
+    return fake_redis(module)
+
+async def queued(get_redis, session_id):
+    redis = await get_redis()
+    try:
+        _, pending_key, messages_key = session_keys(session_id)
+        return await redis.lrange(pending_key, 0, -1), await redis.hkeys(messages_key)
+    finally:
+        await redis.close()
+
+async def wait_for_queue(get_redis, session_id, length):
+    while len((await queued(get_redis, session_id))[0]) < length:
+        await asyncio.sleep(0.01)
+
+async def wait_for_lock(get_redis, session_id):
+    redis = await get_redis()
+    try:
+        while not await redis.exists(session_keys(session_id)[0]):
+            await asyncio.sleep(0.01)
+    finally:
+        await redis.close()
+
+def test_turns_run_in_arrival_order(get_redis):
+    order = []
+
+    async def turn(text):
+        async with session_lock('s1', text) as (message, _):
+            order.append(('start', message))
+            await asyncio.sleep(0.05)
+            order.append(('end', message))
+
+    async def main():
+        first = asyncio.create_task(turn('one'))
+        await wait_for_lock(get_redis, 's1')
+        second = asyncio.create_task(turn('two'))
+        await asyncio.gather(first, second)
+
+        return await queued(get_redis, 's1')
+
+    assert asyncio.run(main()) == ([], [])
+    assert order == [('start', 'one'), ('end', 'one'), ('start', 'two'), ('end', 'two')]
+
+def test_cancelled_waiter_leaves_the_queue(get_redis):
+    async def main():
+        release = asyncio.Event()
+
+        async def holder():
+            async with session_lock('s1', 'one'):
+                await release.wait()
+
+        async def waiter(text):
+            async with session_lock('s1', text) as (message, _):
+                return message
+
+        first = asyncio.create_task(holder())
+        await wait_for_lock(get_redis, 's1')
+        second = asyncio.create_task(waiter('two'))
+        await wait_for_queue(get_redis, 's1', 1)
+        await asyncio.sleep(0.05)
+
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+        assert len((await queued(get_redis, 's1'))[0]) == 0
+
+        third = asyncio.create_task(waiter('three'))
+        release.set()
+        await first
+
+        return await asyncio.wait_for(third, timeout = 1), await queued(get_redis, 's1')
+
+    message, remaining = asyncio.run(main())
+
+    assert message == 'three'
+    assert remaining == ([], [])
+
+def test_timed_out_waiter_leaves_the_queue(get_redis, monkeypatch):
+    monkeypatch.setattr(module, 'SESSION_LOCK_WAIT', 0.1)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def holder():
+            async with session_lock('s1', 'one'):
+                await release.wait()
+
+        first = asyncio.create_task(holder())
+        await wait_for_lock(get_redis, 's1')
+
+        with pytest.raises(HTTPException) as error:
+            async with session_lock('s1', 'two'):
+                pass
+
+        remaining = await queued(get_redis, 's1')
+        release.set()
+        await first
+
+        return error.value.status_code, remaining
+
+    status_code, remaining = asyncio.run(main())
+
+    assert status_code == 429
+    assert remaining == ([], [])
+
+def test_lock_is_kept_alive_during_a_long_turn(get_redis, monkeypatch):
+    monkeypatch.setattr(module, 'SESSION_LOCK_TTL', 1)
+
+    async def main():
+        redis = await get_redis()
+        try:
+            async with session_lock('s1', 'one'):
+                await asyncio.sleep(1.5)
+                held = await redis.exists(session_keys('s1')[0])
+            released = await redis.exists(session_keys('s1')[0])
+        finally:
+            await redis.close()
+
+        return held, released
+
+    assert asyncio.run(main()) == (1, 0)
+
+def test_queued_mergeable_messages_are_merged(get_redis):
+    async def main():
+        release = asyncio.Event()
+        results, ids = {}, {}
+
+        async def turn(text, merge = True):
+            async with session_lock('s1', text, mergeable = True, merge = merge) as result:
+                results[text] = result
+                if text == 'one':
+                    await release.wait()
+
+        first = asyncio.create_task(turn('one', merge = False))
+        await wait_for_lock(get_redis, 's1')
+
+        second = asyncio.create_task(turn('two'))
+        await wait_for_queue(get_redis, 's1', 1)
+        ids['two'] = (await queued(get_redis, 's1'))[0][0]
+        third = asyncio.create_task(turn('three'))
+        await wait_for_queue(get_redis, 's1', 2)
+
+        release.set()
+        await asyncio.gather(first, second, third)
+
+        return results, ids, await queued(get_redis, 's1')
+
+    results, ids, remaining = asyncio.run(main())
+
+    assert results == {'one': ('one', None), 'two': ('two\nthree', None), 'three': (None, ids['two'])}
+    assert remaining == ([], [])
+
+def test_merged_result_is_told_apart_from_an_answer():
+    assert is_merged(merged_result('m1')) and merged_result('m1')['into'] == 'm1'
+    assert not is_merged("Message has been merged")
+    assert not is_merged({'detail': 'answer'})
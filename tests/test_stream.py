@@ -0,0 +1,20 @@
+import asyncio, json
+
+from routers.chats.utilities.stream import stream_flow
+from routers.chats.utilities.session_lock import merged_result
+
+async def events(flow):
+    return [event async for event in stream_flow(flow)]
+
+def test_answer_ends_the_stream_with_done():
+    async def flow(stream = None):
+        stream.put_nowait(('token', 'Hel'))
+        return "Hello"
+
+    assert asyncio.run(events(flow)) == [{'event': 'token', 'data': 'Hel'}, {'event': 'done', 'data': json.dumps({'detail': "Hello"})}]
+
+def test_merged_message_ends_the_stream_with_merged():
+    async def flow(stream = None):
+        return merged_result('m1')
+
+    assert asyncio.run(events(flow)) == [{'event': 'merged', 'data': json.dumps({'merged': True, 'into': 'm1'})}]
@@ -0,0 +1,26 @@
+from utilities import vectorstores
+from utilities.vectorstores import cached_retrieval, write_index_version
+
+workspace_record = {
+    'company_id': 'c', 'bot_id': 'b', 'workspace_id': 'w', 'embeddings': 'openai', 'embeddings_model': 'm', 'vectordb': 'faiss'
+}
+
+def test_rewritten_index_is_reloaded(tmp_path, monkeypatch):
+    loads = []
+
+    monkeypatch.setattr(vectorstores, 'vectorstores', vectorstores.OrderedDict())
+    monkeypatch.setattr(vectorstores, 'embeddings_path', lambda *workspace_key: str(tmp_path))
+    monkeypatch.setattr(vectorstores, 'load_embeddings', lambda workspace_record: 'embeddings')
+    monkeypatch.setattr(vectorstores, 'open_vectorstore', lambda workspace_record, embeddings, path: loads.append(path) or len(loads))
+    monkeypatch.setattr(vectorstores.LexicalIndex, 'load', staticmethod(lambda path: None))
+
+    write_index_version(str(tmp_path))
+
+    assert cached_retrieval(workspace_record)[1] == 1
+    assert cached_retrieval(workspace_record)[1] == 1
+
+    # Another process rewrote the index in place, only the version file tells
+    write_index_version(str(tmp_path))
+
+    assert cached_retrieval(workspace_record)[1] == 2
+    assert len(loads) == 2
@@ -0,0 +1,91 @@
+import time, threading
+import numpy as np
+from collections import OrderedDict
+from decouple import config
+
+ANSWER_CACHE_TTL = config("ANSWER_CACHE_TTL", default = 86400, cast = int)
+ANSWER_CACHE_SIZE = config("ANSWER_CACHE_SIZE", default = 500, cast = int)
+ANSWER_CACHE_THRESHOLD = config("ANSWER_CACHE_THRESHOLD", default = 0.95, cast = float)
+
+workspaces = {}
+statistics = {'hits': 0, 'misses': 0, 'stores': 0, 'expirations': 0, 'invalidations': 0}
+
+lock = threading.Lock()
+
+def workspace_key(workspace_record):
+    return workspace_record['company_id'], workspace_record['bot_id'], workspace_record['workspace_id']
+
+def normalize(vector):
+    vector = np.asarray(vector, dtype = np.float32)
+    norm = np.linalg.norm(vector)
+
+    return vector / norm if norm else vector
+
+def cache_threshold(configuration_record):
+    threshold = configuration_record.get('semantic_cache_threshold')
+
+    return float(threshold) if threshold else ANSWER_CACHE_THRESHOLD
+
+def expire(entries):
+    now = time.monotonic()
+
+    for question in [question for question, entry in entries.items() if now - entry['stored_at'] >= ANSWER_CACHE_TTL]:
+        entries.pop(question)
+        statistics['expirations'] += 1
+
+def lookup_answer(workspace_record, configuration_record, vector):
+    vector = normalize(vector)
+
+    with lock:
+        entries = workspaces.get(workspace_key(workspace_record))
+        if entries:
+            expire(entries)
+
+        if not entries:
+            statistics['misses'] += 1
+            return None
+
+        questions = list(entries)
+        similarities = np.stack([entries[question]['vector'] for question in questions]) @ vector
+        best = int(np.argmax(similarities))
+
+        if similarities[best] < cache_threshold(configuration_record):
+            statistics['misses'] += 1
+            return None
+
+        entry = entries[questions[best]]
+        entries.move_to_end(questions[best])
+        entry['hits'] += 1
+        statistics['hits'] += 1
+
+        return entry['answer']
+
+def store_answer(workspace_record, question, vector, answer):
+    with lock:
+        entries = workspaces.setdefault(workspace_key(workspace_record), OrderedDict())
+
+        entries[question] = {'vector': normalize(vector), 'answer': answer, 'stored_at': time.monotonic(), 'hits': 0}
+        entries.move_to_end(question)
+        statistics['stores'] += 1
+
+        while len(entries) > ANSWER_CACHE_SIZE:
+            entries.popitem(last = False)
+
+def invalidate_answers(company_id, bot_id, workspace_id):
+    with lock:
+        if workspaces.pop((company_id, bot_id, workspace_id), None) is not None:
+            statistics['invalidations'] += 1
+
+def answer_cache_statistics():
+    with lock:
+        lookups = statistics['hits'] + statistics['misses']
+
+        return {
+            **statistics,
+            'hit_rate': round(statistics['hits'] / lookups, 4) if lookups else 0.0,
+            'ttl': ANSWER_CACHE_TTL, 'threshold': ANSWER_CACHE_THRESHOLD,
+            'workspaces': [
+                {'company_id': key[0], 'bot_id': key[1], 'workspace_id': key[2], 'entries': len(entries)}
+                for key, entries in workspaces.items()
+            ]
+        }
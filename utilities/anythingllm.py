@@ -0,0 +1,147 @@
+import asyncio, hashlib, aiohttp
+from decouple import config
+
+from utilities.redis import get_redis
+
+ANYTHINGLLM_TIMEOUT = config("ANYTHINGLLM_TIMEOUT", default = 120, cast = float)
+ANYTHINGLLM_MAX_CONNECTIONS = config("ANYTHINGLLM_MAX_CONNECTIONS", default = 20, cast = int)
+ANYTHINGLLM_RETRIES = config("ANYTHINGLLM_RETRIES", default = 2, cast = int)
+ANYTHINGLLM_THREAD_POOL_SIZE = config("ANYTHINGLLM_THREAD_POOL_SIZE", default = 3, cast = int)
+ANYTHINGLLM_SLUG_TTL = config("ANYTHINGLLM_SLUG_TTL", default = 86400, cast = int)
+
+RETRY_STATUSES = [502, 503, 504]
+
+session = None
+refill_tasks = {}
+
+def get_session():
+    global session
+
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector = aiohttp.TCPConnector(limit = ANYTHINGLLM_MAX_CONNECTIONS),
+            timeout = aiohttp.ClientTimeout(total = ANYTHINGLLM_TIMEOUT)
+        )
+
+    return session
+
+async def close_anythingllm_session():
+    global session
+
+    for task in list(refill_tasks.values()):
+        task.cancel()
+
+    if session is not None and not session.closed:
+        await session.close()
+
+    session = None
+
+def anythingllm_headers(workspace_record):
+    return {
+        'accept': 'application/json',
+        'Authorization': f"Bearer {workspace_record['llm_api_key']}",
+        'Content-Type': 'application/json'
+    }
+
+def workspace_url(workspace_record):
+    return f"{workspace_record['llm_url']}/api/v1/workspace/{workspace_record['model']}"
+
+async def anythingllm_post(workspace_record, path, data = None):
+    client = get_session()
+    url = workspace_url(workspace_record) + path
+
+    for attempt in range(ANYTHINGLLM_RETRIES + 1):
+        try:
+            async with client.post(url, headers = anythingllm_headers(workspace_record), json = data) as response:
+                if response.status in RETRY_STATUSES and attempt < ANYTHINGLLM_RETRIES:
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+                    continue
+
+                response.raise_for_status()
+                return await response.json(content_type = None)
+
+        except aiohttp.ClientConnectionError:
+            if attempt == ANYTHINGLLM_RETRIES:
+                raise
+
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+async def anythingllm_chat(workspace_record, slug, message):
+    response = await anythingllm_post(workspace_record, f"/thread/{slug}/chat", {"message": message, "mode": "chat"})
+
+    return response['textResponse']
+
+def pool_key(workspace_record):
+    url = hashlib.sha256(workspace_record['llm_url'].encode()).hexdigest()[:12]
+
+    return (
+        f"anythingllm:threads:{workspace_record['company_id']}:{workspace_record['bot_id']}:{workspace_record['workspace_id']}:"
+        f"{url}:{workspace_record['model']}"
+    )
+
+async def create_thread(workspace_record):
+    response = await anythingllm_post(workspace_record, "/thread/new")
+
+    return response['thread']['slug']
+
+async def refill_threads(workspace_record):
+    key = pool_key(workspace_record)
+    redis = await get_redis()
+
+    try:
+        while await redis.llen(key) < ANYTHINGLLM_THREAD_POOL_SIZE:
+            await redis.lpush(key, await create_thread(workspace_record))
+    except Exception:
+        pass
+    finally:
+        refill_tasks.pop(key, None)
+        await redis.close()
+
+def schedule_refill(workspace_record):
+    key = pool_key(workspace_record)
+
+    if ANYTHINGLLM_THREAD_POOL_SIZE > 0 and key not in refill_tasks:
+        refill_tasks[key] = asyncio.create_task(refill_threads(workspace_record))
+
+async def take_thread(workspace_record):
+    redis = await get_redis()
+
+    try:
+        slug = await redis.rpop(pool_key(workspace_record))
+    finally:
+        await redis.close()
+
+    schedule_refill(workspace_record)
+
+    return slug or await create_thread(workspace_record)
+
+async def remember_slug(session_id, slug):
+    redis = await get_redis()
+    await redis.set(f"anythingllm:slug:{session_id}", slug, ex = ANYTHINGLLM_SLUG_TTL)
+    await redis.close()
+
+async def session_slug(messages_collections, session_id):
+    redis = await get_redis()
+
+    try:
+        slug = await redis.get(f"anythingllm:slug:{session_id}")
+        if slug:
+            return slug
+
+        message_record = await messages_collections.find_one({'session_id': session_id}, {'slug': 1})
+        slug = message_record['slug']
+
+        await redis.set(f"anythingllm:slug:{session_id}", slug, ex = ANYTHINGLLM_SLUG_TTL)
+        return slug
+
+    finally:
+        await redis.close()
+
+async def session_thread(workspace_record, message_record, session_id):
+    if message_record:
+        return message_record['slug']
+
+    slug = await take_thread(workspace_record)
+    await remember_slug(session_id, slug)
+
+    return slug
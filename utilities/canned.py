@@ -0,0 +1,137 @@
+import json, asyncio
+from decouple import config
+from langchain_core.messages import AIMessage
+
+from utilities.redis import get_redis
+from utilities.llm import workspace_chat_model, response_tokens
+
+CANNED_REPLIES_VARIANTS = config("CANNED_REPLIES_VARIANTS", default = 5, cast = int)
+CANNED_REPLIES_TTL = config("CANNED_REPLIES_TTL", default = 86400, cast = int)
+CANNED_REPLIES_REFRESH = config("CANNED_REPLIES_REFRESH", default = 21600, cast = int)
+CANNED_REPLIES_RETRY = config("CANNED_REPLIES_RETRY", default = 1800, cast = int)
+
+language_english = config("LANGUAGE_ENGLISH")
+language_arabic = config("LANGUAGE_ARABIC")
+
+control_prompts = {
+    'language': {language_english: config("DISPLAY_LANGUAGE_ENGLISH"), language_arabic: config("DISPLAY_LANGUAGE_ARABIC")},
+    'goodbye': {language_english: config("PROMPT_GOODBYE_ENGLISH"), language_arabic: config("PROMPT_GOODBYE_ARABIC")},
+    'transfer': {language_english: config("PROMPT_TRANSFER_ENGLISH"), language_arabic: config("PROMPT_TRANSFER_ARABIC")}
+}
+
+build_tasks = {}
+
+def workspace_key(workspace_record):
+    return f"{workspace_record['company_id']}:{workspace_record['bot_id']}:{workspace_record['workspace_id']}"
+
+def replies_key(workspace_record, kind, language):
+    return f"canned:{workspace_key(workspace_record)}:{kind}:{language}"
+
+def failed_key(workspace_record, kind, language):
+    return replies_key(workspace_record, kind, language) + ':failed'
+
+def all_pools():
+    return [(kind, language) for kind, prompts in control_prompts.items() for language in prompts]
+
+async def generate_reply(workspace_record, kind, language, llm = None):
+    llm = llm or workspace_chat_model(workspace_record)
+    prompt = control_prompts[kind][language]
+
+    if kind == 'language':
+        response = await llm.ainvoke([("system", workspace_record['system_prompt']), ("human", prompt)])
+    else:
+        response = await llm.ainvoke(prompt)
+
+    text = response.content.replace('"', '') if kind == 'transfer' else response.content
+    input_tokens, output_tokens = response_tokens(workspace_record, response)
+
+    return {'text': text, 'input_tokens': input_tokens, 'output_tokens': output_tokens}
+
+# A pool whose variants all fail (bad key, missing model) is marked failed and
+# left alone for CANNED_REPLIES_RETRY instead of being rebuilt on every sweep;
+# requests fall back to the LLM meanwhile.
+async def build_replies(workspace_record, pools):
+    redis = await get_redis()
+
+    try:
+        for kind, language in pools:
+            variants = await asyncio.gather(
+                *[generate_reply(workspace_record, kind, language) for _ in range(CANNED_REPLIES_VARIANTS)],
+                return_exceptions = True
+            )
+            variants = [json.dumps(variant) for variant in variants if isinstance(variant, dict) and variant['text']]
+
+            key = replies_key(workspace_record, kind, language)
+            async with redis.pipeline(transaction = True) as pipe:
+                if variants:
+                    pipe.delete(key)
+                    pipe.sadd(key, *variants)
+                    pipe.expire(key, CANNED_REPLIES_TTL)
+                    pipe.delete(failed_key(workspace_record, kind, language))
+                else:
+                    pipe.set(failed_key(workspace_record, kind, language), 1, ex = CANNED_REPLIES_RETRY)
+                await pipe.execute()
+    finally:
+        build_tasks.pop(workspace_key(workspace_record), None)
+        await redis.close()
+
+def schedule_replies(workspace_record, pools = None):
+    key = workspace_key(workspace_record)
+
+    if workspace_record['llm'] == 'anythingllm' or CANNED_REPLIES_VARIANTS <= 0 or key in build_tasks:
+        return
+
+    build_tasks[key] = asyncio.create_task(build_replies(workspace_record, pools or all_pools()))
+
+# Rebuilds only the pools that are missing or due for a refresh, and not
+# marked failed
+async def stale_pools(redis, workspace_record, pools):
+    async with redis.pipeline(transaction = False) as pipe:
+        for kind, language in pools:
+            pipe.ttl(replies_key(workspace_record, kind, language))
+            pipe.exists(failed_key(workspace_record, kind, language))
+        results = await pipe.execute()
+
+    return [
+        pool for pool, ttl, failed in zip(pools, results[0::2], results[1::2])
+        if not failed and ttl < CANNED_REPLIES_TTL - CANNED_REPLIES_REFRESH
+    ]
+
+async def refresh_replies(workspace_record):
+    if workspace_record['llm'] == 'anythingllm':
+        return
+
+    redis = await get_redis()
+
+    try:
+        pools = await stale_pools(redis, workspace_record, all_pools())
+    finally:
+        await redis.close()
+
+    if pools:
+        schedule_replies(workspace_record, pools)
+
+async def canned_reply(workspace_record, kind, language):
+    if workspace_record['llm'] == 'anythingllm' or language not in control_prompts[kind]:
+        return None
+
+    redis = await get_redis()
+
+    try:
+        reply = await redis.srandmember(replies_key(workspace_record, kind, language))
+        pools = [] if reply else await stale_pools(redis, workspace_record, [(kind, language)])
+    finally:
+        await redis.close()
+
+    if not reply:
+        if pools:
+            schedule_replies(workspace_record, pools)
+        return None
+
+    return json.loads(reply)
+
+def canned_message(reply):
+    return AIMessage(content = reply['text'], usage_metadata = {
+        'input_tokens': reply['input_tokens'], 'output_tokens': reply['output_tokens'],
+        'total_tokens': reply['input_tokens'] + reply['output_tokens']
+    })
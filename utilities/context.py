@@ -0,0 +1,106 @@
+import re, tiktoken
+from decouple import config
+from nltk.tokenize import sent_tokenize
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+from utilities.hybrid import tokenize
+
+CONTEXT_TOKEN_BUDGET = config("CONTEXT_TOKEN_BUDGET", default = 1500, cast = int)
+CONTEXT_MIN_TOKENS = config("CONTEXT_MIN_TOKENS", default = 32, cast = int)
+CONTEXT_MIN_OVERLAP = config("CONTEXT_MIN_OVERLAP", default = 20, cast = int)
+CONTEXT_MAX_OVERLAP = config("CONTEXT_MAX_OVERLAP", default = 200, cast = int)
+
+enc = tiktoken.get_encoding("cl100k_base")
+
+sentence_pattern = re.compile(r"(?<=[.!?؟])\s+")
+
+def context_budget(workspace_record):
+    return int(workspace_record.get('context_tokens') or CONTEXT_TOKEN_BUDGET)
+
+def split_sentences(text):
+    try:
+        return sent_tokenize(text)
+    except LookupError:
+        return sentence_pattern.split(text)
+
+def overlap(previous, current):
+    for size in range(min(len(previous), len(current), CONTEXT_MAX_OVERLAP), CONTEXT_MIN_OVERLAP - 1, -1):
+        if previous.endswith(current[:size]):
+            return size
+
+    return 0
+
+# The splitter repeats up to 50 characters between neighbouring chunks of a
+# source; that repeated head is cut, and chunks already contained in a kept
+# chunk of the same source are dropped.
+def deduplicate(documents):
+    kept = []
+
+    for document in documents:
+        content = document.page_content
+        same_source = [other.page_content for other in kept if other.metadata.get('source') == document.metadata.get('source')]
+
+        if any(content in other for other in same_source):
+            continue
+
+        for other in same_source:
+            size = overlap(other, content)
+            if size:
+                content = content[size:]
+
+        kept.append(Document(page_content = content.strip(), metadata = document.metadata))
+
+    return [document for document in kept if document.page_content]
+
+def relevant_sentences(query, text):
+    terms = set(tokenize(query))
+    sentences = split_sentences(text)
+
+    scores = [len(terms & set(tokenize(sentence))) for sentence in sentences]
+    best = max(scores, default = 0)
+    if not best:
+        return text
+
+    return ' '.join(sentence for sentence, score in zip(sentences, scores) if score * 2 >= best)
+
+def trim_to_tokens(text, tokens):
+    selected, used = [], 0
+
+    for sentence in split_sentences(text):
+        count = len(enc.encode(sentence)) + 1
+        if used + count > tokens:
+            break
+        selected.append(sentence)
+        used += count
+
+    return ' '.join(selected) if selected else enc.decode(enc.encode(text)[:tokens])
+
+def pack_context(query, documents, budget, sentences = False):
+    packed, remaining = [], budget
+
+    for document in deduplicate(documents):
+        content = relevant_sentences(query, document.page_content) if sentences else document.page_content
+        tokens = len(enc.encode(content)) + 3
+
+        if tokens > remaining:
+            if remaining - 3 < CONTEXT_MIN_TOKENS:
+                break
+            content = trim_to_tokens(content, remaining - 3)
+            tokens = len(enc.encode(content)) + 3
+
+        packed.append(Document(page_content = content, metadata = document.metadata))
+        remaining -= tokens
+
+    return packed
+
+def packed_retriever(retriever, workspace_record):
+    budget, sentences = context_budget(workspace_record), bool(workspace_record.get('context_sentences'))
+
+    def retrieve(inputs):
+        return pack_context(inputs['input'], retriever.invoke(inputs['input']), budget, sentences)
+
+    async def aretrieve(inputs):
+        return pack_context(inputs['input'], await retriever.ainvoke(inputs['input']), budget, sentences)
+
+    return RunnableLambda(retrieve, afunc = aretrieve)
@@ -1,8 +1,9 @@
-import string, urllib
+import string, json, tiktoken
 from decouple import config
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import MongoClient
-from langchain_mongodb.chat_message_histories import MongoDBChatMessageHistory
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import message_to_dict, messages_from_dict
 
 
 punc = string.punctuation
@@ -14,47 +15,148 @@ password = config("DATABASE_PASSWORD")
 database = config("DATABASE_NAME")
 slug_db = config("SLUG_DATABASE")
 
+max_pool_size = config("DATABASE_MAX_POOL_SIZE", default = 100, cast = int)
+min_pool_size = config("DATABASE_MIN_POOL_SIZE", default = 0, cast = int)
+max_idle_time_ms = config("DATABASE_MAX_IDLE_TIME_MS", default = 300000, cast = int)
+server_selection_timeout_ms = config("DATABASE_SERVER_SELECTION_TIMEOUT_MS", default = 30000, cast = int)
+
+HISTORY_TOKEN_BUDGET = config("HISTORY_TOKEN_BUDGET", default = 3000, cast = int)
+
+enc = tiktoken.get_encoding("cl100k_base")
+
+# One client per process and driver flavour. Every database handle (the main
+# database and each `<bot_name><SLUG_DATABASE>` tenant database) is taken from
+# these clients so the connection pool is shared instead of rebuilt per call.
+clients = {}
+
+def client_options():
+    options = {
+        'host': host,
+        'maxPoolSize': max_pool_size,
+        'minPoolSize': min_pool_size,
+        'maxIdleTimeMS': max_idle_time_ms,
+        'serverSelectionTimeoutMS': server_selection_timeout_ms
+    }
+
+    if username and password:
+        options['username'] = username
+        options['password'] = password
+
+    return options
+
+def get_client():
+    if 'async' not in clients:
+        clients['async'] = AsyncIOMotorClient(**client_options())
+    return clients['async']
+
+def get_sync_client():
+    if 'sync' not in clients:
+        clients['sync'] = MongoClient(**client_options())
+    return clients['sync']
+
+async def open_connections():
+    client = get_client()
+    await client.admin.command('ping')
+
+async def close_connections():
+    for key in list(clients.keys()):
+        clients.pop(key).close()
+
 async def connect(database = database):
-    client = AsyncIOMotorClient(
-        host=host,
-        username=username,
-        password=password
-    )
-    return client[database]
+    return get_client()[database]
 
 async def database_names():
-    if username and password:  
-        username_encoded = urllib.parse.quote_plus(username)
-        password_encoded = urllib.parse.quote_plus(password)
-                
-        connection_string = f"mongodb://{username_encoded}:{password_encoded}@{host}:27017"
-    else:   
-        connection_string = f"mongodb://{host}:27017",
-
-    client = AsyncIOMotorClient(connection_string)
-    
-    db_names = await client.list_database_names()
+    db_names = await get_client().list_database_names()
     filtered_db_names = [temp for temp in db_names if slug_db in temp]
 
     return filtered_db_names
 
 def connect_sync(database = database):
-    client = MongoClient(
-        host=host,
-        username=username,
-        password=password
-    )
-    return client[database]
+    return get_sync_client()[database]
 
 def format_docs(docs):
     return "\n\n".join(doc.page_content for doc in docs)
 
-def get_limited_message_history(session_id, connection_string, database_name, collection_name):
-    history = MongoDBChatMessageHistory(
-        session_id=session_id,
-        connection_string=connection_string,
-        database_name=database_name,
-        collection_name=collection_name,
-    )
+class MotorChatMessageHistory(BaseChatMessageHistory):
+    def __init__(self, session_id, database_name, collection_name = "history", token_budget = None):
+        self.session_id = session_id
+        self.database_name = database_name
+        self.collection_name = collection_name
+        self.token_budget = token_budget
+
+    def async_collection(self):
+        return get_client()[self.database_name][self.collection_name]
+
+    def sync_collection(self):
+        return get_sync_client()[self.database_name][self.collection_name]
+
+    def documents(self, messages):
+        return [
+            {"SessionId": self.session_id, "History": json.dumps(message_to_dict(message)), "tokens": len(enc.encode(str(message.content)))}
+            for message in messages
+        ]
+
+    # Walks the session newest first and finds the first AI message (odd
+    # position, the newest exchange excluded) whose exchange pushes the running
+    # token total over the budget; it and everything older go in one delete.
+    def cutoff_pipeline(self):
+        return [
+            {"$match": {"SessionId": self.session_id}},
+            {"$setWindowFields": {
+                "sortBy": {"_id": -1},
+                "output": {
+                    "position": {"$documentNumber": {}},
+                    "total": {"$sum": {"$ifNull": ["$tokens", 0]}, "window": {"documents": ["unbounded", 1]}}
+                }
+            }},
+            {"$match": {"position": {"$gt": 2}, "total": {"$gt": self.token_budget}, "$expr": {"$eq": [{"$mod": ["$position", 2]}, 1]}}},
+            {"$limit": 1},
+            {"$project": {"_id": 1}}
+        ]
+
+    @property
+    def messages(self):
+        cursor = self.sync_collection().find({"SessionId": self.session_id}, sort = [("_id", 1)])
+
+        return messages_from_dict([json.loads(document["History"]) for document in cursor])
+
+    async def aget_messages(self):
+        cursor = self.async_collection().find({"SessionId": self.session_id}, sort = [("_id", 1)])
+
+        return messages_from_dict([json.loads(document["History"]) async for document in cursor])
+
+    def add_messages(self, messages):
+        if messages:
+            self.sync_collection().insert_many(self.documents(messages))
+            self.trim()
+
+    async def aadd_messages(self, messages):
+        if messages:
+            await self.async_collection().insert_many(self.documents(messages))
+            await self.atrim()
+
+    def trim(self):
+        if not self.token_budget:
+            return
+
+        for cutoff in self.sync_collection().aggregate(self.cutoff_pipeline()):
+            self.sync_collection().delete_many({"SessionId": self.session_id, "_id": {"$lte": cutoff["_id"]}})
+
+    async def atrim(self):
+        if not self.token_budget:
+            return
+
+        async for cutoff in self.async_collection().aggregate(self.cutoff_pipeline()):
+            await self.async_collection().delete_many({"SessionId": self.session_id, "_id": {"$lte": cutoff["_id"]}})
+
+    def clear(self):
+        self.sync_collection().delete_many({"SessionId": self.session_id})
+
+    async def aclear(self):
+        await self.async_collection().delete_many({"SessionId": self.session_id})
+
+def history_budget(workspace_record):
+    return int(workspace_record.get('history_tokens') or HISTORY_TOKEN_BUDGET)
 
-    return history
\ No newline at end of file
+def get_limited_message_history(session_id, database_name, collection_name = "history", token_budget = None):
+    return MotorChatMessageHistory(session_id, database_name, collection_name, token_budget)
@@ -0,0 +1,100 @@
+import os, threading, torch
+from collections import OrderedDict
+from decouple import config
+from langchain_huggingface import HuggingFaceEmbeddings
+
+EMBEDDINGS_DEVICE = config("EMBEDDINGS_DEVICE", default = "cpu")
+EMBEDDINGS_TORCH_THREADS = config("EMBEDDINGS_TORCH_THREADS", default = os.cpu_count() or 1, cast = int)
+EMBEDDINGS_MEMORY_CAP_MB = config("EMBEDDINGS_MEMORY_CAP_MB", default = 4096, cast = int)
+
+models = OrderedDict()
+loading = {}
+eviction_listeners = []
+
+lock = threading.Lock()
+torch_configured = False
+
+def configure_torch():
+    global torch_configured
+
+    if torch_configured:
+        return
+
+    torch.set_num_threads(EMBEDDINGS_TORCH_THREADS)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+
+    torch_configured = True
+
+def model_size(embeddings):
+    client = getattr(embeddings, '_client', None)
+    if client is None or not hasattr(client, 'parameters'):
+        return 0
+
+    return sum(parameter.numel() * parameter.element_size() for parameter in client.parameters())
+
+def resident_size():
+    return sum(size for _, size in models.values())
+
+def evict():
+    evicted = []
+    while len(models) > 1 and resident_size() > EMBEDDINGS_MEMORY_CAP_MB * 1024 * 1024:
+        evicted.append(models.popitem(last = False)[0])
+
+    return evicted
+
+# Anything else holding an evicted model (cached vectorstores) has to let go
+# of it too, or the memory is not freed and the next load makes a second copy
+def on_eviction(listener):
+    eviction_listeners.append(listener)
+
+def release_models(evicted):
+    for model_name in evicted:
+        for listener in eviction_listeners:
+            listener(model_name)
+
+    if evicted and EMBEDDINGS_DEVICE.startswith('cuda'):
+        torch.cuda.empty_cache()
+
+def is_resident(model_name):
+    with lock:
+        return model_name in models
+
+def huggingface_embeddings(model_name):
+    with lock:
+        if model_name in models:
+            models.move_to_end(model_name)
+            return models[model_name][0]
+
+        model_lock = loading.setdefault(model_name, threading.Lock())
+
+    with model_lock:
+        with lock:
+            if model_name in models:
+                models.move_to_end(model_name)
+                return models[model_name][0]
+
+            configure_torch()
+
+        embeddings = HuggingFaceEmbeddings(
+            model_name = model_name, model_kwargs = {'device': EMBEDDINGS_DEVICE}, encode_kwargs = {'normalize_embeddings': False}
+        )
+
+        with lock:
+            models[model_name] = (embeddings, model_size(embeddings))
+            loading.pop(model_name, None)
+            evicted = evict()
+
+    release_models(evicted)
+
+    return embeddings
+
+def huggingface_statistics():
+    with lock:
+        return {
+            'device': EMBEDDINGS_DEVICE, 'torch_threads': EMBEDDINGS_TORCH_THREADS,
+            'resident_bytes': resident_size(), 'max_bytes': EMBEDDINGS_MEMORY_CAP_MB * 1024 * 1024,
+            'models': [{'model_name': model_name, 'size': size} for model_name, (_, size) in models.items()]
+        }
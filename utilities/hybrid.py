@@ -0,0 +1,122 @@
+import os, re, json, math
+from typing import Any
+from collections import Counter, defaultdict
+from decouple import config
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+BM25_K1 = config("BM25_K1", default = 1.5, cast = float)
+BM25_B = config("BM25_B", default = 0.75, cast = float)
+HYBRID_CANDIDATES = config("HYBRID_CANDIDATES", default = 20, cast = int)
+RRF_K = config("RRF_K", default = 60, cast = int)
+
+LEXICAL_INDEX_FILE = "bm25.json"
+
+# Keeps codes such as "XK-4471", "v2.1" or "A/B" together as single terms.
+token_pattern = re.compile(r"\w(?:[\w\-./]*\w)?")
+
+def tokenize(text):
+    tokens = token_pattern.findall(text.lower())
+    parts = [part for token in tokens if not token.isalnum() for part in re.split(r"[\-./]", token) if part]
+
+    return tokens + parts
+
+def document_key(document):
+    return document.metadata.get('source'), document.page_content
+
+class LexicalIndex:
+    def __init__(self, documents, postings, lengths):
+        self.documents = documents
+        self.postings = postings
+        self.lengths = lengths
+        self.average_length = sum(lengths) / len(lengths) if lengths else 0.0
+
+    @classmethod
+    def build(cls, documents):
+        postings = defaultdict(list)
+        lengths = []
+
+        for index, document in enumerate(documents):
+            terms = tokenize(document.page_content)
+            lengths.append(len(terms))
+
+            for term, frequency in Counter(terms).items():
+                postings[term].append([index, frequency])
+
+        return cls(documents, dict(postings), lengths)
+
+    def save(self, path):
+        index = {
+            'documents': [{'page_content': document.page_content, 'metadata': document.metadata} for document in self.documents],
+            'postings': self.postings, 'lengths': self.lengths
+        }
+
+        with open(os.path.join(path, LEXICAL_INDEX_FILE), 'w') as file:
+            json.dump(index, file, default = str)
+
+    @classmethod
+    def load(cls, path):
+        file_path = os.path.join(path, LEXICAL_INDEX_FILE)
+        if not os.path.exists(file_path):
+            return None
+
+        with open(file_path) as file:
+            index = json.load(file)
+
+        documents = [Document(page_content = document['page_content'], metadata = document['metadata']) for document in index['documents']]
+
+        return cls(documents, index['postings'], index['lengths'])
+
+    def search(self, query, k):
+        scores = defaultdict(float)
+        count = len(self.documents)
+
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, frequency in postings:
+                norm = 1 - BM25_B + BM25_B * self.lengths[index] / self.average_length
+                scores[index] += idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * norm)
+
+        ranked = sorted(scores.items(), key = lambda item: item[1], reverse = True)[:k]
+
+        return [self.documents[index] for index, _ in ranked]
+
+def reciprocal_rank_fusion(rankings, k):
+    scores = defaultdict(float)
+    documents = {}
+
+    for ranking in rankings:
+        for rank, document in enumerate(ranking):
+            key = document_key(document)
+            scores[key] += 1 / (RRF_K + rank + 1)
+            documents.setdefault(key, document)
+
+    return [documents[key] for key in sorted(scores, key = scores.get, reverse = True)[:k]]
+
+class HybridRetriever(BaseRetriever):
+    vectorstore: Any
+    lexical: Any
+    k: int = 4
+    candidates: int = HYBRID_CANDIDATES
+
+    def _get_relevant_documents(self, query, *, run_manager = None):
+        fetch = max(self.k, self.candidates)
+        dense = self.vectorstore.similarity_search(query, k = fetch)
+
+        return reciprocal_rank_fusion([dense, self.lexical.search(query, fetch)], self.k)
+
+    async def _aget_relevant_documents(self, query, *, run_manager = None):
+        fetch = max(self.k, self.candidates)
+        dense = await self.vectorstore.asimilarity_search(query, k = fetch)
+
+        return reciprocal_rank_fusion([dense, self.lexical.search(query, fetch)], self.k)
+
+def hybrid_retriever(vectorstore, lexical, k):
+    if lexical is None:
+        return vectorstore.as_retriever(search_kwargs = {"k": k})
+
+    return HybridRetriever(vectorstore = vectorstore, lexical = lexical, k = k)
@@ -0,0 +1,260 @@
+import os, json, shutil, hashlib, threading
+from collections import Counter
+from decouple import config
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS, LanceDB
+from langchain_chroma import Chroma
+from lancedb.rerankers import LinearCombinationReranker
+
+from utilities.vectorstores import embeddings_path, load_embeddings, write_index_version
+from utilities.hybrid import LexicalIndex
+from utilities.parsing import submit_record, parsed_records
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 50
+
+INDEX_BATCH_SIZE = config("INDEX_BATCH_SIZE", default = 64, cast = int)
+
+MANIFEST_FILE = "manifest.json"
+
+locks = {}
+locks_lock = threading.Lock()
+
+def ignore(*args, **kwargs):
+    pass
+
+def workspace_lock(workspace_key):
+    with locks_lock:
+        return locks.setdefault(workspace_key, threading.Lock())
+
+def documents_path(company_id, bot_id, workspace_id):
+    return f"library/{company_id}/{bot_id}/{workspace_id}/documents"
+
+def text_splitter():
+    return RecursiveCharacterTextSplitter(
+        separators=["\n\n", "\n", " ", ".", ",", ""],
+        chunk_size = CHUNK_SIZE,
+        chunk_overlap = CHUNK_OVERLAP,
+        length_function = len,
+        is_separator_regex = False,
+    )
+
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+def content_hash(*parts):
+    return hashlib.sha256(json.dumps(parts, default = str).encode()).hexdigest()
+
+# A chunk keeps its id, and therefore its vector, for as long as its text and
+# position in the source stay the same.
+def split_record(record, data):
+    chunks = text_splitter().split_documents(data)
+    occurrences = Counter()
+
+    for chunk in chunks:
+        key = (chunk.metadata.get('source'), chunk.metadata.get('page'), chunk.page_content)
+        chunk.metadata['document_id'] = record['document_id']
+        chunk.metadata['chunk_id'] = content_hash(record['document_id'], *key, occurrences[key])
+        occurrences[key] += 1
+
+    return chunks
+
+def index_signature(workspace_record):
+    return {
+        'embeddings': workspace_record['embeddings'], 'embeddings_model': workspace_record['embeddings_model'],
+        'vectordb': workspace_record['vectordb'], 'chunk_size': CHUNK_SIZE, 'chunk_overlap': CHUNK_OVERLAP
+    }
+
+def read_manifest(path):
+    file_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(file_path):
+        return None
+
+    with open(file_path) as file:
+        return json.load(file)
+
+def write_manifest(path, manifest):
+    with open(os.path.join(path, MANIFEST_FILE), 'w') as file:
+        json.dump(manifest, file)
+
+# Chroma keeps its sqlite file open per path for the life of the process, so
+# its collection is dropped in place rather than deleting the file under it.
+def clear_index(workspace_record, path):
+    keep = set()
+    if workspace_record['vectordb'] == 'chroma' and os.path.exists(os.path.join(path, 'chroma.sqlite3')):
+        Chroma(persist_directory = path).delete_collection()
+        keep.add('chroma.sqlite3')
+
+    for item_name in set(os.listdir(path)) - keep:
+        item_path = os.path.join(path, item_name)
+
+        if os.path.isfile(item_path):
+            os.remove(item_path)
+        elif os.path.isdir(item_path):
+            shutil.rmtree(item_path)
+
+def batches(chunks):
+    for start in range(0, len(chunks), INDEX_BATCH_SIZE):
+        batch = chunks[start:start + INDEX_BATCH_SIZE]
+        yield batch, [chunk.metadata['chunk_id'] for chunk in batch]
+
+def update_vectorstore(workspace_record, path, added, removed, report = None):
+    if not added and not removed:
+        return
+
+    report = report or ignore
+    embeddings = load_embeddings(workspace_record)
+
+    if workspace_record['vectordb'] == 'faiss':
+        vector_store = None
+        if os.path.exists(os.path.join(path, 'index.faiss')):
+            vector_store = FAISS.load_local(path, embeddings, allow_dangerous_deserialization = True)
+            if removed:
+                vector_store.delete(removed)
+
+        for batch, ids in batches(added):
+            if vector_store is None:
+                vector_store = FAISS.from_documents(batch, embeddings, ids = ids)
+            else:
+                vector_store.add_documents(batch, ids = ids)
+            report('embedded', count = len(batch))
+
+        if vector_store is not None:
+            vector_store.save_local(path)
+        return
+
+    if workspace_record['vectordb'] == 'chroma':
+        vector_store = Chroma(persist_directory = path, embedding_function = embeddings)
+        if removed:
+            vector_store.delete(ids = removed)
+    elif workspace_record['vectordb'] == 'lancedb':
+        reranker = LinearCombinationReranker(weight = 0.3)
+        vector_store = LanceDB(embedding = embeddings, uri = path, reranker = reranker, mode = 'append')
+        if removed:
+            # delete(ids = ...) quotes the joined list as a single value
+            vector_store.delete(filter = "id in ({})".format(", ".join(f"'{chunk_id}'" for chunk_id in removed)))
+
+    for batch, ids in batches(added):
+        vector_store.add_documents(batch, ids = ids)
+        report('embedded', count = len(batch))
+
+def update_lexical(path, added, live):
+    previous = LexicalIndex.load(path)
+    kept = [document for document in previous.documents if document.metadata.get('chunk_id') in live] if previous else []
+
+    LexicalIndex.build(kept + added).save(path)
+
+# Brings the workspace index in line with the active library records. Files
+# whose bytes are unchanged are not even parsed, and within a changed document
+# only chunks with a new id are embedded; chunks of documents that are gone are
+# deleted. A change of embeddings model or vector database rebuilds from scratch.
+# `report(event, **fields)` is called with per-document and embedding progress.
+def update_index(workspace_record, library_records, report = None):
+    workspace_key = (workspace_record['company_id'], workspace_record['bot_id'], workspace_record['workspace_id'])
+    path, source_path = embeddings_path(*workspace_key), documents_path(*workspace_key)
+    report = report or ignore
+
+    with workspace_lock(workspace_key):
+        os.makedirs(path, exist_ok = True)
+
+        signature = index_signature(workspace_record)
+        manifest = read_manifest(path)
+
+        if not manifest or manifest['signature'] != signature:
+            clear_index(workspace_record, path)
+            manifest = {'signature': signature, 'documents': {}}
+
+        previous = manifest['documents']
+        documents, added, pending, digests, failed, parsed = {}, [], {}, {}, [], 0
+
+        # A document that cannot be read keeps whatever it had in the index
+        def document_failed(record, error):
+            entry = previous.get(record['document_id'])
+            if entry:
+                documents[record['document_id']] = entry
+            failed.append(record['document_id'])
+            report('document', document_id = record['document_id'], status = 'failed', error = str(error))
+
+        for record in library_records:
+            document_id = record['document_id']
+            entry = previous.get(document_id)
+
+            try:
+                digest = None if record['url'] else file_hash(os.path.join(source_path, record['file_name']))
+
+                if entry and digest and entry['hash'] == digest:
+                    documents[document_id] = entry
+                    report('document', document_id = document_id, status = 'unchanged', chunks = len(entry['chunks']), added = 0)
+                    continue
+
+                pending[submit_record(record, source_path)] = record
+                digests[document_id] = digest
+                report('document', document_id = document_id, status = 'parsing')
+            except Exception as e:
+                document_failed(record, e)
+
+        for record, data, error in parsed_records(pending):
+            document_id = record['document_id']
+            entry = previous.get(document_id)
+
+            try:
+                if error:
+                    raise error
+                chunks = split_record(record, data)
+            except Exception as e:
+                document_failed(record, e)
+                continue
+
+            parsed += 1
+
+            known = set(entry['chunks']) if entry else set()
+            new_chunks = [chunk for chunk in chunks if chunk.metadata['chunk_id'] not in known]
+            added.extend(new_chunks)
+
+            documents[document_id] = {
+                'hash': digests[document_id] or content_hash(*[document.page_content for document in data]),
+                'source': record['url'] or record['file_name'],
+                'chunks': [chunk.metadata['chunk_id'] for chunk in chunks]
+            }
+            report('document', document_id = document_id, status = 'parsed', chunks = len(chunks), added = len(new_chunks))
+
+        live = {chunk_id for entry in documents.values() for chunk_id in entry['chunks']}
+        removed = [chunk_id for entry in previous.values() for chunk_id in entry['chunks'] if chunk_id not in live]
+
+        report('embedding', total = len(added))
+        update_vectorstore(workspace_record, path, added, removed, report)
+        update_lexical(path, added, live)
+
+        manifest['documents'] = documents
+        write_manifest(path, manifest)
+        write_index_version(path)
+
+    return {
+        'documents': len(documents), 'parsed': parsed, 'failed': len(failed), 'chunks': len(live),
+        'embedded': len(added), 'removed': len(removed)
+    }
+
+def remove_document(workspace_record, document_id):
+    workspace_key = (workspace_record['company_id'], workspace_record['bot_id'], workspace_record['workspace_id'])
+    path = embeddings_path(*workspace_key)
+
+    with workspace_lock(workspace_key):
+        manifest = read_manifest(path)
+        if not manifest or manifest['signature'] != index_signature(workspace_record) or document_id not in manifest['documents']:
+            return 0
+
+        removed = manifest['documents'].pop(document_id)['chunks']
+        live = {chunk_id for entry in manifest['documents'].values() for chunk_id in entry['chunks']}
+
+        update_vectorstore(workspace_record, path, [], removed)
+        update_lexical(path, [], live)
+
+        write_manifest(path, manifest)
+        write_index_version(path)
+
+    return len(removed)
@@ -0,0 +1,217 @@
+import asyncio, copy, threading, time, uuid
+from datetime import datetime
+from decouple import config
+
+from utilities.database import connect
+from utilities.redis import get_redis
+from utilities.indexing import update_index
+from utilities.vectorstores import invalidate_vectorstore
+from utilities.answer_cache import invalidate_answers
+
+INGESTION_LOCK_TTL = config("INGESTION_LOCK_TTL", default = 120, cast = int)
+INGESTION_PROGRESS_INTERVAL = config("INGESTION_PROGRESS_INTERVAL", default = 1, cast = float)
+
+release_script = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+extend_script = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+tasks = set()
+
+def ingestion_lock_key(company_id, bot_id, workspace_id):
+    return f"ingestion:lock:{company_id}:{bot_id}:{workspace_id}"
+
+# The build runs as its own task, so it outlives the request that started it.
+# The Redis lock keeps one build per workspace across app processes; it is
+# refreshed with every progress write and expires if the process dies.
+async def start_ingestion(workspace_record, library_records, user):
+    job_id = uuid.uuid4().hex
+    lock_key = ingestion_lock_key(workspace_record['company_id'], workspace_record['bot_id'], workspace_record['workspace_id'])
+
+    redis = await get_redis()
+    try:
+        if not await redis.set(lock_key, job_id, nx = True, ex = INGESTION_LOCK_TTL):
+            return False, await redis.get(lock_key)
+    finally:
+        await redis.close()
+
+    date_time = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+
+    job = {
+        'job_id': job_id, 'company_id': workspace_record['company_id'], 'bot_id': workspace_record['bot_id'],
+        'workspace_id': workspace_record['workspace_id'], 'status': 'queued', 'phase': 'parsing',
+        'documents': [
+            {'document_id': record['document_id'], 'source': record['url'] or record['file_name'], 'status': 'pending', 'chunks': 0, 'added': 0, 'error': None}
+            for record in library_records
+        ],
+        'embedding': {'total': 0, 'embedded': 0}, 'index': None, 'error': None,
+        'started_at': time.time(), 'embedding_at': None, 'finished_at': None,
+        'created_date': date_time, 'modified_date': date_time, 'created_by': user, 'modified_by': user
+    }
+
+    db = await connect()
+    await db['ingestion'].insert_one(dict(job))
+
+    task = asyncio.create_task(run_ingestion(job, workspace_record, library_records, user))
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+
+    return True, job_id
+
+async def save_progress(job, lock):
+    with lock:
+        snapshot = copy.deepcopy(job)
+
+    db = await connect()
+    await db['ingestion'].update_one({"job_id": job['job_id']}, {"$set": snapshot})
+
+async def finish_build(workspace_record, user):
+    company_id, bot_id, workspace_id = workspace_record['company_id'], workspace_record['bot_id'], workspace_record['workspace_id']
+
+    invalidate_vectorstore(company_id, bot_id, workspace_id)
+    invalidate_answers(company_id, bot_id, workspace_id)
+
+    db = await connect()
+
+    bots_collections = db['bots']
+    embeddings_collections = db['embeddings']
+
+    embeddings_record = await embeddings_collections.find_one({
+        "company_id": company_id, "bot_id": bot_id, "workspace_id": workspace_id, "is_active": 1
+    })
+
+    date_time = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+
+    if embeddings_record:
+        await embeddings_collections.update_one({"_id": embeddings_record["_id"]}, {"$set": {"is_active": 0, "modified_date": date_time, "modified_by": user}})
+
+    document = {
+        'company_id': company_id, 'bot_id': bot_id, 'workspace_id': workspace_id, 'is_active': 1, 'created_date': date_time,
+        'modified_date': date_time, 'created_by': user, 'modified_by': user
+    }
+
+    await embeddings_collections.insert_one(document)
+
+    bots_record = await bots_collections.find_one({"company_id": company_id, "bot_id": bot_id, "is_active": 1})
+    if bots_record:
+        await bots_collections.update_one({"_id": bots_record["_id"]}, {"$set": {"modified_date": date_time, "modified_by": user}})
+
+async def run_ingestion(job, workspace_record, library_records, user):
+    lock = threading.Lock()
+    documents = {document['document_id']: document for document in job['documents']}
+    lock_key = ingestion_lock_key(job['company_id'], job['bot_id'], job['workspace_id'])
+
+    lost = threading.Event()
+
+    # Called from the indexing thread
+    def report(event, **fields):
+        if lost.is_set():
+            raise RuntimeError("the build lost its workspace lock to another build")
+
+        with lock:
+            if event == 'document':
+                documents[fields.pop('document_id')].update(fields)
+            elif event == 'embedding':
+                job['phase'] = 'embedding'
+                job['embedding_at'] = time.time()
+                job['embedding']['total'] = fields['total']
+            elif event == 'embedded':
+                job['embedding']['embedded'] += fields['count']
+
+    redis = await get_redis()
+
+    try:
+        job['status'] = 'running'
+        work = asyncio.ensure_future(asyncio.to_thread(update_index, workspace_record, library_records, report))
+
+        while not work.done():
+            await asyncio.wait({work}, timeout = INGESTION_PROGRESS_INTERVAL)
+            await save_progress(job, lock)
+
+            # Only this job's lock is extended. If it lapsed and another build
+            # took the workspace, this one stops at its next progress report
+            # rather than keep writing the same index.
+            if not lost.is_set() and not await redis.eval(extend_script, 1, lock_key, job['job_id'], INGESTION_LOCK_TTL):
+                lost.set()
+
+        job['index'] = work.result()
+        if lost.is_set():
+            raise RuntimeError("the build lost its workspace lock to another build")
+
+        if not job['index']['documents']:
+            job['status'], job['error'] = 'failed', "no documents could be processed"
+        else:
+            await finish_build(workspace_record, user)
+            job['status'] = 'completed'
+    except Exception as e:
+        job['status'], job['error'] = 'failed', str(e)
+    finally:
+        job['phase'] = 'done'
+        job['finished_at'] = time.time()
+        job['modified_date'] = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+
+        try:
+            await save_progress(job, lock)
+            await redis.eval(release_script, 1, lock_key, job['job_id'])
+        finally:
+            await redis.close()
+
+def ingestion_progress(job):
+    finished = [document for document in job['documents'] if document['status'] in ('unchanged', 'parsed', 'failed')]
+    now = job['finished_at'] or time.time()
+    elapsed = now - job['started_at']
+
+    total, embedded = job['embedding']['total'], job['embedding']['embedded']
+    embedding_seconds = now - job['embedding_at'] if job['embedding_at'] else 0
+    chunks_per_second = embedded / embedding_seconds if embedding_seconds else None
+
+    if job['status'] in ('completed', 'failed'):
+        eta = 0
+    elif job['phase'] == 'embedding':
+        eta = (total - embedded) / chunks_per_second if chunks_per_second else None
+    else:
+        eta = elapsed / len(finished) * (len(job['documents']) - len(finished)) if finished else None
+
+    return {
+        'documents_total': len(job['documents']), 'documents_done': len(finished),
+        'documents_failed': sum(document['status'] == 'failed' for document in job['documents']),
+        'chunks_total': total, 'chunks_embedded': embedded,
+        'chunks_per_second': round(chunks_per_second, 2) if chunks_per_second is not None else None,
+        'elapsed_seconds': round(elapsed, 1), 'eta_seconds': round(eta, 1) if eta is not None else None
+    }
+
+async def ingestion_status(company_id, bot_id, workspace_id, job_id = None):
+    query = {"company_id": company_id, "bot_id": bot_id, "workspace_id": workspace_id}
+    if job_id:
+        query['job_id'] = job_id
+
+    db = await connect()
+    job = await db['ingestion'].find_one(query, sort = [("started_at", -1)])
+    if not job:
+        return None
+
+    # A build whose lock is gone without it finishing died with its process.
+    # The job is read again once the lock is seen gone, as a build saves its
+    # final state just before releasing the lock.
+    if job['status'] in ('queued', 'running'):
+        redis = await get_redis()
+        try:
+            if await redis.get(ingestion_lock_key(company_id, bot_id, workspace_id)) != job['job_id']:
+                job = await db['ingestion'].find_one({"job_id": job['job_id']})
+                if job['status'] in ('queued', 'running'):
+                    job['status'] = 'interrupted'
+        finally:
+            await redis.close()
+
+    job.pop('_id')
+
+    return {**job, 'progress': ingestion_progress(job)}
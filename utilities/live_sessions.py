@@ -0,0 +1,84 @@
+import time
+from datetime import datetime, timedelta
+
+from utilities.redis import get_redis
+
+timestamp_format = '%d/%m/%Y %H:%M:%S'
+
+TRACKED_FIELDS = {
+    '_id': 0, 'session_id': 1, 'workspace_id': 1, 'latest_timestamp': 1, 'timeout': 1,
+    'end_conversation': 1, 'transfer_conversation': 1, 'human_intervention': 1
+}
+
+def live_key(database_name, workspace_id):
+    return f"live_sessions:{database_name}:{workspace_id}"
+
+def session_expiry(latest_timestamp, timeout):
+    expiration_time = datetime.strptime(latest_timestamp, timestamp_format) + timedelta(minutes = int(timeout))
+
+    return expiration_time.timestamp()
+
+def is_live(record):
+    if record['end_conversation']:
+        return False
+
+    return not record['transfer_conversation'] or bool(record['human_intervention'])
+
+async def track_session(database_name, record):
+    key = live_key(database_name, record['workspace_id'])
+    redis = await get_redis()
+
+    try:
+        if is_live(record):
+            await redis.zadd(key, {record['session_id']: session_expiry(record['latest_timestamp'], record['timeout'])})
+        else:
+            await redis.zrem(key, record['session_id'])
+    finally:
+        await redis.close()
+
+async def refresh_session(messages_collections, database_name, session_id):
+    record = await messages_collections.find_one({'session_id': session_id}, TRACKED_FIELDS)
+    if record:
+        await track_session(database_name, record)
+
+async def end_session(database_name, workspace_id, session_id):
+    redis = await get_redis()
+
+    try:
+        await redis.zrem(live_key(database_name, workspace_id), session_id)
+    finally:
+        await redis.close()
+
+# Every change to a session goes through track_session, so the collection is
+# only scanned to build the set the first time, or after Redis has lost it.
+async def seed_sessions(redis, messages_collections, key, workspace_id):
+    cursor = messages_collections.find(
+        {'workspace_id': workspace_id, 'end_conversation': 0}, TRACKED_FIELDS
+    )
+
+    now = time.time()
+    members = {}
+    async for record in cursor:
+        expiry = session_expiry(record['latest_timestamp'], record['timeout'])
+        if is_live(record) and expiry > now:
+            members[record['session_id']] = expiry
+
+    async with redis.pipeline(transaction = True) as pipe:
+        pipe.delete(key)
+        if members:
+            pipe.zadd(key, members)
+        pipe.set(key + ':seeded', 1)
+        await pipe.execute()
+
+async def live_session_count(db, workspace_id):
+    key = live_key(db.name, workspace_id)
+    redis = await get_redis()
+
+    try:
+        if not await redis.exists(key + ':seeded'):
+            await seed_sessions(redis, db['messages'], key, workspace_id)
+
+        await redis.zremrangebyscore(key, '-inf', time.time())
+        return await redis.zcard(key)
+    finally:
+        await redis.close()
@@ -0,0 +1,76 @@
+import hashlib, tiktoken
+from collections import OrderedDict
+from decouple import config
+from langchain_openai import ChatOpenAI
+from langchain_groq import ChatGroq
+from langchain_ollama import ChatOllama
+
+LLM_CACHE_SIZE = config("LLM_CACHE_SIZE", default = 32, cast = int)
+
+enc = tiktoken.get_encoding("cl100k_base")
+
+chat_models = OrderedDict()
+
+def api_key_hash(api_key):
+    return hashlib.sha256(api_key.encode()).hexdigest() if api_key else None
+
+def build_chat_model(provider, model, temperature = None, url = None, api_key = None):
+    options = {} if temperature is None else {'temperature': temperature}
+
+    if provider == 'openai':
+        return ChatOpenAI(model_name = model, api_key = api_key, stream_usage = True, **options)
+    elif provider == 'ollama':
+        if url:
+            return ChatOllama(model = model, base_url = url, **options)
+        return ChatOllama(model = model, **options)
+    elif provider == 'groq':
+        return ChatGroq(model = model, api_key = api_key, **options)
+
+    raise ValueError(f"Unsupported llm: {provider}")
+
+def chat_model(provider, model, temperature = None, url = None, api_key = None):
+    key = (provider, model, temperature, url or None, api_key_hash(api_key))
+
+    if key in chat_models:
+        chat_models.move_to_end(key)
+        return chat_models[key]
+
+    llm = build_chat_model(provider, model, temperature, url, api_key)
+
+    chat_models[key] = llm
+    if len(chat_models) > LLM_CACHE_SIZE:
+        chat_models.popitem(last = False)
+
+    return llm
+
+def workspace_chat_model(workspace_record):
+    return chat_model(
+        workspace_record['llm'], workspace_record['model'], float(workspace_record['llm_temperature']),
+        workspace_record.get('llm_url'), workspace_record.get('llm_api_key')
+    )
+
+def utility_chat_model(workspace_record):
+    if workspace_record['llm'] == 'openai':
+        return chat_model('openai', "gpt-3.5-turbo", 0, api_key = workspace_record['llm_api_key'])
+
+    return chat_model(workspace_record['llm'], workspace_record['model'], url = workspace_record.get('llm_url'), api_key = workspace_record.get('llm_api_key'))
+
+def invalidate_chat_models(workspace_record):
+    provider = workspace_record.get('llm')
+    key_hash = api_key_hash(workspace_record.get('llm_api_key'))
+    model, url = workspace_record.get('model'), workspace_record.get('llm_url') or None
+
+    for key in list(chat_models):
+        if key[0] == provider and ((key_hash and key[4] == key_hash) or (key[1] == model and key[3] == url)):
+            chat_models.pop(key, None)
+
+def response_tokens(workspace_record, response):
+    metadata = response.response_metadata
+
+    if workspace_record['llm'] == 'ollama' and 'prompt_eval_count' in metadata:
+        return metadata['prompt_eval_count'], metadata['eval_count']
+    if 'token_usage' in metadata:
+        return metadata['token_usage']['prompt_tokens'], metadata['token_usage']['completion_tokens']
+
+    usage = response.usage_metadata or {}
+    return usage.get('input_tokens', 0), usage.get('output_tokens', len(enc.encode(response.content)))
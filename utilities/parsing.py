@@ -0,0 +1,124 @@
+import os, time, signal, threading, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from decouple import config
+from langchain_community.document_loaders import PyMuPDFLoader, UnstructuredMarkdownLoader, UnstructuredHTMLLoader, JSONLoader, UnstructuredExcelLoader
+from langchain_community.document_loaders.csv_loader import CSVLoader
+from langchain_unstructured import UnstructuredLoader
+from langchain_core.documents import Document
+
+INDEX_PARSE_WORKERS = config("INDEX_PARSE_WORKERS", default = min(4, os.cpu_count() or 1), cast = int)
+INDEX_FETCH_WORKERS = config("INDEX_FETCH_WORKERS", default = 8, cast = int)
+INDEX_PARSE_TIMEOUT = config("INDEX_PARSE_TIMEOUT", default = 300, cast = int)
+
+pools = {}
+pools_lock = threading.Lock()
+
+def document_loader(file_path, file_name):
+    if file_name.endswith('.pdf'):
+        return PyMuPDFLoader(file_path, extract_images = 'enable')
+    elif file_name.endswith('.html'):
+        return UnstructuredHTMLLoader(file_path)
+    elif file_name.endswith('.json'):
+        return JSONLoader(file_path = file_path, jq_schema='.', text_content=False)
+    elif file_name.endswith('.md'):
+        return UnstructuredMarkdownLoader(file_path)
+    elif file_name.endswith('.csv'):
+        return CSVLoader(file_path = file_path)
+    elif file_name.endswith('.xlsx') or file_name.endswith('.xls'):
+        return UnstructuredExcelLoader(file_path)
+
+def parse_timeout(signum, frame):
+    raise TimeoutError(f"parsing took longer than {INDEX_PARSE_TIMEOUT} seconds")
+
+# Runs in a parser process, on its main thread, so an alarm can interrupt it
+def parse_file(file_path, file_name):
+    loader = document_loader(file_path, file_name)
+    if loader is None:
+        raise ValueError(f"unsupported document type: {file_name}")
+
+    alarm = hasattr(signal, 'SIGALRM') and INDEX_PARSE_TIMEOUT > 0
+    if alarm:
+        signal.signal(signal.SIGALRM, parse_timeout)
+        signal.alarm(INDEX_PARSE_TIMEOUT)
+
+    deadline = time.monotonic() + INDEX_PARSE_TIMEOUT
+
+    try:
+        return loader.load()
+    except Exception as e:
+        # Some loaders wrap the alarm in their own error
+        if alarm and time.monotonic() >= deadline:
+            raise TimeoutError(f"parsing took longer than {INDEX_PARSE_TIMEOUT} seconds") from e
+        raise
+    finally:
+        if alarm:
+            signal.alarm(0)
+
+def fetch_url(url):
+    data = UnstructuredLoader(web_url = url).load()
+    content = '\n'.join(i.page_content for i in data)
+
+    return [Document(page_content = content, metadata = {"source": url})]
+
+# Parsers are spawned rather than forked, the app process has threads (and
+# their locks) that a fork would copy mid-flight.
+def parser_pool():
+    with pools_lock:
+        if 'parse' not in pools:
+            pools['parse'] = ProcessPoolExecutor(max_workers = INDEX_PARSE_WORKERS, mp_context = multiprocessing.get_context('spawn'))
+        return pools['parse']
+
+def fetcher_pool():
+    with pools_lock:
+        if 'fetch' not in pools:
+            pools['fetch'] = ThreadPoolExecutor(max_workers = INDEX_FETCH_WORKERS, thread_name_prefix = 'fetch')
+        return pools['fetch']
+
+def reset_parser_pool():
+    with pools_lock:
+        pool = pools.pop('parse', None)
+
+    if pool:
+        pool.shutdown(wait = False, cancel_futures = True)
+
+def shutdown_parsers():
+    with pools_lock:
+        for pool in pools.values():
+            pool.shutdown(wait = False, cancel_futures = True)
+        pools.clear()
+
+def submit_record(record, path):
+    if record['url']:
+        return fetcher_pool().submit(fetch_url, record['url'])
+
+    return parser_pool().submit(parse_file, os.path.join(path, record['file_name']), record['file_name'])
+
+# Yields (record, data, error) as each parse finishes. The timeout counts from
+# when a worker picks the record up; a parser process also enforces it itself,
+# a URL fetch thread cannot be stopped and is only abandoned.
+def parsed_records(pending):
+    started = {}
+
+    while pending:
+        done, _ = wait(pending, timeout = 1, return_when = FIRST_COMPLETED)
+
+        for future in done:
+            record = pending.pop(future)
+            try:
+                yield record, future.result(), None
+            except BrokenProcessPool as e:
+                reset_parser_pool()
+                yield record, None, e
+            except Exception as e:
+                yield record, None, e
+
+        now = time.monotonic()
+        for future, record in list(pending.items()):
+            if future.running():
+                started.setdefault(future, now)
+
+            if future in started and now - started[future] > INDEX_PARSE_TIMEOUT + 5:
+                future.cancel()
+                pending.pop(future)
+                yield record, None, TimeoutError(f"parsing took longer than {INDEX_PARSE_TIMEOUT} seconds")
@@ -0,0 +1,18 @@
+import time, asyncio
+
+class StageTimings:
+    def __init__(self):
+        self.stages = {}
+
+    async def measure(self, name, awaitable):
+        start = time.perf_counter()
+
+        try:
+            return await awaitable
+        finally:
+            self.stages[name] = round((time.perf_counter() - start) * 1000, 2)
+
+    async def gather(self, stages):
+        results = await asyncio.gather(*(self.measure(name, stage) for name, stage in stages.items()))
+
+        return dict(zip(stages, results))
@@ -1,4 +1,5 @@
-import string
+import string, time, asyncio
+from collections import OrderedDict
 from datetime import datetime
 from decouple import config
 from validators import url as is_valid_url
@@ -13,37 +14,81 @@ password = config("DATABASE_PASSWORD")
 database = config("DATABASE_NAME")
 slug_db = config("SLUG_DATABASE")
 
-async def validate_inputs(company_id, bot_id, workspace_id):
+TENANT_CACHE_TTL = config("TENANT_CACHE_TTL", default = 30, cast = int)
+TENANT_CACHE_SIZE = config("TENANT_CACHE_SIZE", default = 1024, cast = int)
+
+tenants = OrderedDict()
+tokens = OrderedDict()
+
+def cache_get(cache, key):
+    entry = cache.get(key)
+    if not entry:
+        return None
+
+    if time.monotonic() - entry[0] >= TENANT_CACHE_TTL:
+        cache.pop(key, None)
+        return None
+
+    cache.move_to_end(key)
+    return entry[1]
+
+def cache_set(cache, key, value):
+    cache[key] = (time.monotonic(), value)
+    cache.move_to_end(key)
+
+    while len(cache) > TENANT_CACHE_SIZE:
+        cache.popitem(last = False)
+
+def invalidate_tenant(company_id = None, bot_id = None, workspace_id = None):
+    for key in list(tenants):
+        if (company_id is None or key[0] == company_id) and (bot_id is None or key[1] == bot_id) and (workspace_id is None or key[2] == workspace_id):
+            tenants.pop(key, None)
+
+    for token, (_, tokens_record) in list(tokens.items()):
+        if (company_id is None or tokens_record['company_id'] == company_id) and (bot_id is None or tokens_record['bot_id'] == bot_id) \
+                and (workspace_id is None or tokens_record['workspace_id'] == workspace_id):
+            tokens.pop(token, None)
+
+async def resolve_tenant(company_id, bot_id, workspace_id):
     db = await connect()
 
-    bots_collections = db['bots']
-    workspace_collections = db['workspace']
-    configurations_collections = db['configuration']
+    bots_record, workspace_record, configuration_record = await asyncio.gather(
+        db['bots'].find_one({"company_id": company_id, "bot_id": bot_id, "is_active": 1}),
+        db['workspace'].find_one({"company_id": company_id, "bot_id": bot_id, "workspace_id": workspace_id, "is_active": 1}),
+        db['configuration'].find_one({'bot_id': bot_id, 'workspace_id': workspace_id})
+    )
 
-    bots_record = await bots_collections.find_one({"company_id": company_id, "bot_id": bot_id, "is_active": 1})
-    if not bots_record:
-        return False
-    
-    workspace_record = await workspace_collections.find_one({
-        "company_id": company_id, "bot_id": bot_id, "workspace_id": workspace_id, "is_active": 1
-    })
-    if not workspace_record:
-        return False
-    
-    configuration_record = await configurations_collections.find_one({'bot_id': bot_id, 'workspace_id': workspace_id})
-    if not configuration_record:
+    if not bots_record or not workspace_record or not configuration_record:
         return False
 
     return bots_record, workspace_record, configuration_record
 
-async def validate_token(token):
-    db = await connect()
+async def validate_inputs(company_id, bot_id, workspace_id):
+    key = (company_id, bot_id, workspace_id)
 
-    tokens_collections = db['tokens']
+    result = cache_get(tenants, key)
+    if result:
+        return result
+
+    result = await resolve_tenant(company_id, bot_id, workspace_id)
+    if result:
+        cache_set(tenants, key, result)
+
+    return result
+
+async def validate_token(token):
+    tokens_record = cache_get(tokens, token)
 
-    tokens_record = await tokens_collections.find_one({"token": token, "is_active": 1})
     if not tokens_record:
-        return False
+        db = await connect()
+
+        tokens_collections = db['tokens']
+
+        tokens_record = await tokens_collections.find_one({"token": token, "is_active": 1})
+        if not tokens_record:
+            return False
+
+        cache_set(tokens, token, tokens_record)
     
     now = datetime.now()
     date_time = now.strftime("%d/%m/%Y %H:%M:%S")
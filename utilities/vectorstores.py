@@ -0,0 +1,176 @@
+import os, time, uuid, threading
+from collections import OrderedDict
+from decouple import config
+from langchain_openai import OpenAIEmbeddings
+from langchain_community.embeddings import OllamaEmbeddings
+from langchain_community.vectorstores import FAISS, LanceDB
+from langchain_chroma import Chroma
+from lancedb.rerankers import LinearCombinationReranker
+
+from utilities.huggingface import huggingface_embeddings, is_resident, on_eviction
+from utilities.hybrid import LexicalIndex
+
+VECTORSTORE_CACHE_MAX_MB = config("VECTORSTORE_CACHE_MAX_MB", default = 1024, cast = int)
+VECTORSTORE_CACHE_TTL = config("VECTORSTORE_CACHE_TTL", default = 3600, cast = int)
+
+VERSION_FILE = "version"
+
+vectorstores = OrderedDict()
+generations = {}
+statistics = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0, 'loads': 0, 'load_seconds': 0.0}
+
+lock = threading.Lock()
+
+def embeddings_path(company_id, bot_id, workspace_id):
+    return f"library/{company_id}/{bot_id}/{workspace_id}/embeddings"
+
+def load_embeddings(workspace_record):
+    if workspace_record['embeddings'] == 'openai':
+        embeddings = OpenAIEmbeddings(model = workspace_record['embeddings_model'], openai_api_key = workspace_record['embeddings_api_key'])
+    elif workspace_record['embeddings'] == 'huggingface':
+        embeddings = huggingface_embeddings(workspace_record['embeddings_model'])
+    elif workspace_record['embeddings'] == 'ollama':
+        if workspace_record['embeddings_url']:
+            embeddings = OllamaEmbeddings(model = workspace_record['embeddings_model'], base_url = workspace_record['embeddings_url'])
+        else:
+            embeddings = OllamaEmbeddings(model = workspace_record['embeddings_model'])
+
+    return embeddings
+
+def open_vectorstore(workspace_record, embeddings, path):
+    if workspace_record['vectordb'] == 'faiss':
+        vectorstore = FAISS.load_local(path, embeddings, allow_dangerous_deserialization = True)
+    elif workspace_record['vectordb'] == 'chroma':
+        vectorstore = Chroma(persist_directory = path, embedding_function = embeddings)
+    elif workspace_record['vectordb'] == 'lancedb':
+        reranker = LinearCombinationReranker(weight = 0.3)
+        vectorstore = LanceDB(embedding = embeddings, uri = path, reranker = reranker)
+
+    return vectorstore
+
+def directory_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, file_name))
+            except OSError:
+                pass
+
+    return size
+
+# Rewritten by the indexer after every change to the index, so every app
+# process sees a new version even when the index files were overwritten in
+# place and the directory itself looks unchanged.
+def write_index_version(path):
+    temporary_path = os.path.join(path, VERSION_FILE + '.tmp')
+    with open(temporary_path, 'w') as file:
+        file.write(uuid.uuid4().hex)
+
+    os.replace(temporary_path, os.path.join(path, VERSION_FILE))
+
+def index_version(workspace_key, path):
+    try:
+        with open(os.path.join(path, VERSION_FILE)) as file:
+            written = file.read()
+    except OSError:
+        written = None
+
+    return generations.get(workspace_key, 0), written
+
+def resident_size():
+    return sum(entry['size'] for entry in vectorstores.values())
+
+def evict(max_bytes):
+    while vectorstores and resident_size() > max_bytes:
+        vectorstores.popitem(last = False)
+        statistics['evictions'] += 1
+
+def cached_retrieval(workspace_record):
+    workspace_key = (workspace_record['company_id'], workspace_record['bot_id'], workspace_record['workspace_id'])
+    path = embeddings_path(*workspace_key)
+
+    key = workspace_key + (
+        workspace_record['embeddings'], workspace_record['embeddings_model'], workspace_record.get('embeddings_url'),
+        workspace_record['vectordb']
+    )
+
+    with lock:
+        version = index_version(workspace_key, path)
+        entry = vectorstores.get(key)
+
+        if entry and entry['version'] == version:
+            if time.monotonic() - entry['loaded_at'] < VECTORSTORE_CACHE_TTL:
+                vectorstores.move_to_end(key)
+                statistics['hits'] += 1
+                return entry['embeddings'], entry['vectorstore'], entry['lexical']
+
+            statistics['expirations'] += 1
+
+        vectorstores.pop(key, None)
+        statistics['misses'] += 1
+
+    start = time.perf_counter()
+    embeddings = load_embeddings(workspace_record)
+    vectorstore = open_vectorstore(workspace_record, embeddings, path)
+    lexical = LexicalIndex.load(path)
+    load_seconds = time.perf_counter() - start
+
+    with lock:
+        statistics['loads'] += 1
+        statistics['load_seconds'] += load_seconds
+
+        # The model may have been evicted while the index was loading
+        resident = workspace_record['embeddings'] != 'huggingface' or is_resident(workspace_record['embeddings_model'])
+
+        if resident and index_version(workspace_key, path) == version:
+            vectorstores[key] = {
+                'embeddings': embeddings, 'vectorstore': vectorstore, 'lexical': lexical, 'version': version, 'loaded_at': time.monotonic(),
+                'size': directory_size(path), 'load_seconds': round(load_seconds, 4)
+            }
+            evict(VECTORSTORE_CACHE_MAX_MB * 1024 * 1024)
+
+    return embeddings, vectorstore, lexical
+
+def cached_vectorstore(workspace_record):
+    embeddings, vectorstore, _ = cached_retrieval(workspace_record)
+
+    return embeddings, vectorstore
+
+def invalidate_vectorstore(company_id, bot_id, workspace_id):
+    workspace_key = (company_id, bot_id, workspace_id)
+
+    with lock:
+        generations[workspace_key] = generations.get(workspace_key, 0) + 1
+
+        for key in [key for key in vectorstores if key[:3] == workspace_key]:
+            vectorstores.pop(key)
+            statistics['invalidations'] += 1
+
+def release_embeddings(model_name):
+    with lock:
+        for key in [key for key in vectorstores if key[3] == 'huggingface' and key[4] == model_name]:
+            vectorstores.pop(key)
+            statistics['evictions'] += 1
+
+on_eviction(release_embeddings)
+
+def vectorstore_statistics():
+    with lock:
+        lookups = statistics['hits'] + statistics['misses']
+
+        return {
+            **statistics,
+            'load_seconds': round(statistics['load_seconds'], 4),
+            'hit_rate': round(statistics['hits'] / lookups, 4) if lookups else 0.0,
+            'average_load_seconds': round(statistics['load_seconds'] / statistics['loads'], 4) if statistics['loads'] else 0.0,
+            'resident_bytes': resident_size(),
+            'max_bytes': VECTORSTORE_CACHE_MAX_MB * 1024 * 1024,
+            'entries': [
+                {
+                    'company_id': key[0], 'bot_id': key[1], 'workspace_id': key[2], 'vectordb': key[6],
+                    'size': entry['size'], 'load_seconds': entry['load_seconds']
+                }
+                for key, entry in vectorstores.items()
+            ]
+        }